@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http:##www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+
+import sys
+import argparse
+
+from util.results import readResults, TOTAL
+
+## Latency percentiles that are compared (a subset of results.PERCENTILES)
+LATENCIES = [ "p50", "p95", "p99" ]
+
+## ==============================================
+## compare
+## ==============================================
+def compare(base, new, threshold, min_count = 0):
+    """Compare two exported results. Returns a list of (txn, metric, base value,
+       new value, relative change, regressed?) tuples, one for the throughput and
+       each latency percentile of every transaction type that both runs executed."""
+    rows = [ ]
+    for txn in sorted(set(base["txns"].keys()) & set(new["txns"].keys())):
+        b = base["txns"][txn]
+        n = new["txns"][txn]
+        if min(b["committed"], n["committed"]) < min_count: continue
+        
+        ## Less throughput is worse, but for latencies more is worse
+        change = relativeChange(b["rate"], n["rate"])
+        rows.append((txn, "rate", b["rate"], n["rate"], change, change < -threshold))
+        for p in LATENCIES:
+            change = relativeChange(b["percentiles"][p], n["percentiles"][p])
+            rows.append((txn, p, b["percentiles"][p], n["percentiles"][p], change, change > threshold))
+        ## FOR
+    ## FOR
+    return (rows)
+## DEF
+
+## ==============================================
+## relativeChange
+## ==============================================
+def relativeChange(base, new):
+    if base == 0: return 0.0 if new == 0 else float("inf")
+    return (new - base) / float(base)
+## DEF
+
+## ==============================================
+## showComparison
+## ==============================================
+def showComparison(base, new, rows, col_width = 16):
+    num_cols = 6
+    total_width = (col_width*num_cols)+2
+    f = "\n  " + (("%-" + str(col_width) + "s")*num_cols)
+    line = "-"*total_width
+    
+    ret = ""
+    for key in [ "driver", "mode", "config_hash", "warehouses", "clients", "mix", "seed" ]:
+        ## Values read back from a CSV file are all strings, and None is empty
+        b = str(base["metadata"].get(key) or "")
+        n = str(new["metadata"].get(key) or "")
+        if b != n: ret += "WARNING: The runs have different %s (%s vs. %s)\n" % (key, b, n)
+    ## FOR
+    
+    ret += "Comparison (rates in txn/s, latencies in µs)\n%s" % line
+    ret += f % ("", "Metric", "Base", "New", "Change", "")
+    last = None
+    for txn, metric, b, n, change, regressed in rows:
+        if last != None and txn != last and txn == TOTAL: ret += "\n" + line
+        ret += f % (txn if txn != last else "", metric, "%.02f" % b, "%.02f" % n, "%+.01f%%" % (change * 100),
+                    "REGRESSION" if regressed else "")
+        last = txn
+    ## FOR
+    return (ret)
+## DEF
+
+## ==============================================
+## main
+## ==============================================
+if __name__ == '__main__':
+    aparser = argparse.ArgumentParser(description='Compare the results of two py-tpcc runs written with --results-json or --results-csv')
+    aparser.add_argument('base',
+                         help='Results of the baseline run')
+    aparser.add_argument('new',
+                         help='Results of the run to check for regressions')
+    aparser.add_argument('--threshold', default=5.0, type=float, metavar='PCT',
+                         help='Flag throughputs that dropped or latencies that grew by more than PCT percent')
+    aparser.add_argument('--min-count', default=100, type=int, metavar='N',
+                         help='Skip transaction types that committed fewer than N times in either run')
+    args = vars(aparser.parse_args())
+    
+    base = readResults(args['base'])
+    new = readResults(args['new'])
+    rows = compare(base, new, args['threshold'] / 100.0, args['min_count'])
+    print(showComparison(base, new, rows))
+    
+    ## A non-zero exit status lets nightly jobs fail on a regression
+    regressions = [ row for row in rows if row[5] ]
+    if regressions:
+        print("\n%d regression(s) beyond %.01f%%" % (len(regressions), args['threshold']))
+        sys.exit(1)
+## MAIN
@@ -163,3 +163,23 @@ TransactionTypes = enum(
     "PAYMENT",
     "STOCK_LEVEL",
 )
+
+#  Terminal emulation (TPC-C 5.2.5.7 and 5.2.5.4). The keying time is fixed and
+#  the think time is drawn from a negative exponential distribution with the
+#  given mean, truncated at MAX_THINK_TIME_FACTOR times the mean. In seconds.
+TERMINALS_PER_WAREHOUSE = 10
+KEYING_TIMES = {
+    TransactionTypes.DELIVERY: 2,
+    TransactionTypes.NEW_ORDER: 18,
+    TransactionTypes.ORDER_STATUS: 2,
+    TransactionTypes.PAYMENT: 3,
+    TransactionTypes.STOCK_LEVEL: 2,
+}
+THINK_TIMES = {
+    TransactionTypes.DELIVERY: 5,
+    TransactionTypes.NEW_ORDER: 12,
+    TransactionTypes.ORDER_STATUS: 10,
+    TransactionTypes.PAYMENT: 12,
+    TransactionTypes.STOCK_LEVEL: 5,
+}
+MAX_THINK_TIME_FACTOR = 10
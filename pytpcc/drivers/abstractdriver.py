@@ -28,6 +28,19 @@ from datetime import datetime
 
 import constants
 
+## ==============================================
+## ConflictError
+## ==============================================
+class ConflictError(Exception):
+    """Raised by a driver when a transaction lost against a concurrent one (e.g., a
+    serialization failure, a deadlock or a failed optimistic commit) and was rolled
+    back. The Executor runs such transactions again instead of just aborting them."""
+    
+    def __init__(self, message, reason = "conflict"):
+        super(ConflictError, self).__init__(message)
+        self.reason = reason
+## CLASS
+
 ## ==============================================
 ## AbstractDriver
 ## ==============================================
@@ -87,6 +100,16 @@ class AbstractDriver(object):
         """Load a list of tuples into the target table"""
         raise NotImplementedError("%s does not implement loadTuples" % (self.driver_name))
         
+    def supportsColumns(self):
+        """Return True if the driver would rather get the initial data a column
+        at a time through loadColumns instead of as rows through loadTuples"""
+        return False
+        
+    def loadColumns(self, tableName, columns, count):
+        """Load count tuples into the target table, given as a list with one
+        sequence of count values per column"""
+        self.loadTuples(tableName, [ list(row) for row in zip(*columns) ])
+        
     def executeStart(self):
         """Optional callback before the execution phase starts"""
         return None
@@ -112,6 +135,46 @@ class AbstractDriver(object):
             assert False, "Unexpected TransactionType: " + txn
         return result
         
+    def isAsync(self):
+        """Return True if this driver implements the asyncio versions of the transactions
+        (doDeliveryAsync, doNewOrderAsync, ...). The AsyncExecutor runs every other
+        driver in a pool of threads instead."""
+        return False
+        
+    def getRetryStats(self):
+        """Return (retries, seconds spent waiting for locks) of the last transaction
+        that the calling thread ran. The Executor records these in the Results."""
+        return (0, 0.0)
+        
+    def getMode(self):
+        """Return the name of the way this driver runs the transactions, for drivers
+        that have more than one (e.g., prepared statements). It is exported with the
+        results, so that runs in different modes can be compared."""
+        return None
+        
+    def isThreadSafe(self):
+        """Return True if several threads can run transactions on this driver at the
+        same time (e.g., because it has a pool of connections). The AsyncExecutor then
+        shares this one driver between its threads instead of creating one per thread."""
+        return False
+        
+    async def executeTransactionAsync(self, txn, params):
+        """Execute a transaction based on the given name without blocking the event loop"""
+        
+        if constants.TransactionTypes.DELIVERY == txn:
+            result = await self.doDeliveryAsync(params)
+        elif constants.TransactionTypes.NEW_ORDER == txn:
+            result = await self.doNewOrderAsync(params)
+        elif constants.TransactionTypes.ORDER_STATUS == txn:
+            result = await self.doOrderStatusAsync(params)
+        elif constants.TransactionTypes.PAYMENT == txn:
+            result = await self.doPaymentAsync(params)
+        elif constants.TransactionTypes.STOCK_LEVEL == txn:
+            result = await self.doStockLevelAsync(params)
+        else:
+            assert False, "Unexpected TransactionType: " + txn
+        return result
+        
     def doDelivery(self, params):
         """Execute DELIVERY Transaction
         Parameters Dict:
@@ -166,4 +229,24 @@ class AbstractDriver(object):
             threshold
         """
         raise NotImplementedError("%s does not implement doStockLevel" % (self.driver_name))
+
+    async def doDeliveryAsync(self, params):
+        """Execute DELIVERY Transaction on the event loop (see doDelivery)"""
+        raise NotImplementedError("%s does not implement doDeliveryAsync" % (self.driver_name))
+    
+    async def doNewOrderAsync(self, params):
+        """Execute NEW_ORDER Transaction on the event loop (see doNewOrder)"""
+        raise NotImplementedError("%s does not implement doNewOrderAsync" % (self.driver_name))
+
+    async def doOrderStatusAsync(self, params):
+        """Execute ORDER_STATUS Transaction on the event loop (see doOrderStatus)"""
+        raise NotImplementedError("%s does not implement doOrderStatusAsync" % (self.driver_name))
+
+    async def doPaymentAsync(self, params):
+        """Execute PAYMENT Transaction on the event loop (see doPayment)"""
+        raise NotImplementedError("%s does not implement doPaymentAsync" % (self.driver_name))
+
+    async def doStockLevelAsync(self, params):
+        """Execute STOCK_LEVEL Transaction on the event loop (see doStockLevel)"""
+        raise NotImplementedError("%s does not implement doStockLevelAsync" % (self.driver_name))
 ## CLASS
\ No newline at end of file
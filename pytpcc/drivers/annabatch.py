@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+## Storage layouts: every column of a row under its own key (e.g., CUSTOMER.1.2.3.C_FIRST),
+## or the row as one record under the row's base key (e.g., CUSTOMER.1.2.3.).
+LAYOUT_COLUMN = 'column'
+LAYOUT_ROW = 'row'
+LAYOUTS = [LAYOUT_COLUMN, LAYOUT_ROW]
+
+## The columns that transactions update, and the key (after the row's base key) that
+## the row layout keeps each of them under instead of in the row. Anna resolves
+## concurrent writes last-writer-wins, so writing back a whole row could undo another
+## transaction's update of a different column. Columns that are always updated
+## together, by the same transaction, share a key.
+UPDATED_COLUMNS = {
+    'W_YTD': 'W_YTD',
+    'D_YTD': 'D_YTD',
+    'D_NEXT_O_ID': 'D_NEXT_O_ID',
+    'C_BALANCE': 'C_BALANCE',
+    'C_DELIVERY_CNT': 'C_DELIVERY_CNT',
+    'C_YTD_PAYMENT': 'C_PAYMENT',
+    'C_PAYMENT_CNT': 'C_PAYMENT',
+    'C_DATA': 'C_PAYMENT',
+    'S_QUANTITY': 'S_COUNTERS',
+    'S_YTD': 'S_COUNTERS',
+    'S_ORDER_CNT': 'S_COUNTERS',
+    'S_REMOTE_CNT': 'S_COUNTERS',
+    'O_CARRIER_ID': 'O_CARRIER_ID',
+    'W_CARRIER_ID': 'W_CARRIER_ID',
+    'OL_DELIVERY_D': 'OL_DELIVERY_D',
+}
+
+## The key that the scripts that register the DAG functions publish their layout under
+LAYOUT_KEY = 'TPCC.LAYOUT'
+
+## ==============================================
+## BatchWriter
+## ==============================================
+class BatchWriter:
+    """
+        Writes many keys into Anna at once. The keys are split into chunks of
+        'batch_size' that go out as one multi-key put each, and up to 'threads'
+        chunks are in flight at the same time. Anna clients cannot be shared
+        between threads, so every thread of the pool connects its own.
+    """
+    
+    def __init__(self, connect, threads, batch_size, client = None):
+        """
+            connect: Function that opens a new Anna client for the thread with the given number
+            threads: Number of threads that put chunks in parallel (0 puts them from the calling thread)
+            batch_size: Number of keys per put
+            client: Anna client of the calling thread, needed if 'threads' is 0
+        """
+        assert batch_size > 0
+        assert threads > 0 or client != None
+        self.connect = connect
+        self.batch_size = batch_size
+        self.client = client
+        self.pool = ThreadPoolExecutor(max_workers=threads) if threads > 0 else None
+        self.local = threading.local()
+        self.next_client = 0
+        self.lock = threading.Lock()
+    ## DEF
+    
+    def write(self, lattices):
+        """Put every key of the given dict with its serialized lattice and wait until they are all stored"""
+        keys = list(lattices.keys())
+        chunks = [ keys[i:i+self.batch_size] for i in range(0, len(keys), self.batch_size) ]
+        if self.pool == None:
+            for chunk in chunks: self.put(self.client, chunk, lattices)
+            return
+        futures = [ self.pool.submit(self.putChunk, chunk, lattices) for chunk in chunks ]
+        for f in futures: f.result()
+    ## DEF
+    
+    def putChunk(self, keys, lattices):
+        if not hasattr(self.local, "client"):
+            with self.lock:
+                idx = self.next_client
+                self.next_client += 1
+            self.local.client = self.connect(idx)
+            logging.debug("Opened Anna client #%d for batched puts" % idx)
+        self.put(self.local.client, keys, lattices)
+    ## DEF
+    
+    def put(self, client, keys, lattices):
+        result = client.put(keys, [ lattices[key] for key in keys ])
+        failed = [ key for key in keys if not result.get(key, False) ]
+        if failed:
+            raise Exception("Failed to put %d out of %d keys into Anna (e.g., '%s')" % (len(failed), len(keys), failed[0]))
+    ## DEF
+    
+    def close(self):
+        if self.pool != None: self.pool.shutdown()
+    ## DEF
+## CLASS
+
+## ==============================================
+## waitForKeys
+## ==============================================
+def waitForKeys(get, expected, timeout, interval = 1.0):
+    """
+        Poll until every key of the 'expected' dict reads back with its value,
+        which is how the loaders tell that the store has converged. 'get' maps
+        a list of keys to a dict with the values it could read. Raises an
+        exception if some keys still do not match after 'timeout' seconds.
+    """
+    start = time.time()
+    pending = dict(expected)
+    while pending:
+        values = get(list(pending.keys()))
+        pending = dict([ (key, value) for key, value in pending.items() if not matches(values.get(key), value) ])
+        if not pending: break
+        if time.time() - start >= timeout:
+            raise Exception("%d out of %d sampled keys did not read back after %g seconds (e.g., '%s')" % \
+                            (len(pending), len(expected), timeout, next(iter(pending))))
+        logging.debug("Waiting for %d out of %d sampled keys to read back" % (len(pending), len(expected)))
+        time.sleep(interval)
+    ## WHILE
+    return time.time() - start
+## DEF
+
+def matches(value, expected):
+    ## Causal lattices reveal all of the concurrent versions of a key
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+## DEF
+
+## ==============================================
+## splitRow
+## ==============================================
+def splitRow(row):
+    """
+        Split a row (a dict of its columns) the way the row layout stores it:
+        the columns that stay in the row, and a dict with the columns that go
+        under each of the UPDATED_COLUMNS keys.
+    """
+    rest = { }
+    updated = { }
+    for column, value in row.items():
+        if column in UPDATED_COLUMNS:
+            updated.setdefault(UPDATED_COLUMNS[column], { })[column] = value
+        else:
+            rest[column] = value
+    ## FOR
+    return rest, updated
+## DEF
+
+## ==============================================
+## rowKeys
+## ==============================================
+def rowKeys(base_key, columns):
+    """
+        The keys that the given columns of the row under base_key are read from
+        with the row layout: the row itself (unless only updated columns are
+        needed), followed by the UPDATED_COLUMNS keys of the columns, in order.
+    """
+    keys = [ base_key ] if any([ not column in UPDATED_COLUMNS for column in columns ]) else [ ]
+    for column in columns:
+        if column in UPDATED_COLUMNS and not base_key + UPDATED_COLUMNS[column] in keys:
+            keys.append(base_key + UPDATED_COLUMNS[column])
+    ## FOR
+    return keys
+## DEF
+
+## ==============================================
+## checkLayout
+## ==============================================
+def checkLayout(get, layout):
+    """
+        Make sure that the DAG functions were registered with the same layout
+        and UPDATED_COLUMNS as the driver's. Otherwise they would silently pick
+        the wrong values out of what their references resolve to. 'get' maps a
+        list of keys to a dict with the values it could read.
+    """
+    registered = reveal(get([ LAYOUT_KEY ]).get(LAYOUT_KEY))
+    if registered == None:
+        raise Exception("No layout under '%s': register the DAG functions first" % LAYOUT_KEY)
+    if registered.get('layout') != layout:
+        raise Exception("The DAG functions were registered with the '%s' layout, but the driver uses '%s'" % \
+                        (registered.get('layout'), layout))
+    if registered.get('updated_columns') != UPDATED_COLUMNS:
+        raise Exception("The DAG functions were registered with different UPDATED_COLUMNS than the driver's")
+## DEF
+
+def reveal(value):
+    ## Causal lattices reveal all of the concurrent versions of a key. Only a key with
+    ## a single version has a value that every reader agrees on (None otherwise).
+    if isinstance(value, list):
+        return value[0] if len(value) == 1 else None
+    return value
+## DEF
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+
+import logging
+import threading
+from contextlib import contextmanager
+
+## ==============================================
+## PooledConnection
+## ==============================================
+class PooledConnection:
+    """One slot of a ConnectionPool. The connection is None while it has to be reopened."""
+    
+    def __init__(self, idx):
+        self.idx = idx
+        self.conn = None
+        self.cursor = None
+        self.busy = False
+## CLASS
+
+## ==============================================
+## ConnectionPool
+## ==============================================
+class ConnectionPool:
+    """
+        A fixed number of DB-API connections that can be shared by several threads.
+        
+        Transactions for the same warehouse go to the same connection whenever it is
+        free, so that they find its caches and prepared statements warm. A transaction
+        that fails gets rolled back, and a connection that cannot even do that is
+        thrown away and reopened by the next transaction that needs it.
+    """
+    
+    def __init__(self, connect, size, setup = None, first = None):
+        """
+            connect: Function that opens a new connection
+            size: Number of connections
+            setup: Optional function that gets every new connection before it is used
+            first: Optional connection that is already open and becomes the first slot
+        """
+        assert size > 0
+        self.connect = connect
+        self.setup = setup
+        self.slots = [ PooledConnection(i) for i in range(size) ]
+        self.cond = threading.Condition()
+        if first != None:
+            self.open(self.slots[0], first)
+    ## DEF
+    
+    def __len__(self):
+        return len(self.slots)
+    
+    @contextmanager
+    def connection(self, w_id = None):
+        """Hand out a connection for a transaction on the given warehouse"""
+        slot = self.acquire(w_id)
+        try:
+            if slot.conn == None: self.open(slot, self.connect())
+            yield slot
+        except:
+            self.rollback(slot)
+            raise
+        finally:
+            self.release(slot)
+    ## DEF
+    
+    def acquire(self, w_id):
+        """Take the warehouse's own slot if it is free, otherwise any free slot,
+        otherwise wait for the warehouse's slot"""
+        home = self.slots[w_id % len(self.slots)] if w_id != None else None
+        with self.cond:
+            while True:
+                if home != None and not home.busy:
+                    slot = home
+                    break
+                free = [ s for s in self.slots if not s.busy ]
+                if free:
+                    slot = free[0]
+                    break
+                self.cond.wait()
+            ## WHILE
+            slot.busy = True
+        return slot
+    ## DEF
+    
+    def release(self, slot):
+        with self.cond:
+            slot.busy = False
+            self.cond.notify_all()
+    ## DEF
+    
+    def open(self, slot, conn):
+        if self.setup != None:
+            try:
+                self.setup(conn)
+            except:
+                conn.close()
+                raise
+        slot.conn = conn
+        slot.cursor = conn.cursor()
+    ## DEF
+    
+    def rollback(self, slot):
+        """Roll back whatever the failed transaction left behind. If the connection
+        is gone, drop it so that it gets reopened."""
+        if slot.conn == None: return
+        try:
+            slot.conn.rollback()
+        except Exception as ex:
+            logging.warn("Reopening connection #%d after: %s" % (slot.idx, ex))
+            self.discard(slot)
+    ## DEF
+    
+    def discard(self, slot):
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        slot.conn = None
+        slot.cursor = None
+    ## DEF
+    
+    def close(self):
+        with self.cond:
+            for slot in self.slots:
+                if slot.conn != None: self.discard(slot)
+    ## DEF
+## CLASS
+
+## ==============================================
+## threadLocalProperty
+## ==============================================
+def threadLocalProperty(name):
+    """A driver attribute that every thread has its own value of. Drivers that share
+    one instance between threads use it for the connection and cursor of the pooled
+    connection that the current thread is holding."""
+    def local(self):
+        return self.__dict__.setdefault("_thread_local", threading.local())
+    def get(self):
+        return getattr(local(self), name, None)
+    def set(self, value):
+        setattr(local(self), name, value)
+    return property(get, set)
+## DEF
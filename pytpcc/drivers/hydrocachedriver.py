@@ -2,11 +2,13 @@ import time
 import logging
 import sys
 import uuid
+import random
 
 from drivers.abstractdriver import *
 from cloudburst.client.client import CloudburstConnection
 from cloudburst.shared.serializer import Serializer
 from cloudburst.shared.reference import CloudburstReference
+from anna.client import AnnaTcpClient
 from anna.lattices import MultiKeyCausalLattice
 from cloudburst.shared.proto.cloudburst_pb2 import (
     Continuation,
@@ -17,6 +19,8 @@ from cloudburst.shared.proto.cloudburst_pb2 import (
     MULTIEXEC # Cloudburst's execution types
 )
 import constants
+from drivers.annabatch import *
+from drivers.itemcache import *
 
 logging.basicConfig(level = logging.INFO,
                     format="%(asctime)s [%(funcName)s:%(lineno)03d] %(levelname)-5s: %(message)s",
@@ -62,6 +66,12 @@ getOrderLinesStockLevelName = 'getOrderLinesStockLevel'
 getStocksName = 'getStocks'
 doStockLevelFunctionName = 'doStockLevelFunction'
 
+# Offset of the Anna clients that load data in parallel. Each one needs its
+# own offset (and with it its own response ports) so that they do not clash
+# with the client of the CloudburstConnection.
+LOAD_CLIENT_OFFSET = 100
+
+
 class HydrocacheDriver(AbstractDriver):
 
     DEFAULT_CONFIG = {
@@ -76,7 +86,53 @@ class HydrocacheDriver(AbstractDriver):
         'debug-order-status': ("Show Order Status Performance", 'None'),
         'debug-payment': ("Show Payment Performance", 'None'),
         'debug-stock-level': ("Show Stock Level Performance", 'None'),
+        'load_threads': ("Number of threads (each with its own Anna client) that put loaded keys in parallel", 8),
+        'load_batch_size': ("Number of keys that are put into Anna at once while loading", 1000),
+        'layout': ("Storage layout (%s)" % ", ".join(LAYOUTS), LAYOUT_COLUMN),
+        'ready_sample': ("Number of loaded keys per table that have to read back before the load is done (0 skips the check)", 10),
+        'ready_timeout': ("Seconds to wait for the sampled keys to read back after loading", 300),
+        'track_loaded_keys': ("Remember every loaded ITEM and STOCK key (for debugging)", False),
+        'item_cache': ("Cache the ITEM rows that NEW_ORDER reads on the client (%s)" % ", ".join(ITEM_CACHE_MODES), ITEM_CACHE_OFF),
+    }
+
+    # Key suffix that each column of a table is stored under
+    TABLE_KEYS = {
+        'WAREHOUSE': [ "W_ID", "W_NAME", "W_STREET_1", "W_STREET_2", "W_CITY", "W_STATE", "W_ZIP", "W_TAX", "W_YTD" ],
+        'DISTRICT': [ "D_ID", "D_W_ID", "D_NAME", "D_STREET_1", "D_STREET_2", "D_CITY", "D_STATE", "D_ZIP", "D_TAX", "D_YTD",
+                      "D_NEXT_O_ID" ],
+        'CUSTOMER': [ "C_ID", "C_D_ID", "C_W_ID", "C_FIRST", "C_MIDDLE", "C_LAST", "C_STREET_1", "C_STREET_2", "C_CITY",
+                      "C_ZIP", "C_PHONE", "C_SINCE", "C_CREDIT", "C_CREDIT_LIM", "C_DISCOUNT", "C_BALANCE",
+                      "C_YTD_PAYMENT", "C_PAYMENT_CNT", "C_DELIVERY_CNT", "C_DATA" ],
+        'HISTORY': [ "H_C_ID", "H_C_D_ID", "H_C_W_ID", "H_D_ID", "H_W_ID", "H_DATE", "H_AMOUNT", "H_DATA" ],
+        'STOCK': [ "S_I_ID", "S_W_ID", "S_QUANTITY", "S_DIST_01", "S_DIST_02", "S_DIST_03", "S_DIST_04", "S_DIST_05",
+                   "S_DIST_06", "S_DIST_07", "S_DIST_08", "S_DIST_09", "S_DIST_10", "S_YTD", "S_ORDER_CNT",
+                   "S_REMOTE_CNT", "S_DATA" ],
+        'ORDERS': [ "O_ID", "O_C_ID", "O_D_ID", "O_W_ID", "O_ENTRY_D", "O_CARRIER_ID", "O_OL_CNT", "O_ALL_LOCAL" ],
+        'NEW_ORDER': [ "NO_O_ID", "NO_D_ID", "NO_W_ID" ],
+        'ORDER_LINE': [ "OL_O_ID", "OL_D_ID", "OL_W_ID", "OL_NUMBER", "OL_I_ID", "OL_SUPPLY_W_ID", "OL_DELIVERY_D",
+                        "OL_QUANTITY", "OL_AMOUNT", "OL_DIST_INFO" ],
+        'ITEM': [ "I_ID", "I_IM_ID", "I_NAME", "I_PRICE", "I_DATA" ],
+    }
+
+    # Format of the base key of a tuple and the columns that fill it in
+    # (HISTORY tuples get a random id instead)
+    TABLE_BASE_KEYS = {
+        'WAREHOUSE': ('WAREHOUSE.%s.', [ 0 ]),
+        'DISTRICT': ('DISTRICT.%s.%s.', [ 1, 0 ]),
+        'CUSTOMER': ('CUSTOMER.%s.%s.%s.', [ 2, 1, 0 ]),
+        'STOCK': ('STOCK.%s.%s.', [ 1, 0 ]),
+        'ORDERS': ('ORDER.%s.%s.%s.', [ 3, 2, 0 ]),
+        'NEW_ORDER': ('NEW_ORDER.%s.%s.%s.', [ 2, 1, 0 ]),
+        'ORDER_LINE': ('ORDER_LINE.%s.%s.%s.%s.', [ 2, 1, 0, 3 ]),
+        'ITEM': ('ITEM.%s.', [ 0 ]),
     }
+
+    # Item columns that the NEW_ORDER transaction reads
+    NEW_ORDER_ITEM_KEYS = [ 'I_PRICE', 'I_NAME', 'I_DATA' ]
+
+    # Customer columns that the NEW_ORDER transaction reads (C_DISCOUNT goes last)
+    NEW_ORDER_CUSTOMER_KEYS = [ key for key in TABLE_KEYS['CUSTOMER'] if key != 'C_DISCOUNT' ] + [ 'C_DISCOUNT' ]
+
     # ------------------------------------------------------------------------
     # Class constructor
     #
@@ -85,6 +141,11 @@ class HydrocacheDriver(AbstractDriver):
     def __init__(self, ddl):
         super(HydrocacheDriver,self).__init__("hydrocache",ddl)
         self.cloudburst = None
+        self.serializer = Serializer()
+        self.writer = None
+        self.layout = LAYOUT_COLUMN
+        self.item_cache_mode = ITEM_CACHE_OFF
+        self.item_cache = None
         self.metadata = {}
         self.t0 = 0
         self.debug = {
@@ -95,13 +156,19 @@ class HydrocacheDriver(AbstractDriver):
             'payment': 'None',
             'stock-level': 'None',
         }
+        # Customer last name index entries of the districts still being loaded
         self.customer_indexes = {}
-        self.order_indexes = {}
         self.order_line_indexes = {}
 
         self.new_order_ids = []
 
+        # Loaded keys (with their values) that the readiness check reads back
+        self.ready_keys = {}
+        self.ready_seen = {}
+        self.ready_random = random.Random(0)
+
         # Debugging
+        self.track_loaded_keys = False
         self.loaded_items = {}
         self.loaded_stocks = {}
 
@@ -151,8 +218,7 @@ class HydrocacheDriver(AbstractDriver):
         request = {getNewOrderIndexName: getNewOrderIndexArgs, getNewOrdersName: getNewOrdersArgs,
                    getCustomerIDName: getNewOrderIndexArgs, getOrderLineSumName: getNewOrderIndexArgs,
                    doDeliveryFunctionName: doDeliveryFunctionArgs}
-        result = self.cloudburst.call_dag(doDeliveryDagName, request, consistency=MULTI, output_key="output_key",
-                                          direct_response=True)
+        result = self.callDag(doDeliveryDagName, request)
 
         print('TXN DELIVERY ENDED: ' + str(time.time() - tt))
         return result
@@ -202,12 +268,15 @@ class HydrocacheDriver(AbstractDriver):
         args.append(params)
         all_local = True
         items = []
+        # Cached items are passed by value, the rest by reference
+        cached = self.item_cache.lookup(i_ids, self.fetchItems) if self.item_cache != None else [None] * len(i_ids)
         for i in range(len(i_ids)):
             all_local = all_local and i_w_ids[i] == w_id
-            item_key = 'ITEM.%s.' % str(i_ids[i])
-            items.append(CloudburstReference(item_key + 'I_PRICE', True))
-            items.append(CloudburstReference(item_key + 'I_NAME', True))
-            items.append(CloudburstReference(item_key + 'I_DATA', True))
+            if cached[i] != None:
+                items.extend(self.itemValues(cached[i]))
+            else:
+                item_key = 'ITEM.%s.' % str(i_ids[i])
+                items.extend(self.references(item_key, HydrocacheDriver.NEW_ORDER_ITEM_KEYS))
         args.append(items)
         args.append(all_local)
 
@@ -215,42 +284,19 @@ class HydrocacheDriver(AbstractDriver):
         # Get Warehouse Tax Rate Query
         # ------------------------------
         warehouse_key = "WAREHOUSE.%s." % w_id
-        args.append(CloudburstReference(warehouse_key + 'W_TAX', True))
+        args.append(self.references(warehouse_key, ['W_TAX']))
 
         # ------------------------------------------
         # Get District Tax And Next Order ID Query
         # ------------------------------------------
         district_key = "DISTRICT.%s.%s." % (w_id, d_id)
-        args.append(CloudburstReference(district_key + "D_TAX", True))
-        args.append(CloudburstReference(district_key + "D_NEXT_O_ID", True))
+        args.append(self.references(district_key, ['D_TAX', 'D_NEXT_O_ID']))
 
         # ------------------------------------------
         # Get Client Information And Discount
         # ------------------------------------------
-        customer_info = []
         customer_key = "CUSTOMER.%s.%s.%s." % (w_id, d_id, c_id)
-        customer_info.append(CloudburstReference(customer_key + "C_ID", True))
-        customer_info.append(CloudburstReference(customer_key + "C_D_ID", True))
-        customer_info.append(CloudburstReference(customer_key + "C_W_ID", True))
-        customer_info.append(CloudburstReference(customer_key + "C_FIRST", True))
-        customer_info.append(CloudburstReference(customer_key + "C_MIDDLE", True))
-        customer_info.append(CloudburstReference(customer_key + "C_LAST", True))
-        customer_info.append(CloudburstReference(customer_key + "C_STREET_1", True))
-        customer_info.append(CloudburstReference(customer_key + "C_STREET_2", True))
-        customer_info.append(CloudburstReference(customer_key + "C_CITY", True))
-        customer_info.append(CloudburstReference(customer_key + "C_ZIP", True))
-        customer_info.append(CloudburstReference(customer_key + "C_PHONE", True))
-        customer_info.append(CloudburstReference(customer_key + "C_SINCE", True))
-        customer_info.append(CloudburstReference(customer_key + "C_CREDIT", True))
-        customer_info.append(CloudburstReference(customer_key + "C_CREDIT_LIM", True))
-        customer_info.append(CloudburstReference(customer_key + "C_BALANCE", True))
-        customer_info.append(CloudburstReference(customer_key + "C_YTD_PAYMENT", True))
-        customer_info.append(CloudburstReference(customer_key + "C_PAYMENT_CNT", True))
-        customer_info.append(CloudburstReference(customer_key + "C_DELIVERY_CNT", True))
-        customer_info.append(CloudburstReference(customer_key + "C_DATA", True))
-
-        args.append(customer_info)
-        args.append(CloudburstReference(customer_key + "C_DISCOUNT", True))
+        args.append(self.references(customer_key, HydrocacheDriver.NEW_ORDER_CUSTOMER_KEYS))
 
         # ------------------------------------------
         # Get Order Indexes For Searching
@@ -263,15 +309,8 @@ class HydrocacheDriver(AbstractDriver):
         stocks = []
         for i in range(len(i_ids)):
             stock_key = "STOCK.%s.%s." % (i_w_ids[i], i_ids[i])
-            stocks.append(CloudburstReference(stock_key + "S_QUANTITY", True))
-            stocks.append(CloudburstReference(stock_key + "S_YTD", True))
-            stocks.append(CloudburstReference(stock_key + "S_ORDER_CNT", True))
-            stocks.append(CloudburstReference(stock_key + "S_REMOTE_CNT", True))
-            stocks.append(CloudburstReference(stock_key + "S_DATA", True))
-            if len(str(d_id)) == 1:
-                stocks.append(CloudburstReference(stock_key + 'S_DIST_0' + str(d_id), True))
-            else:
-                stocks.append(CloudburstReference(stock_key + 'S_DIST_' + str(d_id), True))
+            stocks.extend(self.references(stock_key, ['S_QUANTITY', 'S_YTD', 'S_ORDER_CNT', 'S_REMOTE_CNT', 'S_DATA',
+                                                      'S_DIST_%02d' % d_id]))
         args.append(stocks)
 
         # Add required constants
@@ -282,7 +321,7 @@ class HydrocacheDriver(AbstractDriver):
         args.append(CloudburstReference('NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (w_id, d_id), True))
 
         request = {doNewOrderFunctionName: args}
-        result = self.cloudburst.call_dag(doNewOrderDagName, request, consistency=MULTI, output_key="output_key", direct_response=True)
+        result = self.callDag(doNewOrderDagName, request)
 
         logging.info('TXN NEW ORDER FINISHED -----------------')
         logging.info('EXECUTION TIME: %s', time.time() - tt)
@@ -321,35 +360,14 @@ class HydrocacheDriver(AbstractDriver):
             # -----------------------------------
             # Get Customer By Customer ID Query
             # -----------------------------------
-            customer = []
             customer_key = 'CUSTOMER.%s.%s.%s.' % (w_id, d_id, c_id)
-            customer.append(CloudburstReference(customer_key + "C_ID", True))
-            customer.append(CloudburstReference(customer_key + "C_D_ID", True))
-            customer.append(CloudburstReference(customer_key + "C_W_ID", True))
-            customer.append(CloudburstReference(customer_key + "C_FIRST", True))
-            customer.append(CloudburstReference(customer_key + "C_MIDDLE", True))
-            customer.append(CloudburstReference(customer_key + "C_LAST", True))
-            customer.append(CloudburstReference(customer_key + "C_STREET_1", True))
-            customer.append(CloudburstReference(customer_key + "C_STREET_2", True))
-            customer.append(CloudburstReference(customer_key + "C_CITY", True))
-            customer.append(CloudburstReference(customer_key + "C_ZIP", True))
-            customer.append(CloudburstReference(customer_key + "C_PHONE", True))
-            customer.append(CloudburstReference(customer_key + "C_SINCE", True))
-            customer.append(CloudburstReference(customer_key + "C_CREDIT", True))
-            customer.append(CloudburstReference(customer_key + "C_CREDIT_LIM", True))
-            customer.append(CloudburstReference(customer_key + "C_DISCOUNT", True))
-            customer.append(CloudburstReference(customer_key + "C_BALANCE", True))
-            customer.append(CloudburstReference(customer_key + "C_YTD_PAYMENT", True))
-            customer.append(CloudburstReference(customer_key + "C_PAYMENT_CNT", True))
-            customer.append(CloudburstReference(customer_key + "C_DELIVERY_CNT", True))
-            customer.append(CloudburstReference(customer_key + "C_DATA", True))
+            customer = self.references(customer_key, HydrocacheDriver.TABLE_KEYS['CUSTOMER'])
 
             args.append(params)
             args.append(customer)
 
             request = {getLastOrderName: args, getOrderLinesIndexesName: [params]}
-            result = self.cloudburst.call_dag(doOrderStatusClientDagName, request, consistency=MULTI,
-                                              output_key="output_key", direct_response=True)
+            result = self.callDag(doOrderStatusClientDagName, request)
 
         else:
             # ----------------------------------
@@ -359,8 +377,7 @@ class HydrocacheDriver(AbstractDriver):
             args.append(CloudburstReference(customer_last_name, True))
             request = {getClientByLastNameFunctionName: args,
                        getLastOrderName: [params], getOrderLinesIndexesName: [params]}
-            result = self.cloudburst.call_dag(doOrderStatusClientIndexDagName, request, consistency=MULTI,
-                                              output_key="output_key", direct_response=True)
+            result = self.callDag(doOrderStatusClientIndexDagName, request)
 
         print('TXN ORDER STATUS FINISHED: ' + str(time.time() - tt))
         return result
@@ -400,35 +417,14 @@ class HydrocacheDriver(AbstractDriver):
             # -----------------------------------
             # Get Customer By Customer ID Query
             # -----------------------------------
-            customer = []
             customer_key = 'CUSTOMER.%s.%s.%s.' % (w_id, d_id, c_id)
-            customer.append(CloudburstReference(customer_key + "C_ID", True))
-            customer.append(CloudburstReference(customer_key + "C_D_ID", True))
-            customer.append(CloudburstReference(customer_key + "C_W_ID", True))
-            customer.append(CloudburstReference(customer_key + "C_FIRST", True))
-            customer.append(CloudburstReference(customer_key + "C_MIDDLE", True))
-            customer.append(CloudburstReference(customer_key + "C_LAST", True))
-            customer.append(CloudburstReference(customer_key + "C_STREET_1", True))
-            customer.append(CloudburstReference(customer_key + "C_STREET_2", True))
-            customer.append(CloudburstReference(customer_key + "C_CITY", True))
-            customer.append(CloudburstReference(customer_key + "C_ZIP", True))
-            customer.append(CloudburstReference(customer_key + "C_PHONE", True))
-            customer.append(CloudburstReference(customer_key + "C_SINCE", True))
-            customer.append(CloudburstReference(customer_key + "C_CREDIT", True))
-            customer.append(CloudburstReference(customer_key + "C_CREDIT_LIM", True))
-            customer.append(CloudburstReference(customer_key + "C_DISCOUNT", True))
-            customer.append(CloudburstReference(customer_key + "C_BALANCE", True))
-            customer.append(CloudburstReference(customer_key + "C_YTD_PAYMENT", True))
-            customer.append(CloudburstReference(customer_key + "C_PAYMENT_CNT", True))
-            customer.append(CloudburstReference(customer_key + "C_DELIVERY_CNT", True))
-            customer.append(CloudburstReference(customer_key + "C_DATA", True))
+            customer = self.references(customer_key, HydrocacheDriver.TABLE_KEYS['CUSTOMER'])
 
             args.append(params)
             args.append(customer)
 
             request = {getWarehouseDistrictName: args, doPaymentFunctionName: doPaymentFunctionArgs}
-            result = self.cloudburst.call_dag(doPaymentClientDagName, request, consistency=MULTI,
-                                              output_key="output_key", direct_response=True)
+            result = self.callDag(doPaymentClientDagName, request)
 
         else:
             # ----------------------------------
@@ -438,8 +434,7 @@ class HydrocacheDriver(AbstractDriver):
             args.append(CloudburstReference(customer_last_name, True))
             request = {getClientByLastNameDoPaymentName: args,
                        getWarehouseDistrictName: [params], doPaymentFunctionName: doPaymentFunctionArgs}
-            result = self.cloudburst.call_dag(doPaymentClientIndexDagName, request, consistency=MULTI,
-                                              output_key="output_key", direct_response=True)
+            result = self.callDag(doPaymentClientIndexDagName, request)
 
         self.next_scores['HISTORY'] += 1
         print('TXN DO PAYMENT FINISHED: ' + str(time.time() - tt))
@@ -461,12 +456,55 @@ class HydrocacheDriver(AbstractDriver):
         tt = time.time()
         request = {getOrderIDName: [params], getStockCountName: [params],
                    getStocksName: [params], doStockLevelFunctionName: [params]}
-        result = self.cloudburst.call_dag(doStockLevelDagName, request, consistency=MULTI,
-                                          output_key="output_key", direct_response=True)
+        result = self.callDag(doStockLevelDagName, request)
         print('TXN STOCK LEVEL FINISHED: ' + str(time.time() - tt))
         return result
     # End doStockLevel
 
+    # ------------------------------------------------------------------------
+    # Run one of the transaction DAGs and wait for its result
+    #
+    # Cloudburst does not raise when a DAG fails. A function that throws comes
+    # back as an ('ERROR: ...', traceback) pair, a DAG that the scheduler
+    # refused as (None, error type), and a lost response as None. The functions
+    # only buffer their writes in the write set until the DAG commits, so a
+    # failed function left nothing behind and the Executor can safely run the
+    # transaction again. Without a response nobody knows whether the DAG
+    # committed, so that one is aborted for good.
+    #
+    # @param string dag_name (name of the registered DAG)
+    # @param dictionary request (arguments of each function in the DAG)
+    # ------------------------------------------------------------------------
+    def callDag(self, dag_name, request):
+        result = self.cloudburst.call_dag(dag_name, request, consistency=MULTI, output_key="output_key",
+                                          direct_response=True)
+        if result == None:
+            raise Exception("%s did not respond" % dag_name)
+        if type(result) == tuple and len(result) == 2:
+            if result[0] == None:
+                raise Exception("%s was refused by the scheduler (error %s)" % (dag_name, result[1]))
+            if isinstance(result[0], str) and result[0].startswith('ERROR'):
+                raise ConflictError("%s failed: %s" % (dag_name, result[0]), "dag error")
+        return result
+    # End callDag
+
+    # ------------------------------------------------------------------------
+    # Pre-processing function for the execution phase
+    # ------------------------------------------------------------------------
+    def executeStart(self):
+        checkLayout(self.readKeys, self.layout)
+        if self.item_cache_mode == ITEM_CACHE_PRELOAD:
+            self.item_cache.preload(self.fetchItems)
+    # End executeStart
+
+    # ------------------------------------------------------------------------
+    # Post-processing function for the execution phase
+    # ------------------------------------------------------------------------
+    def executeFinish(self):
+        if self.item_cache != None:
+            logging.info(str(self.item_cache))
+    # End executeFinish
+
     # ------------------------------------------------------------------------
     # Load the specified configuration for Cloudburst TPC-C run
     #
@@ -482,6 +520,16 @@ class HydrocacheDriver(AbstractDriver):
         local = config['local']
 
         self.cloudburst = CloudburstConnection(func_address, client_ip, client_id, local)
+        self.anna_config = (func_address, client_ip, int(client_id), local)
+        self.load_threads = int(config['load_threads'])
+        self.load_batch_size = int(config['load_batch_size'])
+        self.layout = config['layout']
+        self.ready_sample = int(config['ready_sample'])
+        self.ready_timeout = float(config['ready_timeout'])
+        self.track_loaded_keys = str(config['track_loaded_keys']).lower() == "true"
+        self.item_cache_mode = config['item_cache']
+        self.item_cache = makeItemCache(self.item_cache_mode)
+        assert self.layout in LAYOUTS, "Unexpected layout '%s'" % self.layout
         self.cloudburst.kvs_client.put("output_key", self.getKeyLattice(0))
         # self.cloudburst.register(doNewOrderFunction, doNewOrderFunctionName)
         # self.cloudburst.register(doNothing, 'doNothing')
@@ -506,19 +554,44 @@ class HydrocacheDriver(AbstractDriver):
         for table, next in self.next_scores.items():
             self.metadata[table + '.next_score'] = next
 
-        self.cloudburst.kvs_client.put('NEW_ORDER.IDS', self.getKeyLattice(self.new_order_ids))
+        # Whatever is left of the customer index (loadFinishDistrict writes most of it)
+        self.flushCustomerIndexes()
 
-        # Add Special Index for Customer Table
-        for index_key in self.customer_indexes:
-            self.cloudburst.kvs_client.put(index_key, self.getKeyLattice(self.customer_indexes[index_key]))
+        self.writer.write({'NEW_ORDER.IDS': self.getKeyLattice(self.new_order_ids)})
+        self.writer.close()
 
-        logging.info('Waiting for DB to stabilize')
-        time.sleep(5 * 60)
-        logging.info('Woke Up')
+        if self.ready_sample > 0:
+            expected = {}
+            for sample in self.ready_keys.values():
+                expected.update(dict(sample))
+            logging.info('Waiting for %d sampled keys to read back' % len(expected))
+            elapsed = waitForKeys(self.readKeys, expected, self.ready_timeout)
+            logging.info('DB is ready after %.1f seconds' % elapsed)
 
+    # End loadFinish
 
+    # ------------------------------------------------------------------------
+    # All the CUSTOMER tuples of a district have been loaded, so its entries of
+    # the customer last name index are complete and can be written out
+    #
+    # @param int warehouse id
+    # @param int district id
+    # ------------------------------------------------------------------------
+    def loadFinishDistrict(self, w_id, d_id):
+        self.flushCustomerIndexes()
+    # End loadFinishDistrict
 
-    # End loadFinish
+    # ------------------------------------------------------------------------
+    # Write the customer last name index entries held in memory and forget them
+    # ------------------------------------------------------------------------
+    def flushCustomerIndexes(self):
+        lattices = {}
+        for index_key, base_keys in self.customer_indexes.items():
+            lattices[index_key] = self.getKeyLattice(base_keys)
+        if lattices:
+            self.writer.write(lattices)
+        self.customer_indexes = {}
+    # End flushCustomerIndexes
 
     # ------------------------------------------------------------------------
     # Pre-pocessing function for data loading
@@ -527,6 +600,7 @@ class HydrocacheDriver(AbstractDriver):
         if self.debug['load'] != 'None':
             logging.info('Starting data load')
         self.t0 = time.time()
+        self.writer = BatchWriter(self.connectLoadClient, self.load_threads, self.load_batch_size, self.cloudburst.kvs_client)
 
         # Used for Number of orders and History ID
 
@@ -550,170 +624,195 @@ class HydrocacheDriver(AbstractDriver):
     # @param list of tuples corresponding to table schema
     # ------------------------------------------------------------------------
     def loadTuples(self, tableName, tuples):
+        columns = [ list(column) for column in zip(*tuples) ]
+        self.loadColumns(tableName, columns, len(tuples))
+    # End loadTuples
+
+    # ------------------------------------------------------------------------
+    # Every column is stored under its own key, so take the tuples column by
+    # column instead of re-pivoting each row
+    # ------------------------------------------------------------------------
+    def supportsColumns(self):
+        return True
+    # End supportsColumns
+
+    # ------------------------------------------------------------------------
+    # Load columns into a table for TPC-C benchmarking
+    #
+    # @param string table name
+    # @param list of columns corresponding to table schema
+    # @param int number of tuples
+    # ------------------------------------------------------------------------
+    def loadColumns(self, tableName, columns, count):
 
         if self.debug['load'] != 'None':
             logging.info("Loading %s" % tableName)
 
-        if tableName == 'WAREHOUSE':
-            for row in tuples:
-                base_key = 'WAREHOUSE.%s.' % row[0]
-                self.cloudburst.kvs_client.put(base_key+"W_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key+"W_NAME", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key+"W_STREET_1", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key+"W_STREET_2", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key+"W_CITY", self.getKeyLattice(row[4]))
-                self.cloudburst.kvs_client.put(base_key+"W_STATE", self.getKeyLattice(row[5]))
-                self.cloudburst.kvs_client.put(base_key+"W_ZIP", self.getKeyLattice(row[6]))
-                self.cloudburst.kvs_client.put(base_key+"W_TAX", self.getKeyLattice(row[7]))
-                self.cloudburst.kvs_client.put(base_key+"W_YTD", self.getKeyLattice(row[8]))
-
-        elif tableName == 'DISTRICT':
-            for row in tuples:
-                base_key = 'DISTRICT.%s.%s.' % (row[1], row[0])
-                self.cloudburst.kvs_client.put(base_key + "D_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "D_W_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "D_NAME", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key + "D_STREET_1", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key + "D_STREET_2", self.getKeyLattice(row[4]))
-                self.cloudburst.kvs_client.put(base_key + "D_CITY", self.getKeyLattice(row[5]))
-                self.cloudburst.kvs_client.put(base_key + "D_STATE", self.getKeyLattice(row[6]))
-                self.cloudburst.kvs_client.put(base_key + "D_ZIP", self.getKeyLattice(row[7]))
-                self.cloudburst.kvs_client.put(base_key + "D_TAX", self.getKeyLattice(row[8]))
-                self.cloudburst.kvs_client.put(base_key + "D_YTD", self.getKeyLattice(row[9]))
-                self.cloudburst.kvs_client.put(base_key + "D_NEXT_O_ID", self.getKeyLattice(row[10]))
-                index_key = 'NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (row[1], row[0])
-                self.cloudburst.kvs_client.put(index_key, self.getKeyLattice("None"))
+        if count > 0:
+            if tableName == 'HISTORY':
+                base_keys = [ 'HISTORY.%s.' % str(uuid.uuid1()) for i in range(count) ]
+            else:
+                key_format, key_columns = HydrocacheDriver.TABLE_BASE_KEYS[tableName]
+                base_keys = [ key_format % key for key in zip(*[ columns[i] for i in key_columns ]) ]
+
+            # Serialize everything up front, and then put the whole lot at once
+            lattices = {}
+            names = HydrocacheDriver.TABLE_KEYS[tableName]
+            if self.layout == LAYOUT_ROW:
+                for base_key, row in zip(base_keys, zip(*columns)):
+                    row, updated = splitRow(dict(zip(names, row)))
+                    lattices[base_key] = self.getKeyLattice(row)
+                    for key, values in updated.items():
+                        lattices[base_key + key] = self.getKeyLattice(values)
+            else:
+                for name, values in zip(names, columns):
+                    for base_key, value in zip(base_keys, values):
+                        lattices[base_key + name] = self.getKeyLattice(value)
+            # End if
+
+            self.loadIndexes(tableName, columns, base_keys, lattices)
+            self.sampleReadyKeys(tableName, names, columns, base_keys)
+            self.writer.write(lattices)
+
+        self.next_scores[tableName] += 1
+
+    # End loadColumns
+
+    # ------------------------------------------------------------------------
+    # Build the secondary indexes for newly loaded tuples
+    #
+    # @param string table name
+    # @param list of columns corresponding to table schema
+    # @param list of the base key of every tuple
+    # @param dictionary the index keys get added to, along with their lattices
+    # ------------------------------------------------------------------------
+    def loadIndexes(self, tableName, columns, base_keys, lattices):
+
+        if tableName == 'DISTRICT':
+            for d_id, d_w_id in zip(columns[0], columns[1]):
+                index_key = 'NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (d_w_id, d_id)
+                lattices[index_key] = self.getKeyLattice("None")
 
         elif tableName == 'CUSTOMER':
-            for row in tuples:
-                base_key = 'CUSTOMER.%s.%s.%s.' % (row[2], row[1], row[0])
-                self.cloudburst.kvs_client.put(base_key + "C_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "C_D_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "C_W_ID", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key + "C_FIRST", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key + "C_MIDDLE", self.getKeyLattice(row[4]))
-                self.cloudburst.kvs_client.put(base_key + "C_LAST", self.getKeyLattice(row[5]))
-                self.cloudburst.kvs_client.put(base_key + "C_STREET_1", self.getKeyLattice(row[6]))
-                self.cloudburst.kvs_client.put(base_key + "C_STREET_2", self.getKeyLattice(row[7]))
-                self.cloudburst.kvs_client.put(base_key + "C_CITY", self.getKeyLattice(row[8]))
-                self.cloudburst.kvs_client.put(base_key + "C_ZIP", self.getKeyLattice(row[9]))
-                self.cloudburst.kvs_client.put(base_key + "C_PHONE", self.getKeyLattice(row[10]))
-                self.cloudburst.kvs_client.put(base_key + "C_SINCE", self.getKeyLattice(row[11]))
-                self.cloudburst.kvs_client.put(base_key + "C_CREDIT", self.getKeyLattice(row[12]))
-                self.cloudburst.kvs_client.put(base_key + "C_CREDIT_LIM", self.getKeyLattice(row[13]))
-                self.cloudburst.kvs_client.put(base_key + "C_DISCOUNT", self.getKeyLattice(row[14]))
-                self.cloudburst.kvs_client.put(base_key + "C_BALANCE", self.getKeyLattice(row[15]))
-                self.cloudburst.kvs_client.put(base_key + "C_YTD_PAYMENT", self.getKeyLattice(row[16]))
-                self.cloudburst.kvs_client.put(base_key + "C_PAYMENT_CNT", self.getKeyLattice(row[17]))
-                self.cloudburst.kvs_client.put(base_key + "C_DELIVERY_CNT", self.getKeyLattice(row[18]))
-                self.cloudburst.kvs_client.put(base_key + "C_DATA", self.getKeyLattice(row[19]))
-                self.cloudburst.kvs_client.put('ORDERS.INDEXES.ORDERSEARCH.%s.%s.%s' % (row[2], row[1], row[0]), self.getKeyLattice([]))
-                index_key = 'CUSTOMER.INDEXES.NAMESEARCH.%s.%s.%s' % (row[2], row[1], row[5])
+            for c_id, c_d_id, c_w_id, c_last, base_key in zip(columns[0], columns[1], columns[2], columns[5], base_keys):
+                lattices['ORDERS.INDEXES.ORDERSEARCH.%s.%s.%s' % (c_w_id, c_d_id, c_id)] = self.getKeyLattice([])
+                index_key = 'CUSTOMER.INDEXES.NAMESEARCH.%s.%s.%s' % (c_w_id, c_d_id, c_last)
                 if index_key in self.customer_indexes:
                     self.customer_indexes[index_key].append(base_key)
                 else:
                     self.customer_indexes[index_key] = [base_key]
 
-
-
-
-        elif tableName == 'HISTORY':
-            for row in tuples:
-                base_key = 'HISTORY.%s.' % str(uuid.uuid1())
-                self.cloudburst.kvs_client.put(base_key + "H_C_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "H_C_D_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "H_C_W_ID", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key + "H_D_ID", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key + "H_W_ID", self.getKeyLattice(row[4]))
-                self.cloudburst.kvs_client.put(base_key + "H_DATE", self.getKeyLattice(row[5]))
-                self.cloudburst.kvs_client.put(base_key + "H_AMOUNT", self.getKeyLattice(row[6]))
-                self.cloudburst.kvs_client.put(base_key + "H_DATA", self.getKeyLattice(row[7]))
-
-        elif tableName == 'STOCK':
-            for row in tuples:
-                base_key = 'STOCK.%s.%s.' % (row[1], row[0])
-                self.cloudburst.kvs_client.put(base_key + "S_I_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "S_W_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "S_QUANTITY", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_01", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_02", self.getKeyLattice(row[4]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_03", self.getKeyLattice(row[5]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_04", self.getKeyLattice(row[6]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_05", self.getKeyLattice(row[7]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_06", self.getKeyLattice(row[8]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_07", self.getKeyLattice(row[9]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_08", self.getKeyLattice(row[10]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_09", self.getKeyLattice(row[11]))
-                self.cloudburst.kvs_client.put(base_key + "S_DIST_10", self.getKeyLattice(row[12]))
-                self.cloudburst.kvs_client.put(base_key + "S_YTD", self.getKeyLattice(row[13]))
-                self.cloudburst.kvs_client.put(base_key + "S_ORDER_CNT", self.getKeyLattice(row[14]))
-                self.cloudburst.kvs_client.put(base_key + "S_REMOTE_CNT", self.getKeyLattice(row[15]))
-                self.cloudburst.kvs_client.put(base_key + "S_DATA", self.getKeyLattice(row[16]))
+        elif tableName == 'STOCK' and self.track_loaded_keys:
+            for base_key in base_keys:
                 self.loaded_stocks[base_key] = True
 
-        elif tableName == 'ORDERS':
-            for row in tuples:
-                base_key = 'ORDER.%s.%s.%s.' % (row[3], row[2], row[0])
-                self.cloudburst.kvs_client.put(base_key + "O_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "O_C_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "O_D_ID", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key + "O_W_ID", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key + "O_ENTRY_D", self.getKeyLattice(row[4]))
-                self.cloudburst.kvs_client.put(base_key + "O_CARRIER_ID", self.getKeyLattice(row[5]))
-                self.cloudburst.kvs_client.put(base_key + "O_OL_CNT", self.getKeyLattice(row[6]))
-                self.cloudburst.kvs_client.put(base_key + "O_ALL_LOCAL", self.getKeyLattice(row[7]))
-                index_key = 'ORDERS.INDEXES.ORDERSEARCH.%s.%s.%s' % (row[3], row[2], row[1])
-                if index_key in self.order_indexes:
-                    self.order_indexes[index_key].append(base_key)
-                else:
-                    self.order_indexes[index_key] = [base_key]
-
         elif tableName == 'NEW_ORDER':
-            for row in tuples:
-                base_key = 'NEW_ORDER.%s.%s.%s.' % (row[2], row[1], row[0])
-                self.cloudburst.kvs_client.put(base_key + "NO_O_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "NO_D_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "NO_W_ID", self.getKeyLattice(row[2]))
-                index_key = 'NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (row[2], row[1])
-                self.cloudburst.kvs_client.put(index_key, self.getKeyLattice(base_key))
+            for no_d_id, no_w_id, base_key in zip(columns[1], columns[2], base_keys):
+                index_key = 'NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (no_w_id, no_d_id)
+                # Only the last NEW_ORDER of each district ends up in the index
+                lattices[index_key] = self.getKeyLattice(base_key)
                 self.new_order_ids.append(base_key)
 
         elif tableName == 'ORDER_LINE':
             base_key_list = {}
-            for row in tuples:
-                base_key = 'ORDER_LINE.%s.%s.%s.%s.' % (row[2], row[1], row[0], row[3])
-                self.cloudburst.kvs_client.put(base_key + "OL_O_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "OL_D_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "OL_W_ID", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key + "OL_NUMBER", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key + "OL_I_ID", self.getKeyLattice(row[4]))
-                self.cloudburst.kvs_client.put(base_key + "OL_SUPPLY_W_ID", self.getKeyLattice(row[5]))
-                self.cloudburst.kvs_client.put(base_key + "OL_DELIVERY_D", self.getKeyLattice(row[6]))
-                self.cloudburst.kvs_client.put(base_key + "OL_QUANTITY", self.getKeyLattice(row[7]))
-                self.cloudburst.kvs_client.put(base_key + "OL_AMOUNT", self.getKeyLattice(row[8]))
-                self.cloudburst.kvs_client.put(base_key + "OL_DIST_INFO", self.getKeyLattice(row[9]))
-                index_key = 'ORDER_LINE.INDEXES.SUMOLAMOUNT.%s.%s.%s' % (row[0], row[1], row[2])
+            for ol_o_id, ol_d_id, ol_w_id, base_key in zip(columns[0], columns[1], columns[2], base_keys):
+                index_key = 'ORDER_LINE.INDEXES.SUMOLAMOUNT.%s.%s.%s' % (ol_o_id, ol_d_id, ol_w_id)
                 if index_key in base_key_list:
                     base_key_list[index_key].append(base_key)
                 else:
                     base_key_list[index_key] = [base_key]
 
             for index_key in base_key_list:
-                self.cloudburst.kvs_client.put(index_key, self.getKeyLattice(base_key_list[index_key]))
-
-        elif tableName == 'ITEM':
-            for row in tuples:
-                base_key = 'ITEM.%s.' % row[0]
-                self.cloudburst.kvs_client.put(base_key + "I_ID", self.getKeyLattice(row[0]))
-                self.cloudburst.kvs_client.put(base_key + "I_IM_ID", self.getKeyLattice(row[1]))
-                self.cloudburst.kvs_client.put(base_key + "I_NAME", self.getKeyLattice(row[2]))
-                self.cloudburst.kvs_client.put(base_key + "I_PRICE", self.getKeyLattice(row[3]))
-                self.cloudburst.kvs_client.put(base_key + "I_DATA", self.getKeyLattice(row[4]))
+                lattices[index_key] = self.getKeyLattice(base_key_list[index_key])
+
+        elif tableName == 'ITEM' and self.track_loaded_keys:
+            for base_key in base_keys:
                 self.loaded_items[base_key] = True
 
-        self.next_scores[tableName] += 1
+    # End loadIndexes
 
-    # End loadTuples
+    # ------------------------------------------------------------------------
+    # Keep a uniform sample of the loaded keys of each table (along with their
+    # values) for the readiness check that loadFinish does. Each table gets
+    # its own reservoir, so the sample covers every table.
+    #
+    # @param string table name
+    # @param list of column names
+    # @param list of columns corresponding to table schema
+    # @param list of the base key of every tuple
+    # ------------------------------------------------------------------------
+    def sampleReadyKeys(self, tableName, names, columns, base_keys):
+        sample = self.ready_keys.setdefault(tableName, [])
+        for i, base_key in enumerate(base_keys):
+            seen = self.ready_seen.get(tableName, 0)
+            self.ready_seen[tableName] = seen + 1
+            if len(sample) < self.ready_sample:
+                slot = len(sample)
+                sample.append(None)
+            else:
+                slot = self.ready_random.randrange(seen + 1)
+                if slot >= self.ready_sample: continue
+            # End if
+
+            if self.layout == LAYOUT_ROW:
+                sample[slot] = (base_key, splitRow(dict([ (name, column[i]) for name, column in zip(names, columns) ]))[0])
+            else:
+                c = self.ready_random.randrange(len(names))
+                sample[slot] = (base_key + names[c], columns[c][i])
+        # End for
+
+    # End sampleReadyKeys
+
+    # ------------------------------------------------------------------------
+    # Read some keys straight from Anna
+    #
+    # @param list of keys
+    # @return dictionary with the value of every key that could be read
+    # ------------------------------------------------------------------------
+    def readKeys(self, keys):
+        values = {}
+        for key, lattice in self.cloudburst.kvs_client.get(keys).items():
+            if lattice != None:
+                values[key] = self.serializer.load_lattice(lattice)
+        return values
+    # End readKeys
+
+    # ------------------------------------------------------------------------
+    # Read the ITEM columns that NEW_ORDER needs straight from Anna (for the
+    # ItemCache)
+    #
+    # @param list of item ids
+    # @return dictionary with the row of every item that exists and has a single version
+    # ------------------------------------------------------------------------
+    def fetchItems(self, i_ids):
+        names = HydrocacheDriver.NEW_ORDER_ITEM_KEYS
+        rows = {}
+        if self.layout == LAYOUT_ROW:
+            values = self.readKeys([ 'ITEM.%s.' % i_id for i_id in i_ids ])
+            for i_id in i_ids:
+                row = reveal(values.get('ITEM.%s.' % i_id))
+                if isinstance(row, dict):
+                    rows[i_id] = dict([ (name, row.get(name)) for name in names ])
+        else:
+            values = self.readKeys([ 'ITEM.%s.%s' % (i_id, name) for i_id in i_ids for name in names ])
+            for i_id in i_ids:
+                row = dict([ (name, reveal(values.get('ITEM.%s.%s' % (i_id, name)))) for name in names ])
+                if not None in row.values():
+                    rows[i_id] = row
+        # End if
+        return rows
+    # End fetchItems
+
+    # ------------------------------------------------------------------------
+    # What NEW_ORDER gets for a cached item in place of its references
+    #
+    # @param dictionary item row from fetchItems
+    # ------------------------------------------------------------------------
+    def itemValues(self, row):
+        if self.layout == LAYOUT_ROW:
+            return [row]
+        return [ row[name] for name in HydrocacheDriver.NEW_ORDER_ITEM_KEYS ]
+    # End itemValues
 
     # ------------------------------------------------------------------------
     # Return default configuration when none is specified via command line
@@ -724,6 +823,35 @@ class HydrocacheDriver(AbstractDriver):
         return self.DEFAULT_CONFIG
     # End makeDefaultConfig()
 
+    def __str__(self):
+        return "%s (%s layout)" % (self.driver_name, self.layout)
+
+    # ------------------------------------------------------------------------
+    # References to some of the columns of the row stored under the given base
+    # key. With the row layout, that is one reference to the row (unless only
+    # updated columns are needed) followed by one to each of the UPDATED_COLUMNS
+    # keys of the columns, and the DAG functions project the columns out of them.
+    #
+    # @param string base key of the row
+    # @param list of column names
+    # ------------------------------------------------------------------------
+    def references(self, base_key, columns):
+        if self.layout == LAYOUT_ROW:
+            return [CloudburstReference(key, True) for key in rowKeys(base_key, columns)]
+        return [CloudburstReference(base_key + column, True) for column in columns]
+    # End references
+
+    # ------------------------------------------------------------------------
+    # Open another Anna client for one of the threads that put loaded keys
+    #
+    # @param int number of the thread
+    # ------------------------------------------------------------------------
+    def connectLoadClient(self, idx):
+        func_address, client_ip, client_id, local = self.anna_config
+        offset = LOAD_CLIENT_OFFSET + client_id * self.load_threads + idx
+        return AnnaTcpClient(func_address, client_ip, local=local, offset=offset)
+    # End connectLoadClient
+
     # ------------------------------------------------------------------------
     # Aux Functions
     # ------------------------------------------------------------------------
@@ -735,7 +863,6 @@ class HydrocacheDriver(AbstractDriver):
     # @return Serialized Lattice MultiKeyCausalLattice (Causal Lattice)
     # ------------------------------------------------------------------------
     def getKeyLattice(self, value):
-        serializer = Serializer()
-        return serializer.dump_lattice(value, MultiKeyCausalLattice)
+        return self.serializer.dump_lattice(value, MultiKeyCausalLattice)
 
 
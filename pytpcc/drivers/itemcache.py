@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import logging
+
+import constants
+
+## Values of the drivers' 'item_cache' option
+ITEM_CACHE_OFF = 'off'
+ITEM_CACHE_LAZY = 'lazy'
+ITEM_CACHE_PRELOAD = 'preload'
+ITEM_CACHE_MODES = [ ITEM_CACHE_OFF, ITEM_CACHE_LAZY, ITEM_CACHE_PRELOAD ]
+
+## Number of ITEM rows that preload() asks for at once
+PRELOAD_BATCH_SIZE = 1000
+
+## ==============================================
+## ItemCache
+## ==============================================
+class ItemCache:
+    """
+        Client-side read-through cache for ITEM rows, which never change after
+        they have been loaded. Rows are kept in a list indexed by I_ID, so a
+        lookup is a single array access. What a row looks like is up to the
+        driver. Unused item ids (the NewOrder rollbacks) are never cached.
+    """
+    
+    def __init__(self, size = constants.NUM_ITEMS):
+        self.rows = [ None ] * (size + 1)
+        self.hits = 0
+        self.misses = 0
+    ## DEF
+    
+    def lookup(self, i_ids, fetch):
+        """
+            Return the row of each of the given item ids, or None for the ones
+            that do not exist. 'fetch' maps a list of the ids that are not
+            cached yet to a dict with the rows that it found.
+        """
+        rows = [ self.get(i_id) for i_id in i_ids ]
+        missing = [ i_id for i_id, row in zip(i_ids, rows) if row == None ]
+        self.hits += len(i_ids) - len(missing)
+        self.misses += len(missing)
+        if not missing: return rows
+        
+        fetched = fetch(missing)
+        for i_id, row in fetched.items(): self.put(i_id, row)
+        return [ fetched.get(i_id) if row == None else row for i_id, row in zip(i_ids, rows) ]
+    ## DEF
+    
+    def preload(self, fetch, items = None):
+        """Fill the cache with every row from 1 to 'items' (by default as many as fit)"""
+        if items == None: items = len(self.rows) - 1
+        count = 0
+        for first in range(1, items + 1, PRELOAD_BATCH_SIZE):
+            fetched = fetch(list(range(first, min(first + PRELOAD_BATCH_SIZE, items + 1))))
+            for i_id, row in fetched.items(): self.put(i_id, row)
+            count += len(fetched)
+        ## FOR
+        logging.info("Preloaded %d ITEM rows" % count)
+        return count
+    ## DEF
+    
+    def get(self, i_id):
+        if 0 < i_id and i_id < len(self.rows): return self.rows[i_id]
+        return None
+    ## DEF
+    
+    def put(self, i_id, row):
+        if 0 < i_id and i_id < len(self.rows) and row != None: self.rows[i_id] = row
+    ## DEF
+    
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0: return 0.0
+        return self.hits / float(lookups)
+    ## DEF
+    
+    def __str__(self):
+        cached = len(self.rows) - self.rows.count(None)
+        return "ITEM cache: %d hits, %d misses (%.1f%% hit rate), %d rows cached" % \
+               (self.hits, self.misses, self.hitRate() * 100, cached)
+    ## DEF
+## CLASS
+
+## ==============================================
+## makeItemCache
+## ==============================================
+def makeItemCache(mode):
+    """The ItemCache for the given 'item_cache' option, or None if it is off"""
+    assert mode in ITEM_CACHE_MODES, "Unexpected item cache mode '%s'" % mode
+    if mode == ITEM_CACHE_OFF: return None
+    return ItemCache()
+## DEF
@@ -35,6 +35,7 @@ from pprint import pprint,pformat
 
 import constants
 from abstractdriver import *
+from itemcache import *
 MAX_CUSTOMER_ID = 3000
 MAX_ORDER_ID = 2999
 
@@ -225,6 +226,7 @@ class MembaseDriver(AbstractDriver):
         "host": ("The hostname to membase", "localhost" ),
         "port": ("The port number to membase", 11211 ),
         "name": ("Collection name", "tpcc"),
+        "item_cache": ("Cache the ITEM rows that NEW_ORDER reads on the client (%s)" % ", ".join(ITEM_CACHE_MODES), ITEM_CACHE_OFF),
     }
     #This may be similar to the memcache configuration
     
@@ -233,6 +235,8 @@ class MembaseDriver(AbstractDriver):
         self.database = None
         self.conn = None
         self.load_time = 0      
+        self.item_cache_mode = ITEM_CACHE_OFF
+        self.item_cache = None
     
     ## ----------------------------------------------
     ## makeDefaultConfig
@@ -253,6 +257,9 @@ class MembaseDriver(AbstractDriver):
         self.conn = memcache.Client(conn_list)
         #self.database = self.conn[str(config['name'])]
         
+        self.item_cache_mode = config['item_cache']
+        self.item_cache = makeItemCache(self.item_cache_mode)
+        
     ## ----------------------------------------------
     ## loadTuples into a csv file
     ## ../py-tpcc/src/pytpcc/insert_data.csv
@@ -335,6 +342,34 @@ class MembaseDriver(AbstractDriver):
         logging.debug("Loaded %d tuples for tableName %s" % (len(tuples), tableName))
         return
 
+    ## ----------------------------------------------
+    ## executeStart
+    ## ----------------------------------------------
+    def executeStart(self):
+        if self.item_cache_mode == ITEM_CACHE_PRELOAD:
+            self.item_cache.preload(self.fetchItems)
+
+    ## ----------------------------------------------
+    ## executeFinish
+    ## ----------------------------------------------
+    def executeFinish(self):
+        if self.item_cache != None:
+            logging.info(str(self.item_cache))
+
+    ## ----------------------------------------------
+    ## fetchItems
+    ## Get the ITEM rows of the given ids in one round trip (also used by the
+    ## ItemCache) and return them by I_ID
+    ## ----------------------------------------------
+    def fetchItems(self, i_ids):
+        found = self.conn.get_multi([ "ITEM_"+str(i_id) for i_id in i_ids ])
+        rows = {}
+        for i_id in i_ids:
+            item = found.get("ITEM_"+str(i_id))
+            if item != None:
+                rows[i_id] = item
+        return rows
+
     ## ----------------------------------------------
     ## loadFinish
     ## ----------------------------------------------
@@ -456,12 +491,12 @@ class MembaseDriver(AbstractDriver):
         assert len(i_ids) == len(i_w_ids)
         assert len(i_ids) == len(i_qtys)
         
-        items = []
-        for item_index in i_ids:
-            item_key = "ITEM_"+str(item_index)
-            new_item = self.conn.get(item_key)
-            if new_item != None:
-                items.append(new_item)
+        if self.item_cache != None:
+            rows = self.item_cache.lookup(i_ids, self.fetchItems)
+        else:
+            fetched = self.fetchItems(i_ids)
+            rows = [ fetched.get(i_id) for i_id in i_ids ]
+        items = [ row for row in rows if row != None ]
 
         #-------------------------------------------------------------------------------------
         # For each item on the order:
@@ -545,9 +580,7 @@ class MembaseDriver(AbstractDriver):
             #-------------------------------------------------------------------------------------
             
             i = __getItem(items,idx)
-            item = self.conn.get("ITEM_"+str(idx));
-            if item == None:
-                return
+            item = items[i]
 
             selected_item = return_columns_single_record(["I_PRICE", "I_NAME", "I_DATA"], item, "ITEM");
             i_price = selected_item[0]
@@ -34,14 +34,17 @@
 from __future__ import with_statement
 
 import os
+import re
+import io
+import itertools
 import psycopg2
-from psycopg2.sql import SQL, Identifier
 import logging
-import commands
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint,pformat
 
 import constants
-from abstractdriver import *
+from drivers.abstractdriver import *
+from drivers.connpool import ConnectionPool, threadLocalProperty
 
 TXN_QUERIES = {
     "DELIVERY": {
@@ -100,6 +103,321 @@ TXN_QUERIES = {
     },
 }
 
+## Each transaction as a PL/pgSQL function, so that it only takes a single round trip.
+## They do the same work as the do* methods below. The constants are filled in when
+## the functions get installed.
+TXN_PROCEDURES = """
+CREATE OR REPLACE FUNCTION tpcc_delivery(p_w_id INTEGER, p_o_carrier_id INTEGER, p_ol_delivery_d TIMESTAMP)
+RETURNS TABLE(out_d_id INTEGER, out_o_id INTEGER) AS $$
+DECLARE
+    v_d_id INTEGER;
+    v_o_id INTEGER;
+    v_c_id INTEGER;
+    v_ol_total FLOAT;
+BEGIN
+    FOR v_d_id IN 1..%(districts)d LOOP
+        SELECT NO_O_ID INTO v_o_id FROM NEW_ORDER WHERE NO_D_ID = v_d_id AND NO_W_ID = p_w_id AND NO_O_ID > -1 LIMIT 1;
+        -- No orders for this district: skip it
+        IF NOT FOUND THEN CONTINUE; END IF;
+        
+        SELECT O_C_ID INTO v_c_id FROM ORDERS WHERE O_ID = v_o_id AND O_D_ID = v_d_id AND O_W_ID = p_w_id;
+        SELECT SUM(OL_AMOUNT) INTO v_ol_total FROM ORDER_LINE WHERE OL_O_ID = v_o_id AND OL_D_ID = v_d_id AND OL_W_ID = p_w_id;
+        DELETE FROM NEW_ORDER WHERE NO_D_ID = v_d_id AND NO_W_ID = p_w_id AND NO_O_ID = v_o_id;
+        UPDATE ORDERS SET O_CARRIER_ID = p_o_carrier_id WHERE O_ID = v_o_id AND O_D_ID = v_d_id AND O_W_ID = p_w_id;
+        UPDATE ORDER_LINE SET OL_DELIVERY_D = p_ol_delivery_d WHERE OL_O_ID = v_o_id AND OL_D_ID = v_d_id AND OL_W_ID = p_w_id;
+        UPDATE CUSTOMER SET C_BALANCE = C_BALANCE + v_ol_total WHERE C_ID = v_c_id AND C_D_ID = v_d_id AND C_W_ID = p_w_id;
+        
+        out_d_id := v_d_id;
+        out_o_id := v_o_id;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tpcc_new_order(p_w_id INTEGER, p_d_id INTEGER, p_c_id INTEGER, p_o_entry_d TIMESTAMP,
+                                          p_i_ids INTEGER[], p_i_w_ids INTEGER[], p_i_qtys INTEGER[])
+RETURNS TABLE(out_i_name VARCHAR, out_s_quantity INTEGER, out_brand_generic VARCHAR, out_i_price FLOAT, out_ol_amount FLOAT) AS $$
+DECLARE
+    v_ol_cnt INTEGER := array_length(p_i_ids, 1);
+    v_all_local INTEGER := 1;
+    v_w_tax FLOAT;
+    v_d_tax FLOAT;
+    v_o_id INTEGER;
+    v_c_discount FLOAT;
+    v_i_price FLOAT;
+    v_i_name VARCHAR;
+    v_i_data VARCHAR;
+    v_s_quantity INTEGER;
+    v_s_data VARCHAR;
+    v_s_ytd INTEGER;
+    v_s_order_cnt INTEGER;
+    v_s_remote_cnt INTEGER;
+    v_s_dist_xx VARCHAR;
+    i INTEGER;
+BEGIN
+    FOR i IN 1..v_ol_cnt LOOP
+        IF p_i_w_ids[i] <> p_w_id THEN v_all_local := 0; END IF;
+        -- TPCC defines 1%% of neworder gives a wrong itemid, causing rollback
+        PERFORM 1 FROM ITEM WHERE I_ID = p_i_ids[i];
+        IF NOT FOUND THEN RETURN; END IF;
+    END LOOP;
+    
+    SELECT W_TAX INTO v_w_tax FROM WAREHOUSE WHERE W_ID = p_w_id;
+    SELECT D_TAX, D_NEXT_O_ID INTO v_d_tax, v_o_id FROM DISTRICT WHERE D_ID = p_d_id AND D_W_ID = p_w_id;
+    SELECT C_DISCOUNT INTO v_c_discount FROM CUSTOMER WHERE C_W_ID = p_w_id AND C_D_ID = p_d_id AND C_ID = p_c_id;
+    
+    UPDATE DISTRICT SET D_NEXT_O_ID = v_o_id + 1 WHERE D_ID = p_d_id AND D_W_ID = p_w_id;
+    INSERT INTO ORDERS (O_ID, O_D_ID, O_W_ID, O_C_ID, O_ENTRY_D, O_CARRIER_ID, O_OL_CNT, O_ALL_LOCAL)
+        VALUES (v_o_id, p_d_id, p_w_id, p_c_id, p_o_entry_d, %(null_carrier_id)d, v_ol_cnt, v_all_local);
+    INSERT INTO NEW_ORDER (NO_O_ID, NO_D_ID, NO_W_ID) VALUES (v_o_id, p_d_id, p_w_id);
+    
+    FOR i IN 1..v_ol_cnt LOOP
+        SELECT I_PRICE, I_NAME, I_DATA INTO v_i_price, v_i_name, v_i_data FROM ITEM WHERE I_ID = p_i_ids[i];
+        SELECT S_QUANTITY, S_DATA, S_YTD, S_ORDER_CNT, S_REMOTE_CNT,
+               CASE p_d_id WHEN 1 THEN S_DIST_01 WHEN 2 THEN S_DIST_02 WHEN 3 THEN S_DIST_03 WHEN 4 THEN S_DIST_04
+                           WHEN 5 THEN S_DIST_05 WHEN 6 THEN S_DIST_06 WHEN 7 THEN S_DIST_07 WHEN 8 THEN S_DIST_08
+                           WHEN 9 THEN S_DIST_09 ELSE S_DIST_10 END
+          INTO v_s_quantity, v_s_data, v_s_ytd, v_s_order_cnt, v_s_remote_cnt, v_s_dist_xx
+          FROM STOCK WHERE S_I_ID = p_i_ids[i] AND S_W_ID = p_i_w_ids[i];
+        IF NOT FOUND THEN CONTINUE; END IF;
+        
+        v_s_ytd := v_s_ytd + p_i_qtys[i];
+        IF v_s_quantity >= p_i_qtys[i] + 10 THEN
+            v_s_quantity := v_s_quantity - p_i_qtys[i];
+        ELSE
+            v_s_quantity := v_s_quantity + 91 - p_i_qtys[i];
+        END IF;
+        v_s_order_cnt := v_s_order_cnt + 1;
+        IF p_i_w_ids[i] <> p_w_id THEN v_s_remote_cnt := v_s_remote_cnt + 1; END IF;
+        UPDATE STOCK SET S_QUANTITY = v_s_quantity, S_YTD = v_s_ytd, S_ORDER_CNT = v_s_order_cnt, S_REMOTE_CNT = v_s_remote_cnt
+         WHERE S_I_ID = p_i_ids[i] AND S_W_ID = p_i_w_ids[i];
+        
+        out_i_name := v_i_name;
+        out_s_quantity := v_s_quantity;
+        out_i_price := v_i_price;
+        out_ol_amount := p_i_qtys[i] * v_i_price;
+        IF strpos(v_i_data, '%(original)s') > 0 AND strpos(v_s_data, '%(original)s') > 0 THEN
+            out_brand_generic := 'B';
+        ELSE
+            out_brand_generic := 'G';
+        END IF;
+        
+        INSERT INTO ORDER_LINE (OL_O_ID, OL_D_ID, OL_W_ID, OL_NUMBER, OL_I_ID, OL_SUPPLY_W_ID, OL_DELIVERY_D, OL_QUANTITY, OL_AMOUNT, OL_DIST_INFO)
+            VALUES (v_o_id, p_d_id, p_w_id, i, p_i_ids[i], p_i_w_ids[i], p_o_entry_d, p_i_qtys[i], out_ol_amount, v_s_dist_xx);
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tpcc_order_status(p_w_id INTEGER, p_d_id INTEGER, p_c_id INTEGER, p_c_last VARCHAR)
+RETURNS TABLE(out_ol_supply_w_id INTEGER, out_ol_i_id INTEGER, out_ol_quantity INTEGER, out_ol_amount FLOAT, out_ol_delivery_d TIMESTAMP) AS $$
+DECLARE
+    v_c_id INTEGER := p_c_id;
+    v_c_ids INTEGER[];
+    v_customer RECORD;
+    v_o_id INTEGER;
+BEGIN
+    IF v_c_id IS NULL THEN
+        -- Get the midpoint customer's id
+        SELECT array_agg(C_ID ORDER BY C_FIRST) INTO v_c_ids FROM CUSTOMER WHERE C_W_ID = p_w_id AND C_D_ID = p_d_id AND C_LAST = p_c_last;
+        v_c_id := v_c_ids[(array_length(v_c_ids, 1) - 1) / 2 + 1];
+    END IF;
+    SELECT C_ID, C_FIRST, C_MIDDLE, C_LAST, C_BALANCE INTO v_customer FROM CUSTOMER WHERE C_W_ID = p_w_id AND C_D_ID = p_d_id AND C_ID = v_c_id;
+    
+    SELECT O_ID INTO v_o_id FROM ORDERS WHERE O_W_ID = p_w_id AND O_D_ID = p_d_id AND O_C_ID = v_c_id ORDER BY O_ID DESC LIMIT 1;
+    RETURN QUERY SELECT OL_SUPPLY_W_ID::INTEGER, OL_I_ID, OL_QUANTITY, OL_AMOUNT, OL_DELIVERY_D
+                   FROM ORDER_LINE WHERE OL_W_ID = p_w_id AND OL_D_ID = p_d_id AND OL_O_ID = v_o_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tpcc_payment(p_w_id INTEGER, p_d_id INTEGER, p_h_amount FLOAT, p_c_w_id INTEGER, p_c_d_id INTEGER,
+                                        p_c_id INTEGER, p_c_last VARCHAR, p_h_date TIMESTAMP)
+RETURNS TABLE(out_c_id INTEGER, out_c_balance FLOAT, out_c_credit VARCHAR) AS $$
+DECLARE
+    v_c_id INTEGER := p_c_id;
+    v_c_ids INTEGER[];
+    v_c_balance FLOAT;
+    v_c_ytd_payment FLOAT;
+    v_c_payment_cnt INTEGER;
+    v_c_credit VARCHAR;
+    v_c_data VARCHAR;
+    v_w_name VARCHAR;
+    v_d_name VARCHAR;
+BEGIN
+    IF v_c_id IS NULL THEN
+        -- Get the midpoint customer's id
+        SELECT array_agg(C_ID ORDER BY C_FIRST) INTO v_c_ids FROM CUSTOMER WHERE C_W_ID = p_w_id AND C_D_ID = p_d_id AND C_LAST = p_c_last;
+        v_c_id := v_c_ids[(array_length(v_c_ids, 1) - 1) / 2 + 1];
+    END IF;
+    SELECT C_BALANCE - p_h_amount, C_YTD_PAYMENT + p_h_amount, C_PAYMENT_CNT + 1, C_CREDIT, C_DATA
+      INTO v_c_balance, v_c_ytd_payment, v_c_payment_cnt, v_c_credit, v_c_data
+      FROM CUSTOMER WHERE C_W_ID = p_w_id AND C_D_ID = p_d_id AND C_ID = v_c_id;
+    
+    SELECT W_NAME INTO v_w_name FROM WAREHOUSE WHERE W_ID = p_w_id;
+    SELECT D_NAME INTO v_d_name FROM DISTRICT WHERE D_W_ID = p_w_id AND D_ID = p_d_id;
+    UPDATE WAREHOUSE SET W_YTD = W_YTD + p_h_amount WHERE W_ID = p_w_id;
+    UPDATE DISTRICT SET D_YTD = D_YTD + p_h_amount WHERE D_W_ID = p_w_id AND D_ID = p_d_id;
+    
+    -- Customer Credit Information
+    IF v_c_credit = '%(bad_credit)s' THEN
+        v_c_data := left(concat_ws(' ', v_c_id, p_c_d_id, p_c_w_id, p_d_id, p_w_id, p_h_amount) || '|' || v_c_data, %(max_c_data)d);
+        UPDATE CUSTOMER SET C_BALANCE = v_c_balance, C_YTD_PAYMENT = v_c_ytd_payment, C_PAYMENT_CNT = v_c_payment_cnt, C_DATA = v_c_data
+         WHERE C_W_ID = p_c_w_id AND C_D_ID = p_c_d_id AND C_ID = v_c_id;
+    ELSE
+        UPDATE CUSTOMER SET C_BALANCE = v_c_balance, C_YTD_PAYMENT = v_c_ytd_payment, C_PAYMENT_CNT = v_c_payment_cnt
+         WHERE C_W_ID = p_c_w_id AND C_D_ID = p_c_d_id AND C_ID = v_c_id;
+    END IF;
+    
+    INSERT INTO HISTORY VALUES (v_c_id, p_c_d_id, p_c_w_id, p_d_id, p_w_id, p_h_date, p_h_amount, v_w_name || '    ' || v_d_name);
+    
+    out_c_id := v_c_id;
+    out_c_balance := v_c_balance;
+    out_c_credit := v_c_credit;
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tpcc_stock_level(p_w_id INTEGER, p_d_id INTEGER, p_threshold INTEGER)
+RETURNS BIGINT AS $$
+DECLARE
+    v_o_id INTEGER;
+BEGIN
+    SELECT D_NEXT_O_ID INTO v_o_id FROM DISTRICT WHERE D_W_ID = p_w_id AND D_ID = p_d_id;
+    RETURN (SELECT COUNT(DISTINCT(OL_I_ID)) FROM ORDER_LINE, STOCK
+             WHERE OL_W_ID = p_w_id
+               AND OL_D_ID = p_d_id
+               AND OL_O_ID < v_o_id
+               AND OL_O_ID >= v_o_id - 20
+               AND S_W_ID = p_w_id
+               AND S_I_ID = OL_I_ID
+               AND S_QUANTITY < p_threshold);
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+## The function and the parameters that it gets called with for each transaction
+TXN_PROCEDURE_CALLS = {
+    "DELIVERY": ("tpcc_delivery", [ "w_id", "o_carrier_id", "ol_delivery_d" ]),
+    "NEW_ORDER": ("tpcc_new_order", [ "w_id", "d_id", "c_id", "o_entry_d", "i_ids", "i_w_ids", "i_qtys" ]),
+    "ORDER_STATUS": ("tpcc_order_status", [ "w_id", "d_id", "c_id", "c_last" ]),
+    "PAYMENT": ("tpcc_payment", [ "w_id", "d_id", "h_amount", "c_w_id", "c_d_id", "c_id", "c_last", "h_date" ]),
+    "STOCK_LEVEL": ("tpcc_stock_level", [ "w_id", "d_id", "threshold" ]),
+}
+
+## ==============================================
+## makeQueries
+## ==============================================
+def makeQueries():
+    """Copy TXN_QUERIES, with a getStockInfo query for the S_DIST_XX column of every district"""
+    queries = dict([ (txn, dict(q)) for txn, q in TXN_QUERIES.items() ])
+    getStockInfo = queries["NEW_ORDER"].pop("getStockInfo")
+    for d_id in range(1, constants.DISTRICTS_PER_WAREHOUSE+1):
+        queries["NEW_ORDER"]["getStockInfo%02d" % d_id] = getStockInfo.format("S_DIST_%02d" % d_id)
+    return queries
+## DEF
+
+## Ways of loading the initial data
+LOAD_INSERT = "insert"
+LOAD_COPY = "copy"
+LOAD_MODES = [ LOAD_INSERT, LOAD_COPY ]
+
+## Ways of running the transactions
+TXN_SIMPLE = "simple"
+TXN_PREPARED = "prepared"
+TXN_PROCEDURE = "procedure"
+TXN_MODES = [ TXN_SIMPLE, TXN_PREPARED, TXN_PROCEDURE ]
+
+## SQLSTATE of a transaction that was picked as a deadlock victim
+DEADLOCK_DETECTED = "40P01"
+
+## Advisory lock that serializes the schema changes of concurrent loaders
+LOAD_LOCK = 0x54504343
+
+## ==============================================
+## splitDDL
+## ==============================================
+def splitDDL(ddl):
+    """
+        Split the DDL into CREATE TABLE statements without any keys or
+        references, and the statements that add the primary keys, unique
+        constraints, indexes and foreign keys back once the data is in.
+    """
+    tables = [ ]
+    keys = [ ]
+    indexes = [ ]
+    foreignKeys = [ ]
+    for stmt in ddl.split(";"):
+        stmt = "\n".join([ line for line in stmt.splitlines() if not line.strip().startswith("--") ]).strip()
+        if not stmt: continue
+        m = re.match(r"CREATE\s+TABLE\s+(\w+)\s*\((.*)\)$", stmt, re.S | re.I)
+        if m == None:
+            indexes.append(stmt)
+            continue
+        
+        tableName = m.group(1)
+        columns = [ ]
+        for item in splitColumns(m.group(2)):
+            ref = re.search(r"\s+REFERENCES\s+\w+\s*\([^)]*\)", item, re.I)
+            if re.match(r"(CONSTRAINT|PRIMARY\s+KEY|UNIQUE|FOREIGN\s+KEY)\b", item, re.I):
+                alter = "ALTER TABLE %s ADD %s" % (tableName, item)
+                if re.search(r"FOREIGN\s+KEY", item, re.I):
+                    foreignKeys.append(alter)
+                else:
+                    keys.append(alter)
+            elif ref != None:
+                columns.append(item[:ref.start()] + item[ref.end():])
+                foreignKeys.append("ALTER TABLE %s ADD FOREIGN KEY (%s) %s" % (tableName, item.split()[0], ref.group(0).strip()))
+            else:
+                columns.append(item)
+        ## FOR
+        tables.append("CREATE TABLE %s (\n  %s\n)" % (tableName, ",\n  ".join(columns)))
+    ## FOR
+    return (tables, keys + indexes + foreignKeys)
+## DEF
+
+## ==============================================
+## splitColumns
+## ==============================================
+def splitColumns(body):
+    """Split the body of a CREATE TABLE on the commas that are not inside parentheses"""
+    items = [ ]
+    depth = 0
+    start = 0
+    for i, c in enumerate(body):
+        if c == "(": depth += 1
+        elif c == ")": depth -= 1
+        elif c == "," and depth == 0:
+            items.append(body[start:i].strip())
+            start = i + 1
+    ## FOR
+    items.append(body[start:].strip())
+    return [ item for item in items if item ]
+## DEF
+
+## ==============================================
+## copyValue
+## ==============================================
+def copyValue(value):
+    """Format a value for COPY's text format"""
+    if value == None: return "\\N"
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    if isinstance(value, float): return repr(value)
+    return str(value)
+## DEF
+
+## ==============================================
+## BATCH_QUERIES
+## ==============================================
+## Variants of the NEW_ORDER queries that handle all of the order lines at once
+## (see PostgresDriver.doNewOrder). The lists of values are filled in per order.
+BATCH_QUERIES = {
+    "NEW_ORDER": {
+        "getItemInfo": "SELECT I_ID, I_PRICE, I_NAME, I_DATA FROM ITEM WHERE I_ID IN ({})", # ol_i_ids
+        "getStockInfo": "SELECT S_I_ID, S_W_ID, S_QUANTITY, S_DATA, S_YTD, S_ORDER_CNT, S_REMOTE_CNT, S_DIST_{:02d} FROM STOCK WHERE (S_I_ID, S_W_ID) IN ({})", # d_id, (ol_i_id, ol_supply_w_id)s
+        "createOrderLines": "INSERT INTO ORDER_LINE (OL_O_ID, OL_D_ID, OL_W_ID, OL_NUMBER, OL_I_ID, OL_SUPPLY_W_ID, OL_DELIVERY_D, OL_QUANTITY, OL_AMOUNT, OL_DIST_INFO) VALUES {}", # (o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, ol_quantity, ol_amount, ol_dist_info)s
+    },
+}
 
 ## ==============================================
 ## PostgresDriver
@@ -108,13 +426,36 @@ class PostgresDriver(AbstractDriver):
     DEFAULT_CONFIG = {
         "database": ("The connection string to the PostgreSQL database", "host=localhost dbname=tpcc" ),
         "schema": ("The schema in PostgreSQL database", "public" ),
+        "load_mode": ("How to load the data: '%s' (batched INSERTs) or '%s' (COPY, with the keys and indexes created at the end)" % (LOAD_INSERT, LOAD_COPY), LOAD_INSERT ),
+        "load_connections": ("Number of connections that COPY different tables in parallel", 1 ),
+        "txn_mode": ("How to run the transactions: '%s' (one statement at a time), '%s' (PREPAREd statements) or '%s' (PL/pgSQL functions, one round trip each)" % (TXN_SIMPLE, TXN_PREPARED, TXN_PROCEDURE), TXN_SIMPLE ),
+        "pool_size": ("Number of connections that the transactions are spread over by warehouse. With more than one, a single driver can serve several threads", 1 ),
+        "batch_new_order": ("Fetch the items and the stock records of a NEW_ORDER with one query each, and insert its order lines with a single INSERT", False ),
     }
     
+    ## Every thread uses the pooled connection that it is holding
+    conn = threadLocalProperty("conn")
+    cursor = threadLocalProperty("cursor")
+    
     def __init__(self, ddl):
         super(PostgresDriver, self).__init__("postgres", ddl)
         self.database = None
         self.conn = None
         self.cursor = None
+        self.pool = None
+        self.pool_size = 1
+        self.prepares = [ ]
+        self.load_mode = LOAD_INSERT
+        self.txn_mode = TXN_SIMPLE
+        self.queries = makeQueries()
+        self.copy_conns = [ ]
+        self.copy_pools = [ ]
+        self.pending = [ ]
+        self.batch_new_order = False
+    
+    def __str__(self):
+        if self.txn_mode == TXN_SIMPLE: return self.driver_name
+        return "%s (%s)" % (self.driver_name, self.txn_mode)
     
     ## ----------------------------------------------
     ## makeDefaultConfig
@@ -133,10 +474,24 @@ class PostgresDriver(AbstractDriver):
         self.schema = config["schema"]
 
         self.reset = bool(config["reset"])
+        self.load_mode = config["load_mode"]
+        assert self.load_mode in LOAD_MODES, "Invalid load_mode '%s'" % self.load_mode
+        self.load_connections = int(config["load_connections"])
+        self.pool_size = int(config["pool_size"])
+        self.txn_mode = config["txn_mode"]
+        assert self.txn_mode in TXN_MODES, "Invalid txn_mode '%s'" % self.txn_mode
+        self.batch_new_order = str(config["batch_new_order"]).lower() == "true"
                     
-        self.conn = psycopg2.connect(self.database)
+        self.conn = self.connect()
         self.cursor = self.conn.cursor()
-        self.cursor.execute("SET search_path TO %s"%self.schema)
+    
+    ## ----------------------------------------------
+    ## connect
+    ## ----------------------------------------------
+    def connect(self):
+        conn = psycopg2.connect(self.database)
+        conn.cursor().execute("SET search_path TO %s"%self.schema)
+        return conn
 
     ## ----------------------------------------------
     ## loadStart
@@ -149,12 +504,21 @@ class PostgresDriver(AbstractDriver):
             self.cursor.execute("DROP DOMAIN IF EXISTS TINYINT")
             self.conn.commit()
 
+        ## Parallel loaders must not all try to create the tables
+        self.cursor.execute("SELECT pg_advisory_xact_lock(%s)", (LOAD_LOCK,))
         self.cursor.execute("select * from information_schema.tables where table_name=%s", ('order_line',))
         if self.cursor.rowcount <= 0:
             logging.debug("Loading DDL file '%s'" % (self.ddl))
             self.cursor.execute("CREATE DOMAIN TINYINT AS SMALLINT")
-            self.cursor.execute(open(self.ddl, "r").read())
-            self.conn.commit()
+            ddl = open(self.ddl, "r").read()
+            if self.load_mode == LOAD_COPY:
+                ddl = ";\n".join(splitDDL(ddl)[0])
+            self.cursor.execute(ddl)
+        self.conn.commit()
+        
+        if self.load_mode == LOAD_COPY and self.load_connections > 1:
+            self.copy_conns = [ self.connect() for i in range(self.load_connections) ]
+            self.copy_pools = [ ThreadPoolExecutor(max_workers=1) for i in range(self.load_connections) ]
 
     ## ----------------------------------------------
     ## loadTuples
@@ -162,6 +526,10 @@ class PostgresDriver(AbstractDriver):
     def loadTuples(self, tableName, tuples):
         if len(tuples) == 0: return
         
+        if self.load_mode == LOAD_COPY:
+            self.copyTuples(tableName, tuples)
+            return
+        
         p = ["%s"]*len(tuples[0])
         sql = "INSERT INTO %s VALUES (%s)" % (tableName, ",".join(p))
         self.cursor.executemany(sql, tuples)
@@ -170,18 +538,202 @@ class PostgresDriver(AbstractDriver):
         logging.debug("Loaded %d tuples for tableName %s" % (len(tuples), tableName))
         return
 
+    ## ----------------------------------------------
+    ## copyTuples
+    ## ----------------------------------------------
+    def copyTuples(self, tableName, tuples):
+        """Stream the tuples into the table with COPY, either right away or on the table's own connection"""
+        buf = io.StringIO()
+        for t in tuples:
+            buf.write("\t".join(map(copyValue, t)))
+            buf.write("\n")
+        buf.seek(0)
+        
+        if not self.copy_conns:
+            self.copyBuffer(self.conn, tableName, buf, len(tuples))
+            return
+        ## Tables are spread over the connections, and each connection
+        ## runs its COPYs in order
+        idx = constants.ALL_TABLES.index(tableName) % len(self.copy_conns)
+        self.pending.append(self.copy_pools[idx].submit(self.copyBuffer, self.copy_conns[idx], tableName, buf, len(tuples)))
+        
+    def copyBuffer(self, conn, tableName, buf, count):
+        cursor = conn.cursor()
+        cursor.copy_expert("COPY %s FROM STDIN" % tableName, buf)
+        conn.commit()
+        logging.debug("Copied %d tuples for tableName %s" % (count, tableName))
+        
+    ## ----------------------------------------------
+    ## waitForCopies
+    ## ----------------------------------------------
+    def waitForCopies(self):
+        """Block until all of the COPYs running on the other connections are committed"""
+        pending = self.pending
+        self.pending = [ ]
+        for f in pending: f.result()
+
+    ## ----------------------------------------------
+    ## loadFinishItem
+    ## ----------------------------------------------
+    def loadFinishItem(self):
+        self.waitForCopies()
+
+    ## ----------------------------------------------
+    ## loadFinishWarehouse
+    ## ----------------------------------------------
+    def loadFinishWarehouse(self, w_id):
+        self.waitForCopies()
+
+    ## ----------------------------------------------
+    ## loadFinishDistrict
+    ## ----------------------------------------------
+    def loadFinishDistrict(self, w_id, d_id):
+        ## Everything of a work unit has to be in before the next phase starts
+        self.waitForCopies()
+
     ## ----------------------------------------------
     ## loadFinish
     ## ----------------------------------------------
     def loadFinish(self):
+        self.waitForCopies()
+        for pool in self.copy_pools: pool.shutdown()
+        for conn in self.copy_conns: conn.close()
+        self.copy_pools = [ ]
+        self.copy_conns = [ ]
+        
         logging.info("Commiting changes to database")
         self.conn.commit()
+        
+        if self.load_mode == LOAD_COPY:
+            self.createKeys()
+
+    ## ----------------------------------------------
+    ## createKeys
+    ## ----------------------------------------------
+    def createKeys(self):
+        """Add the keys, indexes and foreign keys that were left out of the DDL in copy mode.
+        With parallel loaders, whoever gets here first does it for everybody, since by then
+        every work unit has been committed."""
+        self.cursor.execute("SELECT pg_advisory_xact_lock(%s)", (LOAD_LOCK,))
+        self.cursor.execute("SELECT COUNT(*) FROM information_schema.table_constraints WHERE table_schema = %s AND constraint_type = 'PRIMARY KEY'", (self.schema,))
+        if self.cursor.fetchone()[0] == 0:
+            logging.info("Creating indexes and foreign keys")
+            for stmt in splitDDL(open(self.ddl, "r").read())[1]:
+                logging.debug(stmt)
+                self.cursor.execute(stmt)
+        ## IF
+        self.conn.commit()
+
+    ## ----------------------------------------------
+    ## executeStart
+    ## ----------------------------------------------
+    def executeStart(self):
+        setup = None
+        if self.txn_mode == TXN_PREPARED:
+            self.prepareQueries()
+            setup = self.prepareConnection
+        elif self.txn_mode == TXN_PROCEDURE:
+            self.installProcedures()
+        self.pool = ConnectionPool(self.connect, self.pool_size, setup, first=self.conn)
+        
+    ## ----------------------------------------------
+    ## executeFinish
+    ## ----------------------------------------------
+    def executeFinish(self):
+        if self.pool != None: self.pool.close()
+        self.pool = None
+
+    ## ----------------------------------------------
+    ## prepareQueries
+    ## ----------------------------------------------
+    def prepareQueries(self):
+        """Turn every query into the EXECUTE of a prepared statement. The PREPAREs
+        are run on each connection by prepareConnection."""
+        for txn, queries in self.queries.items():
+            for name, sql in queries.items():
+                stmt = ("%s_%s" % (txn, name)).lower()
+                num = itertools.count(1)
+                sql = re.sub(r"%s", lambda m: "$%d" % next(num), sql)
+                self.prepares.append("PREPARE %s AS %s" % (stmt, sql))
+                
+                args = next(num) - 1
+                queries[name] = "EXECUTE %s (%s)" % (stmt, ", ".join(["%s"]*args)) if args else "EXECUTE %s" % stmt
+            ## FOR
+        ## FOR
+
+    ## ----------------------------------------------
+    ## prepareConnection
+    ## ----------------------------------------------
+    def prepareConnection(self, conn):
+        cursor = conn.cursor()
+        for stmt in self.prepares: cursor.execute(stmt)
+        conn.commit()
+        logging.debug("Prepared the %s queries" % self.name)
+
+    ## ----------------------------------------------
+    ## installProcedures
+    ## ----------------------------------------------
+    def installProcedures(self):
+        """(Re)create the PL/pgSQL functions of the transactions. Clients take turns,
+        since concurrent CREATE OR REPLACE FUNCTIONs of the same function fail."""
+        self.cursor.execute("SELECT pg_advisory_xact_lock(%s)", (LOAD_LOCK,))
+        self.cursor.execute(TXN_PROCEDURES % {
+            "districts": constants.DISTRICTS_PER_WAREHOUSE,
+            "null_carrier_id": constants.NULL_CARRIER_ID,
+            "original": constants.ORIGINAL_STRING,
+            "bad_credit": constants.BAD_CREDIT,
+            "max_c_data": constants.MAX_C_DATA,
+        })
+        self.conn.commit()
+        logging.debug("Installed the %s stored procedures" % self.name)
+
+    ## ----------------------------------------------
+    ## executeTransaction
+    ## ----------------------------------------------
+    def executeTransaction(self, txn, params):
+        with self.pool.connection(params.get("w_id")) as slot:
+            self.conn = slot.conn
+            self.cursor = slot.cursor
+            try:
+                if self.txn_mode == TXN_PROCEDURE:
+                    return self.callProcedure(txn, params)
+                return super(PostgresDriver, self).executeTransaction(txn, params)
+            except psycopg2.extensions.TransactionRollbackError as ex:
+                ## Serialization failures and deadlocks: the transaction can just be run again
+                reason = "deadlock" if ex.pgcode == DEADLOCK_DETECTED else "serialization"
+                raise ConflictError(str(ex), reason)
+
+    ## ----------------------------------------------
+    ## getMode
+    ## ----------------------------------------------
+    def getMode(self):
+        return self.txn_mode
+
+    ## ----------------------------------------------
+    ## isThreadSafe
+    ## ----------------------------------------------
+    def isThreadSafe(self):
+        return self.pool_size > 1
+
+    ## ----------------------------------------------
+    ## callProcedure
+    ## ----------------------------------------------
+    def callProcedure(self, txn, params):
+        """Run the whole transaction with a single call to its function"""
+        function, names = TXN_PROCEDURE_CALLS[txn]
+        args = [ params[name] for name in names ]
+        self.cursor.execute("SELECT * FROM %s(%s)" % (function, ", ".join(["%s"]*len(args))), args)
+        result = self.cursor.fetchall()
+        self.conn.commit()
+        
+        if txn == "STOCK_LEVEL": return int(result[0][0])
+        return result
 
     ## ----------------------------------------------
     ## doDelivery
     ## ----------------------------------------------
     def doDelivery(self, params):
-        q = TXN_QUERIES["DELIVERY"]
+        q = self.queries["DELIVERY"]
         
         w_id = params["w_id"]
         o_carrier_id = params["o_carrier_id"]
@@ -226,7 +778,7 @@ class PostgresDriver(AbstractDriver):
     ## doNewOrder
     ## ----------------------------------------------
     def doNewOrder(self, params):
-        q = TXN_QUERIES["NEW_ORDER"]
+        q = self.queries["NEW_ORDER"]
         
         w_id = params["w_id"]
         d_id = params["d_id"]
@@ -241,18 +793,16 @@ class PostgresDriver(AbstractDriver):
         assert len(i_ids) == len(i_qtys)
 
         all_local = True
-        items = [ ]
         for i in range(len(i_ids)):
             ## Determine if this is an all local order or not
             all_local = all_local and i_w_ids[i] == w_id
-            self.cursor.execute(q["getItemInfo"], [i_ids[i]])
-            items.append(self.cursor.fetchone())
+        items = self.getNewOrderItems(i_ids)
         assert len(items) == len(i_ids)
         
         ## TPCC defines 1% of neworder gives a wrong itemid, causing rollback.
         ## Note that this will happen with 1% of transactions on purpose.
         for item in items:
-            if len(item) == 0:
+            if item == None:
                 ## TODO Abort here!
                 return
         ## FOR
@@ -285,6 +835,9 @@ class PostgresDriver(AbstractDriver):
         ## ----------------
         ## Insert Order Item Information
         ## ----------------
+        stocks = self.getNewOrderStocks(d_id, i_ids, i_w_ids)
+        stock_updates = [ ]
+        order_lines = [ ]
         item_data = [ ]
         total = 0
         for i in range(len(i_ids)):
@@ -298,9 +851,8 @@ class PostgresDriver(AbstractDriver):
             i_data = itemInfo[2]
             i_price = itemInfo[0]
 
-            self.cursor.execute(SQL(q["getStockInfo"]).format(Identifier('s_dist_%02d'%d_id)), [ol_i_id, ol_supply_w_id])
-            stockInfo = self.cursor.fetchone()
-            if len(stockInfo) == 0:
+            stockInfo = stocks[i]
+            if stockInfo == None:
                 logging.warn("No STOCK record for (ol_i_id=%d, ol_supply_w_id=%d)" % (ol_i_id, ol_supply_w_id))
                 continue
             s_quantity = stockInfo[0]
@@ -320,7 +872,7 @@ class PostgresDriver(AbstractDriver):
             
             if ol_supply_w_id != w_id: s_remote_cnt += 1
 
-            self.cursor.execute(q["updateStock"], [s_quantity, s_ytd, s_order_cnt, s_remote_cnt, ol_i_id, ol_supply_w_id])
+            stock_updates.append([s_quantity, s_ytd, s_order_cnt, s_remote_cnt, ol_i_id, ol_supply_w_id])
 
             if i_data.find(constants.ORIGINAL_STRING) != -1 and s_data.find(constants.ORIGINAL_STRING) != -1:
                 brand_generic = 'B'
@@ -331,12 +883,14 @@ class PostgresDriver(AbstractDriver):
             ol_amount = ol_quantity * i_price
             total += ol_amount
 
-            self.cursor.execute(q["createOrderLine"], [d_next_o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, o_entry_d, ol_quantity, ol_amount, s_dist_xx])
+            order_lines.append([d_next_o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, o_entry_d, ol_quantity, ol_amount, s_dist_xx])
 
             ## Add the info to be returned
             item_data.append( (i_name, s_quantity, brand_generic, i_price, ol_amount) )
         ## FOR
         
+        if order_lines: self.writeNewOrderLines(stock_updates, order_lines)
+        
         ## Commit!
         self.conn.commit()
 
@@ -351,11 +905,66 @@ class PostgresDriver(AbstractDriver):
         
         return [ customer_info, misc, item_data ]
 
+    ## ----------------------------------------------
+    ## getNewOrderItems
+    ## ----------------------------------------------
+    def getNewOrderItems(self, i_ids):
+        """Return the (I_PRICE, I_NAME, I_DATA) of every item, or None for the ones
+        that do not exist. With batch_new_order they are all fetched with one query."""
+        if not self.batch_new_order:
+            items = [ ]
+            for i_id in i_ids:
+                self.cursor.execute(self.queries["NEW_ORDER"]["getItemInfo"], [i_id])
+                items.append(self.cursor.fetchone())
+            return items
+        
+        self.cursor.execute(BATCH_QUERIES["NEW_ORDER"]["getItemInfo"].format(",".join(["%s"]*len(i_ids))), i_ids)
+        items = dict([ (r[0], r[1:]) for r in self.cursor.fetchall() ])
+        return [ items.get(i_id) for i_id in i_ids ]
+
+    ## ----------------------------------------------
+    ## getNewOrderStocks
+    ## ----------------------------------------------
+    def getNewOrderStocks(self, d_id, i_ids, i_w_ids):
+        """Return the (S_QUANTITY, S_DATA, S_YTD, S_ORDER_CNT, S_REMOTE_CNT, S_DIST_xx) of
+        every order line, or None when its STOCK record is missing. With batch_new_order
+        they are all fetched with one query."""
+        if not self.batch_new_order:
+            stocks = [ ]
+            for i in range(len(i_ids)):
+                self.cursor.execute(self.queries["NEW_ORDER"]["getStockInfo%02d" % d_id], [i_ids[i], i_w_ids[i]])
+                stocks.append(self.cursor.fetchone())
+            return stocks
+        
+        keys = [ ]
+        for i in range(len(i_ids)): keys.extend([ i_ids[i], i_w_ids[i] ])
+        self.cursor.execute(BATCH_QUERIES["NEW_ORDER"]["getStockInfo"].format(d_id, ",".join(["(%s,%s)"]*len(i_ids))), keys)
+        stocks = dict([ ((r[0], r[1]), r[2:]) for r in self.cursor.fetchall() ])
+        return [ stocks.get((i_ids[i], i_w_ids[i])) for i in range(len(i_ids)) ]
+
+    ## ----------------------------------------------
+    ## writeNewOrderLines
+    ## ----------------------------------------------
+    def writeNewOrderLines(self, stock_updates, order_lines):
+        """Update the STOCK records and insert the ORDER_LINEs of an order. With
+        batch_new_order all of the order lines go in a single INSERT."""
+        q = self.queries["NEW_ORDER"]
+        if not self.batch_new_order:
+            for i in range(len(order_lines)):
+                self.cursor.execute(q["updateStock"], stock_updates[i])
+                self.cursor.execute(q["createOrderLine"], order_lines[i])
+            return
+        
+        self.cursor.executemany(q["updateStock"], stock_updates)
+        values = [ ]
+        for line in order_lines: values.extend(line)
+        self.cursor.execute(BATCH_QUERIES["NEW_ORDER"]["createOrderLines"].format(",".join(["(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)"]*len(order_lines))), values)
+
     ## ----------------------------------------------
     ## doOrderStatus
     ## ----------------------------------------------
     def doOrderStatus(self, params):
-        q = TXN_QUERIES["ORDER_STATUS"]
+        q = self.queries["ORDER_STATUS"]
         
         w_id = params["w_id"]
         d_id = params["d_id"]
@@ -395,7 +1004,7 @@ class PostgresDriver(AbstractDriver):
     ## doPayment
     ## ----------------------------------------------    
     def doPayment(self, params):
-        q = TXN_QUERIES["PAYMENT"]
+        q = self.queries["PAYMENT"]
 
         w_id = params["w_id"]
         d_id = params["d_id"]
@@ -464,7 +1073,7 @@ class PostgresDriver(AbstractDriver):
     ## doStockLevel
     ## ----------------------------------------------    
     def doStockLevel(self, params):
-        q = TXN_QUERIES["STOCK_LEVEL"]
+        q = self.queries["STOCK_LEVEL"]
 
         w_id = params["w_id"]
         d_id = params["d_id"]
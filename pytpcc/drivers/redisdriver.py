@@ -2,6 +2,7 @@ import os, redis, time, sys
 from datetime import datetime
 from pprint import pprint,pformat
 from abstractdriver import *
+from itemcache import *
 
 #----------------------------------------------------------------------------
 # Redis TPC-C Driver
@@ -297,6 +298,7 @@ class RedisDriver(AbstractDriver):
 		'debug-order-status' : ("Show Order Status Performance", 'None'),
 		'debug-payment' : ("Show Payment Performance", 'None'),
 		'debug-stock-level' : ("Show Stock Level Performance", 'None'),
+		'item-cache' : ("Cache the ITEM rows that NEW_ORDER reads on the client (%s)" % ", ".join(ITEM_CACHE_MODES), ITEM_CACHE_OFF),
 	}
 	
 	#------------------------------------------------------------------------
@@ -323,6 +325,8 @@ class RedisDriver(AbstractDriver):
 			'stock-level'  : 'None',
 		}
 		self.hosts = [ ]
+		self.item_cache_mode = ITEM_CACHE_OFF
+		self.item_cache = None
 	# End __init__()
 	
 	#------------------------------------------------------------------------
@@ -574,24 +578,17 @@ class RedisDriver(AbstractDriver):
 
 		# Check if all items are local
 		all_local = True
-		items = [ ]
-		pipe_results = [ ]
 		for i in range(len(i_ids)):
 			all_local = all_local and i_w_ids[i] == w_id
-			rdr.hgetall('ITEM.' + str(i_ids[i]))
-		pipe_results = rdr.execute()
 		
-		for pr in pipe_results :
-			if len(pr) > 0 :
-				if pr['I_PRICE'] == None and pr['I_NAME'] == None and pr['I_DATA'] == None :
-					result = [ ]
-				items.append([
-					pr['I_PRICE'],
-					pr['I_NAME'],
-					pr['I_DATA'],
-				])
-			else :
-				items.append([])
+		# Get the items, from the client-side cache if there is one
+		fetch = lambda ids : self.fetchItems(rdr, ids)
+		if self.item_cache != None :
+			rows = self.item_cache.lookup(i_ids, fetch)
+		else :
+			fetched = fetch(i_ids)
+			rows = [ fetched.get(i_id) for i_id in i_ids ]
+		items = [ row if row != None else [ ] for row in rows ]
 				
 		assert len(items) == len(i_ids)
 		
@@ -1326,6 +1323,9 @@ class RedisDriver(AbstractDriver):
 		self.debug['payment'] = config['debug-payment']
 		self.debug['stock-level'] = config['debug-stock-level']
 		
+		self.item_cache_mode = config['item-cache']
+		self.item_cache = makeItemCache(self.item_cache_mode)
+		
 		if config['host-info'] != 'None' :
 			print 'TPC-C Benchmark Running on Redis with %s nodes' % (len(hosts))
 		if config['host-info'] == 'Verbose' :
@@ -1334,6 +1334,23 @@ class RedisDriver(AbstractDriver):
 				print 'Host: %s | Port: %s' % (db, port)
 		# End loadConfig()
 
+	#------------------------------------------------------------------------
+	# Pre-processing function for the execution phase
+	#------------------------------------------------------------------------
+	def executeStart(self) :
+		if self.item_cache_mode == ITEM_CACHE_PRELOAD :
+			# Every node has a copy of the ITEM table
+			self.item_cache.preload(lambda ids : self.fetchItems(self.r_pipes[0], ids))
+	# End executeStart()
+	
+	#------------------------------------------------------------------------
+	# Post-processing function for the execution phase
+	#------------------------------------------------------------------------
+	def executeFinish(self) :
+		if self.item_cache != None :
+			print str(self.item_cache)
+	# End executeFinish()
+	
 	#------------------------------------------------------------------------
 	# Post-processing function for data loading
 	#------------------------------------------------------------------------
@@ -1638,6 +1655,29 @@ class RedisDriver(AbstractDriver):
 		return self.DEFAULT_CONFIG
 	# End makeDefaultConfig()
 	
+	#------------------------------------------------------------------------
+	# Get the ITEM columns that NEW_ORDER needs (also used by the ItemCache)
+	#
+	# @param pipeline rdr (read pipeline of the node to read from)
+	# @param list i_ids item ids
+	# @return dictionary with [I_PRICE, I_NAME, I_DATA] of every item that exists
+	#------------------------------------------------------------------------
+	def fetchItems(self, rdr, i_ids) :
+		for i_id in i_ids :
+			rdr.hgetall('ITEM.' + str(i_id))
+		pipe_results = rdr.execute()
+		
+		rows = { }
+		for i_id, pr in zip(i_ids, pipe_results) :
+			if len(pr) > 0 :
+				rows[i_id] = [
+					pr['I_PRICE'],
+					pr['I_NAME'],
+					pr['I_DATA'],
+				]
+		return rows
+	# End fetchItems()
+	
 	#------------------------------------------------------------------------
 	# Create a safe key for Redis by removing invalid characters from 
 	# input list
@@ -32,13 +32,15 @@
 from __future__ import with_statement
 
 import os
+import time
+import random
 import sqlite3
 import logging
-import commands
 from pprint import pprint,pformat
 
 import constants
-from abstractdriver import *
+from drivers.abstractdriver import *
+from drivers.connpool import ConnectionPool, threadLocalProperty
 
 TXN_QUERIES = {
     "DELIVERY": {
@@ -97,20 +99,75 @@ TXN_QUERIES = {
     },
 }
 
+## Variants of the NEW_ORDER queries that handle all of the order lines at once
+## (see SqliteDriver.doNewOrder). The lists of values are filled in per order.
+BATCH_QUERIES = {
+    "NEW_ORDER": {
+        "getItemInfo": "SELECT I_ID, I_PRICE, I_NAME, I_DATA FROM ITEM WHERE I_ID IN (%s)", # ol_i_ids
+        "getStockInfo": "SELECT S_I_ID, S_W_ID, S_QUANTITY, S_DATA, S_YTD, S_ORDER_CNT, S_REMOTE_CNT, S_DIST_%02d FROM STOCK WHERE (S_I_ID, S_W_ID) IN (%s)", # d_id, (ol_i_id, ol_supply_w_id)s
+        "createOrderLines": "INSERT INTO ORDER_LINE (OL_O_ID, OL_D_ID, OL_W_ID, OL_NUMBER, OL_I_ID, OL_SUPPLY_W_ID, OL_DELIVERY_D, OL_QUANTITY, OL_AMOUNT, OL_DIST_INFO) VALUES %s", # (o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, ol_quantity, ol_amount, ol_dist_info)s
+    },
+}
+
+## The database name that keeps everything in memory. All of the driver's connections
+## share the same in-memory database, so it has to be loaded and run by a single process.
+MEMORY_DATABASE = ":memory:"
+MEMORY_URI = "file:tpcc?mode=memory&cache=shared"
+
+## Upper bound of the backoff between retries of a transaction that found the database locked
+MAX_BUSY_BACKOFF = 0.1
+
+## How many times a batch of loaded tuples is retried when the database is
+## locked. Parallel loaders only hold the lock for one batch at a time, so they
+## get to wait much longer than a transaction does.
+LOAD_BUSY_RETRIES = 200
+
+## Jitters the backoff. Separate from util.rand, so that it does not disturb seeded runs.
+BACKOFF_RANDOM = random.Random()
+
+## ==============================================
+## isBusy
+## ==============================================
+def isBusy(ex):
+    """Whether the error means that another connection is holding the lock"""
+    msg = str(ex)
+    return msg.find("locked") != -1 or msg.find("busy") != -1
+## DEF
 
 ## ==============================================
 ## SqliteDriver
 ## ==============================================
 class SqliteDriver(AbstractDriver):
     DEFAULT_CONFIG = {
-        "database": ("The path to the SQLite database", "/tmp/tpcc.db" ),
+        "database": ("The path to the SQLite database, or '%s' for a shared in-memory database (single process only)" % MEMORY_DATABASE, "/tmp/tpcc.db" ),
+        "journal_mode": ("The journal_mode pragma (DELETE, TRUNCATE, WAL, MEMORY, OFF)", "DELETE" ),
+        "synchronous": ("The synchronous pragma (OFF, NORMAL, FULL). NORMAL is safe with WAL", "FULL" ),
+        "cache_size": ("The cache_size pragma: pages if positive, KiB if negative", -2000 ),
+        "mmap_size": ("The mmap_size pragma: bytes of the database file to memory-map (0 disables it)", 0 ),
+        "busy_timeout": ("Milliseconds that SQLite itself waits for a lock before a statement fails", 100 ),
+        "busy_retries": ("How many times a transaction that could not get the database lock is retried", 10 ),
+        "busy_backoff": ("Milliseconds to wait before the first retry of a transaction. It doubles with every retry, up to %d ms" % (MAX_BUSY_BACKOFF * 1000), 1 ),
+        "pool_size": ("Number of connections that the transactions are spread over by warehouse. With more than one, a single driver can serve several threads", 1 ),
+        "batch_new_order": ("Fetch the items and the stock records of a NEW_ORDER with one query each, and insert its order lines with a single INSERT", False ),
     }
     
+    ## Every thread uses the pooled connection that it is holding
+    conn = threadLocalProperty("conn")
+    cursor = threadLocalProperty("cursor")
+    retry_stats = threadLocalProperty("retry_stats")
+    
     def __init__(self, ddl):
         super(SqliteDriver, self).__init__("sqlite", ddl)
         self.database = None
         self.conn = None
         self.cursor = None
+        self.pool = None
+        self.pool_size = 1
+        self.batch_new_order = False
+        self.pragmas = [ ]
+        self.busy_timeout = 5.0
+        self.busy_retries = 0
+        self.busy_backoff = 0.001
     
     ## ----------------------------------------------
     ## makeDefaultConfig
@@ -126,21 +183,47 @@ class SqliteDriver(AbstractDriver):
             assert key in config, "Missing parameter '%s' in %s configuration" % (key, self.name)
         
         self.database = str(config["database"])
+        self.batch_new_order = str(config["batch_new_order"]).lower() == "true"
+        self.pool_size = int(config["pool_size"])
+        self.pragmas = [
+            ("journal_mode", str(config["journal_mode"]).upper()),
+            ("synchronous", str(config["synchronous"]).upper()),
+            ("cache_size", int(config["cache_size"])),
+            ("mmap_size", int(config["mmap_size"])),
+        ]
+        self.busy_timeout = int(config["busy_timeout"]) / 1000.0
+        self.busy_retries = int(config["busy_retries"])
+        self.busy_backoff = float(config["busy_backoff"]) / 1000.0
         
-        if config["reset"] and os.path.exists(self.database):
-            logging.debug("Deleting database '%s'" % self.database)
-            os.unlink(self.database)
-        
-        if os.path.exists(self.database) == False:
-            logging.debug("Loading DDL file '%s'" % (self.ddl))
-            ## HACK
-            cmd = "sqlite3 %s < %s" % (self.database, self.ddl)
-            (result, output) = commands.getstatusoutput(cmd)
-            assert result == 0, cmd + "\n" + output
+        if config["reset"] and self.database != MEMORY_DATABASE:
+            for path in [ self.database, self.database + "-wal", self.database + "-shm" ]:
+                if os.path.exists(path):
+                    logging.debug("Deleting database file '%s'" % path)
+                    os.unlink(path)
+            ## FOR
         ## IF
             
-        self.conn = sqlite3.connect(self.database)
+        self.conn = self.connect()
         self.cursor = self.conn.cursor()
+        
+        self.cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", [ constants.TABLENAME_ORDER_LINE ])
+        if self.cursor.fetchone()[0] == 0:
+            logging.debug("Loading DDL file '%s'" % (self.ddl))
+            self.conn.executescript(open(self.ddl, "r").read())
+        ## IF
+    
+    ## ----------------------------------------------
+    ## connect
+    ## ----------------------------------------------
+    def connect(self):
+        ## The pool makes sure that only one thread at a time uses a connection
+        if self.database == MEMORY_DATABASE:
+            conn = sqlite3.connect(MEMORY_URI, uri=True, timeout=self.busy_timeout, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.database, timeout=self.busy_timeout, check_same_thread=False)
+        for name, value in self.pragmas:
+            conn.execute("PRAGMA %s = %s" % (name, value))
+        return conn
     
     ## ----------------------------------------------
     ## loadTuples
@@ -150,7 +233,12 @@ class SqliteDriver(AbstractDriver):
         
         p = ["?"]*len(tuples[0])
         sql = "INSERT INTO %s VALUES (%s)" % (tableName, ",".join(p))
-        self.cursor.executemany(sql, tuples)
+        ## Commit every batch on its own, so that the other loaders are never
+        ## locked out for longer than that
+        def insert():
+            self.cursor.executemany(sql, tuples)
+            self.conn.commit()
+        self.runLocked(insert, [ 0, 0.0 ], max(self.busy_retries, LOAD_BUSY_RETRIES))
         
         logging.debug("Loaded %d tuples for tableName %s" % (len(tuples), tableName))
         return
@@ -162,6 +250,93 @@ class SqliteDriver(AbstractDriver):
         logging.info("Commiting changes to database")
         self.conn.commit()
 
+    ## ----------------------------------------------
+    ## executeStart
+    ## ----------------------------------------------
+    def executeStart(self):
+        self.pool = ConnectionPool(self.connect, self.pool_size, first=self.conn)
+
+    ## ----------------------------------------------
+    ## executeFinish
+    ## ----------------------------------------------
+    def executeFinish(self):
+        if self.pool != None: self.pool.close()
+        self.pool = None
+
+    ## ----------------------------------------------
+    ## executeTransaction
+    ## ----------------------------------------------
+    def executeTransaction(self, txn, params):
+        with self.pool.connection(params.get("w_id")) as slot:
+            self.conn = slot.conn
+            self.cursor = slot.cursor
+            return self.runTransaction(txn, params)
+
+    ## ----------------------------------------------
+    ## runTransaction
+    ## ----------------------------------------------
+    def runTransaction(self, txn, params):
+        """Run the transaction under BEGIN IMMEDIATE, so that it takes the write lock up
+        front instead of running into another process' lock halfway through. When the
+        database is locked, the whole transaction is retried with exponential backoff."""
+        stats = [ 0, 0.0 ]
+        self.retry_stats = stats
+        return self.runLocked(lambda: super(SqliteDriver, self).executeTransaction(txn, params), stats, self.busy_retries)
+
+    ## ----------------------------------------------
+    ## runLocked
+    ## ----------------------------------------------
+    def runLocked(self, func, stats, retries):
+        """Invoke func inside of a BEGIN IMMEDIATE transaction and retry it up to 'retries'
+        times while the database is locked. Only time lost to the lock counts as waiting."""
+        while True:
+            start = time.time()
+            try:
+                self.cursor.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as ex:
+                stats[1] += time.time() - start
+                self.backoff(ex, stats, retries)
+                continue
+            
+            try:
+                result = func()
+            except sqlite3.OperationalError as ex:
+                self.conn.rollback()
+                self.backoff(ex, stats, retries)
+                continue
+            
+            ## Transactions that bail out early leave theirs open
+            if self.conn.in_transaction: self.conn.rollback()
+            return result
+        ## WHILE
+
+    ## ----------------------------------------------
+    ## backoff
+    ## ----------------------------------------------
+    def backoff(self, ex, stats, retries):
+        """Wait before the next try of a transaction that found the database locked.
+        Any other error is passed on, and running out of retries becomes a ConflictError."""
+        if not isBusy(ex): raise ex
+        if stats[0] >= retries: raise ConflictError(str(ex), "locked")
+        delay = min(self.busy_backoff * (2 ** stats[0]), MAX_BUSY_BACKOFF) * BACKOFF_RANDOM.uniform(0.5, 1.0)
+        time.sleep(delay)
+        stats[0] += 1
+        stats[1] += delay
+
+    ## ----------------------------------------------
+    ## getRetryStats
+    ## ----------------------------------------------
+    def getRetryStats(self):
+        stats = self.retry_stats
+        if stats == None: return (0, 0.0)
+        return (stats[0], stats[1])
+
+    ## ----------------------------------------------
+    ## isThreadSafe
+    ## ----------------------------------------------
+    def isThreadSafe(self):
+        return self.pool_size > 1
+
     ## ----------------------------------------------
     ## doDelivery
     ## ----------------------------------------------
@@ -226,18 +401,16 @@ class SqliteDriver(AbstractDriver):
         assert len(i_ids) == len(i_qtys)
 
         all_local = True
-        items = [ ]
         for i in range(len(i_ids)):
             ## Determine if this is an all local order or not
             all_local = all_local and i_w_ids[i] == w_id
-            self.cursor.execute(q["getItemInfo"], [i_ids[i]])
-            items.append(self.cursor.fetchone())
+        items = self.getNewOrderItems(i_ids)
         assert len(items) == len(i_ids)
         
         ## TPCC defines 1% of neworder gives a wrong itemid, causing rollback.
         ## Note that this will happen with 1% of transactions on purpose.
         for item in items:
-            if len(item) == 0:
+            if item == None:
                 ## TODO Abort here!
                 return
         ## FOR
@@ -270,6 +443,9 @@ class SqliteDriver(AbstractDriver):
         ## ----------------
         ## Insert Order Item Information
         ## ----------------
+        stocks = self.getNewOrderStocks(d_id, i_ids, i_w_ids)
+        stock_updates = [ ]
+        order_lines = [ ]
         item_data = [ ]
         total = 0
         for i in range(len(i_ids)):
@@ -283,9 +459,8 @@ class SqliteDriver(AbstractDriver):
             i_data = itemInfo[2]
             i_price = itemInfo[0]
 
-            self.cursor.execute(q["getStockInfo"] % (d_id), [ol_i_id, ol_supply_w_id])
-            stockInfo = self.cursor.fetchone()
-            if len(stockInfo) == 0:
+            stockInfo = stocks[i]
+            if stockInfo == None:
                 logging.warn("No STOCK record for (ol_i_id=%d, ol_supply_w_id=%d)" % (ol_i_id, ol_supply_w_id))
                 continue
             s_quantity = stockInfo[0]
@@ -305,7 +480,7 @@ class SqliteDriver(AbstractDriver):
             
             if ol_supply_w_id != w_id: s_remote_cnt += 1
 
-            self.cursor.execute(q["updateStock"], [s_quantity, s_ytd, s_order_cnt, s_remote_cnt, ol_i_id, ol_supply_w_id])
+            stock_updates.append([s_quantity, s_ytd, s_order_cnt, s_remote_cnt, ol_i_id, ol_supply_w_id])
 
             if i_data.find(constants.ORIGINAL_STRING) != -1 and s_data.find(constants.ORIGINAL_STRING) != -1:
                 brand_generic = 'B'
@@ -316,12 +491,14 @@ class SqliteDriver(AbstractDriver):
             ol_amount = ol_quantity * i_price
             total += ol_amount
 
-            self.cursor.execute(q["createOrderLine"], [d_next_o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, o_entry_d, ol_quantity, ol_amount, s_dist_xx])
+            order_lines.append([d_next_o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, o_entry_d, ol_quantity, ol_amount, s_dist_xx])
 
             ## Add the info to be returned
             item_data.append( (i_name, s_quantity, brand_generic, i_price, ol_amount) )
         ## FOR
         
+        if order_lines: self.writeNewOrderLines(stock_updates, order_lines)
+        
         ## Commit!
         self.conn.commit()
 
@@ -336,6 +513,61 @@ class SqliteDriver(AbstractDriver):
         
         return [ customer_info, misc, item_data ]
 
+    ## ----------------------------------------------
+    ## getNewOrderItems
+    ## ----------------------------------------------
+    def getNewOrderItems(self, i_ids):
+        """Return the (I_PRICE, I_NAME, I_DATA) of every item, or None for the ones
+        that do not exist. With batch_new_order they are all fetched with one query."""
+        if not self.batch_new_order:
+            items = [ ]
+            for i_id in i_ids:
+                self.cursor.execute(TXN_QUERIES["NEW_ORDER"]["getItemInfo"], [i_id])
+                items.append(self.cursor.fetchone())
+            return items
+        
+        self.cursor.execute(BATCH_QUERIES["NEW_ORDER"]["getItemInfo"] % ",".join(["?"]*len(i_ids)), i_ids)
+        items = dict([ (r[0], r[1:]) for r in self.cursor.fetchall() ])
+        return [ items.get(i_id) for i_id in i_ids ]
+
+    ## ----------------------------------------------
+    ## getNewOrderStocks
+    ## ----------------------------------------------
+    def getNewOrderStocks(self, d_id, i_ids, i_w_ids):
+        """Return the (S_QUANTITY, S_DATA, S_YTD, S_ORDER_CNT, S_REMOTE_CNT, S_DIST_xx) of
+        every order line, or None when its STOCK record is missing. With batch_new_order
+        they are all fetched with one query."""
+        if not self.batch_new_order:
+            stocks = [ ]
+            for i in range(len(i_ids)):
+                self.cursor.execute(TXN_QUERIES["NEW_ORDER"]["getStockInfo"] % (d_id), [i_ids[i], i_w_ids[i]])
+                stocks.append(self.cursor.fetchone())
+            return stocks
+        
+        keys = [ ]
+        for i in range(len(i_ids)): keys.extend([ i_ids[i], i_w_ids[i] ])
+        self.cursor.execute(BATCH_QUERIES["NEW_ORDER"]["getStockInfo"] % (d_id, ",".join(["(?,?)"]*len(i_ids))), keys)
+        stocks = dict([ ((r[0], r[1]), r[2:]) for r in self.cursor.fetchall() ])
+        return [ stocks.get((i_ids[i], i_w_ids[i])) for i in range(len(i_ids)) ]
+
+    ## ----------------------------------------------
+    ## writeNewOrderLines
+    ## ----------------------------------------------
+    def writeNewOrderLines(self, stock_updates, order_lines):
+        """Update the STOCK records and insert the ORDER_LINEs of an order. With
+        batch_new_order all of the order lines go in a single INSERT."""
+        q = TXN_QUERIES["NEW_ORDER"]
+        if not self.batch_new_order:
+            for i in range(len(order_lines)):
+                self.cursor.execute(q["updateStock"], stock_updates[i])
+                self.cursor.execute(q["createOrderLine"], order_lines[i])
+            return
+        
+        self.cursor.executemany(q["updateStock"], stock_updates)
+        values = [ ]
+        for line in order_lines: values.extend(line)
+        self.cursor.execute(BATCH_QUERIES["NEW_ORDER"]["createOrderLines"] % ",".join(["(?,?,?,?,?,?,?,?,?,?)"]*len(order_lines)), values)
+
     ## ----------------------------------------------
     ## doOrderStatus
     ## ----------------------------------------------
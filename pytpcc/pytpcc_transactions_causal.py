@@ -2,6 +2,7 @@ import datetime
 
 local = True # or False if you are running against a HydroCluster
 elb_address = '127.0.0.1' # or the address of the ELB returned by the
+layout = 'column' # or 'row', which has to match the driver's layout option
 
 from cloudburst.client.client import CloudburstConnection
 from cloudburst.shared.serializer import Serializer
@@ -105,6 +106,136 @@ doStockLevelConnections = [(getOrderIDName, getStockCountName), (getStockCountNa
 # @author Rafael Soares <joao.rafael.pinto.soares@tecnico.ulisboa.pt>
 #----------------------------------------------------------------------------
 
+#----------------------------------------------------------------------------
+# Storage Layout
+#
+# With the 'column' layout every column of a row is stored under its own key
+# (e.g., CUSTOMER.1.2.3.C_FIRST). With the 'row' layout the row is one dict
+# under the row's base key (e.g., CUSTOMER.1.2.3.), so reading any number of
+# its columns resolves a few references at most. The functions below project
+# the columns out of the rows that they get.
+#
+# Anna resolves concurrent writes of a key last-writer-wins, so a transaction
+# that wrote back a whole row could undo another one's update of a different
+# column (e.g., a Payment's C_BALANCE a Delivery's, or a D_YTD a NewOrder's
+# D_NEXT_O_ID). The columns in UPDATED_COLUMNS are therefore kept in dicts
+# under keys of their own in the row layout. Columns that the same transaction
+# always updates together (e.g., the STOCK counters) share a key. Transactions
+# only ever update those, so the rows themselves are only written when they are
+# inserted, and concurrent updates conflict like they do with the 'column' layout.
+#
+# The layout and UPDATED_COLUMNS have to match the drivers' (drivers/annabatch.py).
+# They get published under LAYOUT_KEY, and the drivers refuse to run any
+# transactions if they do not.
+#----------------------------------------------------------------------------
+
+# The columns that transactions update, and the key (after the row's base key)
+# that the row layout keeps each of them under
+UPDATED_COLUMNS = {
+    'W_YTD': 'W_YTD',
+    'D_YTD': 'D_YTD',
+    'D_NEXT_O_ID': 'D_NEXT_O_ID',
+    'C_BALANCE': 'C_BALANCE',
+    'C_DELIVERY_CNT': 'C_DELIVERY_CNT',
+    'C_YTD_PAYMENT': 'C_PAYMENT',
+    'C_PAYMENT_CNT': 'C_PAYMENT',
+    'C_DATA': 'C_PAYMENT',
+    'S_QUANTITY': 'S_COUNTERS',
+    'S_YTD': 'S_COUNTERS',
+    'S_ORDER_CNT': 'S_COUNTERS',
+    'S_REMOTE_CNT': 'S_COUNTERS',
+    'O_CARRIER_ID': 'O_CARRIER_ID',
+    'W_CARRIER_ID': 'W_CARRIER_ID',
+    'OL_DELIVERY_D': 'OL_DELIVERY_D',
+}
+LAYOUT_KEY = 'TPCC.LAYOUT'
+
+CUSTOMER_COLUMNS = ['C_ID', 'C_D_ID', 'C_W_ID', 'C_FIRST', 'C_MIDDLE', 'C_LAST', 'C_STREET_1', 'C_STREET_2', 'C_CITY',
+                    'C_ZIP', 'C_PHONE', 'C_SINCE', 'C_CREDIT', 'C_CREDIT_LIM', 'C_DISCOUNT', 'C_BALANCE',
+                    'C_YTD_PAYMENT', 'C_PAYMENT_CNT', 'C_DELIVERY_CNT', 'C_DATA']
+# doNewOrder reads C_DISCOUNT last
+NEW_ORDER_CUSTOMER_COLUMNS = [column for column in CUSTOMER_COLUMNS if column != 'C_DISCOUNT'] + ['C_DISCOUNT']
+DISTRICT_COLUMNS = ['D_ID', 'D_W_ID', 'D_NAME', 'D_STREET_1', 'D_STREET_2', 'D_CITY', 'D_STATE', 'D_ZIP', 'D_TAX',
+                    'D_YTD', 'D_NEXT_O_ID']
+PAYMENT_WAREHOUSE_COLUMNS = ['W_ID', 'W_NAME', 'W_STREET_1', 'W_STREET_2', 'W_CITY', 'W_STATE', 'W_ZIP', 'W_YTD']
+ORDER_STATUS_ORDER_COLUMNS = ['O_ID', 'O_CARRIER_ID', 'O_ENTRY_D']
+ORDER_STATUS_ORDER_LINE_COLUMNS = ['OL_SUPPLY_W_ID', 'OL_I_ID', 'OL_QUANTITY', 'OL_AMOUNT', 'OL_DELIVERY_D']
+
+# ------------------------------------------------------------------------
+# The keys that some of the columns of the row under base_key are read from
+# with the row layout: the row (unless only updated columns are needed),
+# followed by the UPDATED_COLUMNS keys of the columns
+# ------------------------------------------------------------------------
+def rowKeys(base_key, columns):
+    keys = [base_key] if any(column not in UPDATED_COLUMNS for column in columns) else []
+    for column in columns:
+        if column in UPDATED_COLUMNS and base_key + UPDATED_COLUMNS[column] not in keys:
+            keys.append(base_key + UPDATED_COLUMNS[column])
+    return keys
+
+# ------------------------------------------------------------------------
+# References to some of the columns of the row under base_key
+# ------------------------------------------------------------------------
+def references(base_key, columns):
+    if layout == 'row':
+        return [CloudburstReference(key, True) for key in rowKeys(base_key, columns)]
+    return [CloudburstReference(base_key + column, True) for column in columns]
+
+# ------------------------------------------------------------------------
+# The values of the given columns, row after row, from what a list of
+# references() resolved to. Anything that is not a row (e.g., a "None"
+# placeholder) is passed through as it is.
+# ------------------------------------------------------------------------
+def project(values, columns):
+    if layout != 'row':
+        return values
+    # Every row resolved to the row itself and/or the dicts of its updated columns
+    count = len(rowKeys('', columns))
+    projected = []
+    i = 0
+    while i < len(values):
+        if isinstance(values[i], dict):
+            row = {}
+            for part in values[i:i + count]:
+                row.update(part)
+            i += count
+            projected.extend([row.get(column) for column in columns])
+        else:
+            projected.append(values[i])
+            i += 1
+    return projected
+
+# ------------------------------------------------------------------------
+# The value of a single column from what references() resolved to
+# ------------------------------------------------------------------------
+def projectOne(values, column):
+    if values == "None":
+        return values
+    return project(values, [column])[0]
+
+# ------------------------------------------------------------------------
+# Write columns of the row under base_key. With the row layout the updated
+# columns go into the dicts under their UPDATED_COLUMNS keys, which have to be
+# written whole, and the rest (which only inserts write, all of them at once)
+# goes into the row.
+# ------------------------------------------------------------------------
+def writeColumns(cloudburst, write_set, base_key, values):
+    if layout == 'row':
+        row = {}
+        updated = {}
+        for column, value in values.items():
+            if column in UPDATED_COLUMNS:
+                updated.setdefault(UPDATED_COLUMNS[column], {})[column] = value
+            else:
+                row[column] = value
+        for key, columns in updated.items():
+            cloudburst.write(write_set, base_key + key, columns)
+        if row:
+            cloudburst.write(write_set, base_key, row)
+    else:
+        for column, value in values.items():
+            cloudburst.write(write_set, base_key + column, value)
+
 #----------------------------------------------------------------------------
 # DoDelivery Transaction
 #----------------------------------------------------------------------------
@@ -142,7 +273,7 @@ def getNewOrders(cloudburst, write_set, dpw, new_order_indexes):
         if new_order_indexes[cursor] == "None":
             no_o_id.append("None")
         else:
-            no_o_id.append(CloudburstReference(new_order_indexes[cursor] + "NO_O_ID", True))
+            no_o_id.append(references(new_order_indexes[cursor], ['NO_O_ID']))
     return no_o_id
 
 # ------------------------------------------------------------------------
@@ -156,6 +287,7 @@ def getNewOrders(cloudburst, write_set, dpw, new_order_indexes):
 # ------------------------------------------------------------------------
 
 def getCustomerID(cloudburst, write_set, dpw, warehouse, no_o_id):
+    no_o_id = [projectOne(o_id, 'NO_O_ID') for o_id in no_o_id]
     order_keys = []
     orders_client_id = []
 
@@ -169,10 +301,10 @@ def getCustomerID(cloudburst, write_set, dpw, warehouse, no_o_id):
         else:
             client_key = 'ORDER.%s.%s.%s' % (warehouse, d_id, no_o_id[cursor])
             order_keys.append(client_key)
-            orders_client_id.append(CloudburstReference(client_key + ".O_C_ID", True))
+            orders_client_id.append(references(client_key + '.', ['O_C_ID']))
 
             # Required for dependency checks
-            order_w_carrier_ids.append(CloudburstReference(client_key + '.W_CARRIER_ID', True))
+            order_w_carrier_ids.extend(references(client_key + '.', ['W_CARRIER_ID']))
 
     ol_ids = []
     for d_id in range(1, dpw + 1):
@@ -198,6 +330,8 @@ def getCustomerID(cloudburst, write_set, dpw, warehouse, no_o_id):
 # ------------------------------------------------------------------------
 
 def getOrderLineSum(cloudburst, write_set, dpw, warehouse, no_o_id, order_keys, orders_client_id, ol_ids, order_w_carrier_ids):
+    orders_client_id = [projectOne(client_id, 'O_C_ID') for client_id in orders_client_id]
+
     sum_order_line = []
     ol_counts = []
 
@@ -210,9 +344,9 @@ def getOrderLineSum(cloudburst, write_set, dpw, warehouse, no_o_id, order_keys,
             sum_order_line.append(0)
         else:
             for order_key in ol_ids[cursor]:
-                sum_order_line.append(CloudburstReference(order_key + "OL_AMOUNT", True))
+                sum_order_line.extend(references(order_key, ['OL_AMOUNT']))
                 ol_counts[cursor] += 1
-                ol_delivery_d.append(CloudburstReference(order_key + 'OL_DELIVERY_D', True))
+                ol_delivery_d.extend(references(order_key, ['OL_DELIVERY_D']))
 
     customer_keys = []
     old_balance_clients = []
@@ -228,18 +362,16 @@ def getOrderLineSum(cloudburst, write_set, dpw, warehouse, no_o_id, order_keys,
         else:
             customer_key = "CUSTOMER.%s.%s.%s." % (warehouse, d_id, orders_client_id[cursor])
             customer_keys.append(customer_key)
-            old_balance_clients.append(CloudburstReference(customer_key + 'C_BALANCE', True))
+            old_balance_clients.append(references(customer_key, ['C_BALANCE']))
 
             # Required for Dependency checks
             new_order_key = 'NEW_ORDER.%s.%s.%s.' % (warehouse, d_id, no_o_id[cursor])
-            new_orders.append(CloudburstReference(new_order_key + "NO_O_ID", True))
-            new_orders.append(CloudburstReference(new_order_key + "NO_D_ID", True))
-            new_orders.append(CloudburstReference(new_order_key + "NO_W_ID", True))
+            new_orders.extend(references(new_order_key, ["NO_O_ID", "NO_D_ID", "NO_W_ID"]))
 
             new_order_index_key = 'NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (warehouse, d_id)
             new_orders_index.append(CloudburstReference(new_order_index_key, True))
 
-            customer_balance.append(CloudburstReference(customer_key + 'C_BALANCE', True))
+            customer_balance.extend(references(customer_key, ['C_BALANCE']))
     return no_o_id, order_keys, ol_ids, sum_order_line, ol_counts, customer_keys, old_balance_clients, new_orders,\
            new_orders_index, ol_delivery_d, customer_balance
 
@@ -268,6 +400,8 @@ def doDeliveryFunction(cloudburst, write_set, params, dpw, no_o_id, order_keys,
     # Initialize result set
     result = []
 
+    sum_order_line = project(sum_order_line, ['OL_AMOUNT'])
+
     # -------------------------
     # Initialize Data Holders
     # -------------------------
@@ -301,9 +435,7 @@ def doDeliveryFunction(cloudburst, write_set, params, dpw, no_o_id, order_keys,
 
         # Delete New_Order
         new_order_key = 'NEW_ORDER.%s.%s.%s.' % (w_id, d_id, no_o_id[cursor])
-        cloudburst.write(write_set, new_order_key + "NO_O_ID", "None")
-        cloudburst.write(write_set, new_order_key + "NO_D_ID", "None")
-        cloudburst.write(write_set, new_order_key + "NO_W_ID", "None")
+        writeColumns(cloudburst, write_set, new_order_key, {"NO_O_ID": "None", "NO_D_ID": "None", "NO_W_ID": "None"})
 
         # Remove new_order index
         new_order_index_key = 'NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (w_id, d_id)
@@ -312,14 +444,13 @@ def doDeliveryFunction(cloudburst, write_set, params, dpw, no_o_id, order_keys,
         # ---------------------
         # Update Orders Query
         # ---------------------
-        order_key = order_keys[cursor] + '.W_CARRIER_ID'
-        cloudburst.write(write_set, order_key, o_carrier_id)
+        writeColumns(cloudburst, write_set, order_keys[cursor] + '.', {'W_CARRIER_ID': o_carrier_id})
 
         # -------------------------
         # Update Order Line Query
         # -------------------------
         for order_line in ol_ids[cursor]:
-            cloudburst.write(write_set, order_line + 'OL_DELIVERY_D', ol_delivery_d)
+            writeColumns(cloudburst, write_set, order_line, {'OL_DELIVERY_D': ol_delivery_d})
 
     # -----------------------
     # Update Customer Query
@@ -330,8 +461,8 @@ def doDeliveryFunction(cloudburst, write_set, params, dpw, no_o_id, order_keys,
         if no_o_id[cursor] == "None":
             continue
         else:
-            new_balance = float(old_balance_clients[cursor]) + float(ol_total[cursor])
-            cloudburst.write(write_set, customer_keys[cursor] + 'C_BALANCE', new_balance)
+            new_balance = float(projectOne(old_balance_clients[cursor], 'C_BALANCE')) + float(ol_total[cursor])
+            writeColumns(cloudburst, write_set, customer_keys[cursor], {'C_BALANCE': new_balance})
             result.append((d_id, no_o_id[cursor]))
 
     return result
@@ -347,8 +478,8 @@ def doDeliveryFunction(cloudburst, write_set, params, dpw, no_o_id, order_keys,
 # doNewOrder transaction to be registered and executed by cloudburst
 # ------------------------------------------------------------------------
 
-def doNewOrderFunction(cloudburst, write_set, params, items, all_local, w_tax, d_tax, d_next_o_id, customer_info,
-                       c_discount, order_search_index, stocks, constant_null_carrier_id, constant_original_string,
+def doNewOrderFunction(cloudburst, write_set, params, items, all_local, warehouse, district, customer_info,
+                       order_search_index, stocks, constant_null_carrier_id, constant_original_string,
                        get_new_order_index):
     t0 = time.time()
     w_id = params["w_id"]
@@ -359,30 +490,28 @@ def doNewOrderFunction(cloudburst, write_set, params, items, all_local, w_tax, d
     i_w_ids = params["i_w_ids"]
     i_qtys = params["i_qtys"]
 
-    # Adds Client discount to customer info (in order to avoid fetching it twice on references)
-    customer_info.append(c_discount)
+    # Project the columns out of the rows (the customer's C_DISCOUNT comes last)
+    w_tax, = project(warehouse, ['W_TAX'])
+    d_tax, d_next_o_id = project(district, ['D_TAX', 'D_NEXT_O_ID'])
+    customer_info = project(customer_info, NEW_ORDER_CUSTOMER_COLUMNS)
+    c_discount = customer_info[-1]
+    items = project(items, ['I_PRICE', 'I_NAME', 'I_DATA'])
+    stocks = project(stocks, ['S_QUANTITY', 'S_YTD', 'S_ORDER_CNT', 'S_REMOTE_CNT', 'S_DATA', 'S_DIST_%02d' % d_id])
 
     # -------------------------------
     # Increment Next Order ID Query
     # -------------------------------
     district_key = "DISTRICT.%s.%s." % (w_id, d_id)
-    district_next_order_id_key = district_key + 'D_NEXT_O_ID'
-    cloudburst.write(write_set, district_next_order_id_key, d_next_o_id + 1)
+    writeColumns(cloudburst, write_set, district_key, {'D_NEXT_O_ID': d_next_o_id + 1})
 
     # --------------------
     # Create Order Query
     # --------------------
     order_key = "ORDER.%s.%s.%s." % (w_id, d_id, d_next_o_id)
     ol_cnt = len(i_ids)
-    cloudburst.write(write_set, order_key + "O_ID", d_next_o_id)
-    cloudburst.write(write_set, order_key + "O_D_ID", d_id)
-    cloudburst.write(write_set, order_key + "O_W_ID", w_id)
-    cloudburst.write(write_set, order_key + "O_C_ID", c_id)
-    cloudburst.write(write_set, order_key + "O_C_ID", c_id)
-    cloudburst.write(write_set, order_key + "O_ENTRY_D", o_entry_d)
-    cloudburst.write(write_set, order_key + "O_CARRIER_ID", constant_null_carrier_id)
-    cloudburst.write(write_set, order_key + "O_OL_CNT", ol_cnt)
-    cloudburst.write(write_set, order_key + "O_ALL_LOCAL", all_local)
+    writeColumns(cloudburst, write_set, order_key, {"O_ID": d_next_o_id, "O_D_ID": d_id, "O_W_ID": w_id, "O_C_ID": c_id,
+                                                    "O_ENTRY_D": o_entry_d, "O_CARRIER_ID": constant_null_carrier_id,
+                                                    "O_OL_CNT": ol_cnt, "O_ALL_LOCAL": all_local})
 
     order_search_index.append(order_key)
     cloudburst.write(write_set, 'ORDERS.INDEXES.ORDERSEARCH.%s.%s.%s' % (w_id, d_id, c_id), order_search_index)
@@ -391,9 +520,7 @@ def doNewOrderFunction(cloudburst, write_set, params, items, all_local, w_tax, d
     # Create New Order Query
     # ------------------------
     new_order_key = "NEW_ORDER.%s.%s.%s." % (w_id, d_id, d_next_o_id)
-    cloudburst.write(write_set, new_order_key + "NO_O_ID", d_next_o_id)
-    cloudburst.write(write_set, new_order_key + "NO_D_ID", d_id)
-    cloudburst.write(write_set, new_order_key + "NO_W_ID", w_id)
+    writeColumns(cloudburst, write_set, new_order_key, {"NO_O_ID": d_next_o_id, "NO_D_ID": d_id, "NO_W_ID": w_id})
     cloudburst.write(write_set, 'NEW_ORDER.INDEXES.GETNEWORDER.%s.%s' % (w_id, d_id), new_order_key)
 
     # -------------------------------
@@ -444,10 +571,8 @@ def doNewOrderFunction(cloudburst, write_set, params, items, all_local, w_tax, d
 
         current_stock_key = "STOCK.%s." % stock_key[i]
 
-        cloudburst.write(write_set, current_stock_key + "S_QUANTITY", s_quantity)
-        cloudburst.write(write_set, current_stock_key + "S_YTD", s_ytd)
-        cloudburst.write(write_set, current_stock_key + "S_ORDER_CNT", s_order_cnt)
-        cloudburst.write(write_set, current_stock_key + "S_REMOTE_CNT", s_remote_cnt)
+        writeColumns(cloudburst, write_set, current_stock_key, {"S_QUANTITY": s_quantity, "S_YTD": s_ytd,
+                                                                "S_ORDER_CNT": s_order_cnt, "S_REMOTE_CNT": s_remote_cnt})
 
         if i_data[i].find(constant_original_string) != -1 and s_data.find(constant_original_string) != -1:
             brand_generic = 'B'
@@ -463,16 +588,11 @@ def doNewOrderFunction(cloudburst, write_set, params, items, all_local, w_tax, d
         # -------------------------
         order_line_key = "ORDER_LINE.%s.%s.%s.%s." % (w_id, d_id, d_next_o_id, ol_number[i])
 
-        cloudburst.write(write_set, order_line_key + "OL_O_ID", d_next_o_id)
-        cloudburst.write(write_set, order_line_key + "OL_D_ID", d_id)
-        cloudburst.write(write_set, order_line_key + "OL_W_ID", w_id)
-        cloudburst.write(write_set, order_line_key + "OL_NUMBER", ol_number[i])
-        cloudburst.write(write_set, order_line_key + "OL_I_ID", ol_i_id[i])
-        cloudburst.write(write_set, order_line_key + "OL_SUPPLY_W_ID", ol_supply_w_id[i])
-        cloudburst.write(write_set, order_line_key + "OL_DELIVERY_D", o_entry_d)
-        cloudburst.write(write_set, order_line_key + "OL_QUANTITY", ol_quantity[i])
-        cloudburst.write(write_set, order_line_key + "OL_AMOUNT", ol_amount)
-        cloudburst.write(write_set, order_line_key + "OL_DISTRICT_INFO", s_dist_xx)
+        writeColumns(cloudburst, write_set, order_line_key, {"OL_O_ID": d_next_o_id, "OL_D_ID": d_id, "OL_W_ID": w_id,
+                                                             "OL_NUMBER": ol_number[i], "OL_I_ID": ol_i_id[i],
+                                                             "OL_SUPPLY_W_ID": ol_supply_w_id[i],
+                                                             "OL_DELIVERY_D": o_entry_d, "OL_QUANTITY": ol_quantity[i],
+                                                             "OL_AMOUNT": ol_amount, "OL_DISTRICT_INFO": s_dist_xx})
         order_line_keys.append(order_line_key)
 
         item_data.append((i_name, s_quantity, brand_generic, i_price, ol_amount))
@@ -496,11 +616,12 @@ def doNewOrderFunction(cloudburst, write_set, params, items, all_local, w_tax, d
 def getClientByLastName(cloudburst, write_set, customers):
     customer_first_names = []
     for customer_id in customers:
-        customer_first_names.append(CloudburstReference(customer_id + "C_FIRST", True))
+        customer_first_names.append(references(customer_id, ['C_FIRST']))
 
     return customers, customer_first_names
 
 def getClientByFirstName(cloudburst, write_set, customer_ids, customer_first_names):
+    customer_first_names = [projectOne(first_name, 'C_FIRST') for first_name in customer_first_names]
     customer_ids_order = []
     customers_names_order = []
 
@@ -520,33 +641,14 @@ def getClientByFirstName(cloudburst, write_set, customer_ids, customer_first_nam
     index = int((namecnt - 1) / 2)
     # Might come float here, check correctness
     customer_key = customer_ids_order[index]
-    customer = []
-    customer.append(CloudburstReference(customer_key + "C_ID", True))
-    customer.append(CloudburstReference(customer_key + "C_D_ID", True))
-    customer.append(CloudburstReference(customer_key + "C_W_ID", True))
-    customer.append(CloudburstReference(customer_key + "C_FIRST", True))
-    customer.append(CloudburstReference(customer_key + "C_MIDDLE", True))
-    customer.append(CloudburstReference(customer_key + "C_LAST", True))
-    customer.append(CloudburstReference(customer_key + "C_STREET_1", True))
-    customer.append(CloudburstReference(customer_key + "C_STREET_2", True))
-    customer.append(CloudburstReference(customer_key + "C_CITY", True))
-    customer.append(CloudburstReference(customer_key + "C_ZIP", True))
-    customer.append(CloudburstReference(customer_key + "C_PHONE", True))
-    customer.append(CloudburstReference(customer_key + "C_SINCE", True))
-    customer.append(CloudburstReference(customer_key + "C_CREDIT", True))
-    customer.append(CloudburstReference(customer_key + "C_CREDIT_LIM", True))
-    customer.append(CloudburstReference(customer_key + "C_DISCOUNT", True))
-    customer.append(CloudburstReference(customer_key + "C_BALANCE", True))
-    customer.append(CloudburstReference(customer_key + "C_YTD_PAYMENT", True))
-    customer.append(CloudburstReference(customer_key + "C_PAYMENT_CNT", True))
-    customer.append(CloudburstReference(customer_key + "C_DELIVERY_CNT", True))
-    customer.append(CloudburstReference(customer_key + "C_DATA", True))
+    customer = references(customer_key, CUSTOMER_COLUMNS)
 
     return customer
 
 def getLastOrder(cloudburst, write_set, params, client):
     w_id = params["w_id"]
     d_id = params["d_id"]
+    client = project(client, CUSTOMER_COLUMNS)
     c_id = client[0]
 
     order_search_key = 'ORDERS.INDEXES.ORDERSEARCH.%s.%s.%s' % (w_id, d_id, c_id)
@@ -556,11 +658,12 @@ def getLastOrder(cloudburst, write_set, params, client):
 def getOrders(cloudburst, write_set, client, order_search):
     orders = []
     for order in order_search:
-        orders.append(CloudburstReference(order + 'O_ID', True))
+        orders.append(references(order, ['O_ID']))
 
     return client, order_search, orders
 
 def getOrderLinesIndexes(cloudburst, write_set, params, client, order_search, orders):
+    orders = [projectOne(order, 'O_ID') for order in orders]
     w_id = params["w_id"]
     d_id = params["d_id"]
     last_order_oid = 0
@@ -574,9 +677,7 @@ def getOrderLinesIndexes(cloudburst, write_set, params, client, order_search, or
     order = []
     order_line_index = "None"
     if last_order_oid > 0:
-        order = [CloudburstReference(last_order + 'O_ID', True),
-                 CloudburstReference(last_order + 'O_CARRIER_ID', True),
-                 CloudburstReference(last_order + 'O_ENTRY_D', True)]
+        order = references(last_order, ORDER_STATUS_ORDER_COLUMNS)
 
         order_line_key = 'ORDER_LINE.INDEXES.SUMOLAMOUNT.%s.%s.%s' % (last_order_oid, d_id, w_id)
         order_line_index = CloudburstReference(order_line_key, True)
@@ -584,20 +685,18 @@ def getOrderLinesIndexes(cloudburst, write_set, params, client, order_search, or
     return client, order, order_line_index
 
 def getOrderLines(cloudburst, write_set, client, order, order_line_index):
+    order = project(order, ORDER_STATUS_ORDER_COLUMNS)
     order_lines = []
     if order_line_index == "None":
         return client, [], []
     else:
         for order_line in order_line_index:
-            order_lines.append([CloudburstReference(order_line + 'OL_SUPPLY_W_ID', True),
-                                CloudburstReference(order_line + 'OL_I_ID', True),
-                                CloudburstReference(order_line + 'OL_QUANTITY', True),
-                                CloudburstReference(order_line + 'OL_AMOUNT', True),
-                                CloudburstReference(order_line + 'OL_DELIVERY_D', True)])
+            order_lines.append(references(order_line, ORDER_STATUS_ORDER_LINE_COLUMNS))
 
         return client, order, order_lines
 
 def doOrderStatusFunction(cloudburst, write_set, client, order, order_lines):
+    order_lines = [project(order_line, ORDER_STATUS_ORDER_LINE_COLUMNS) for order_line in order_lines]
     return [client, order, order_lines]
 
 #----------------------------------------------------------------------------
@@ -607,11 +706,13 @@ def doOrderStatusFunction(cloudburst, write_set, client, order, order_lines):
 def getClientByLastNameDoPayment(cloudburst, write_set, customers):
     customer_ids_first_name = []
     for customer_id in customers:
-        customer_ids_first_name.append([customer_id, CloudburstReference(customer_id + "C_FIRST", True)])
+        customer_ids_first_name.append([customer_id, references(customer_id, ['C_FIRST'])])
 
     return customer_ids_first_name
 
 def getClientByFirstNameDoPayment(cloudburst, write_set, customer_ids_first_name):
+    customer_ids_first_name = [[customer_id, projectOne(first_name, 'C_FIRST')]
+                               for customer_id, first_name in customer_ids_first_name]
     customers = []
     customers.append(customer_ids_first_name.pop())
 
@@ -626,27 +727,7 @@ def getClientByFirstNameDoPayment(cloudburst, write_set, customer_ids_first_name
     namecnt = len(customers)
     index = int((namecnt - 1) / 2)
     customer_key = customers[index][0]
-    customer = []
-    customer.append(CloudburstReference(customer_key + "C_ID", True))
-    customer.append(CloudburstReference(customer_key + "C_D_ID", True))
-    customer.append(CloudburstReference(customer_key + "C_W_ID", True))
-    customer.append(CloudburstReference(customer_key + "C_FIRST", True))
-    customer.append(CloudburstReference(customer_key + "C_MIDDLE", True))
-    customer.append(CloudburstReference(customer_key + "C_LAST", True))
-    customer.append(CloudburstReference(customer_key + "C_STREET_1", True))
-    customer.append(CloudburstReference(customer_key + "C_STREET_2", True))
-    customer.append(CloudburstReference(customer_key + "C_CITY", True))
-    customer.append(CloudburstReference(customer_key + "C_ZIP", True))
-    customer.append(CloudburstReference(customer_key + "C_PHONE", True))
-    customer.append(CloudburstReference(customer_key + "C_SINCE", True))
-    customer.append(CloudburstReference(customer_key + "C_CREDIT", True))
-    customer.append(CloudburstReference(customer_key + "C_CREDIT_LIM", True))
-    customer.append(CloudburstReference(customer_key + "C_DISCOUNT", True))
-    customer.append(CloudburstReference(customer_key + "C_BALANCE", True))
-    customer.append(CloudburstReference(customer_key + "C_YTD_PAYMENT", True))
-    customer.append(CloudburstReference(customer_key + "C_PAYMENT_CNT", True))
-    customer.append(CloudburstReference(customer_key + "C_DELIVERY_CNT", True))
-    customer.append(CloudburstReference(customer_key + "C_DATA", True))
+    customer = references(customer_key, CUSTOMER_COLUMNS)
 
     return customer
 
@@ -656,33 +737,21 @@ def getWarehouseDistrict(cloudburst, write_set, params, client):
 
     warehouse_key = 'WAREHOUSE.%s.' % w_id
 
-    warehouse = [CloudburstReference(warehouse_key + 'W_ID', True),
-                 CloudburstReference(warehouse_key + 'W_NAME', True),
-                 CloudburstReference(warehouse_key + 'W_STREET_1', True),
-                 CloudburstReference(warehouse_key + 'W_STREET_2', True),
-                 CloudburstReference(warehouse_key + 'W_CITY', True),
-                 CloudburstReference(warehouse_key + 'W_STATE', True),
-                 CloudburstReference(warehouse_key + 'W_ZIP', True),
-                 CloudburstReference(warehouse_key + 'W_YTD', True)]
+    warehouse = references(warehouse_key, PAYMENT_WAREHOUSE_COLUMNS)
 
     district_key = 'DISTRICT.%s.%s.' % (w_id, d_id)
 
-    district = [CloudburstReference(district_key + "D_ID", True),
-                CloudburstReference(district_key + "D_W_ID", True),
-                CloudburstReference(district_key + "D_NAME", True),
-                CloudburstReference(district_key + "D_STREET_1", True),
-                CloudburstReference(district_key + "D_STREET_2", True),
-                CloudburstReference(district_key + "D_CITY", True),
-                CloudburstReference(district_key + "D_STATE", True),
-                CloudburstReference(district_key + "D_ZIP", True),
-                CloudburstReference(district_key + "D_TAX", True),
-                CloudburstReference(district_key + "D_YTD", True),
-                CloudburstReference(district_key + "D_NEXT_O_ID", True)]
+    district = references(district_key, DISTRICT_COLUMNS)
 
     return warehouse, district, client
 
 def doPaymentFunction(cloudburst, write_set, params, constant_bad_credit, constant_max_c_data,
                       warehouse, district, customer):
+    # Project the columns out of the rows
+    warehouse = project(warehouse, PAYMENT_WAREHOUSE_COLUMNS)
+    district = project(district, DISTRICT_COLUMNS)
+    customer = project(customer, CUSTOMER_COLUMNS)
+
     # Initialize transaction properties
     w_id = params["w_id"]
     d_id = params["d_id"]
@@ -713,29 +782,20 @@ def doPaymentFunction(cloudburst, write_set, params, constant_bad_credit, consta
         if len(c_data) > constant_max_c_data:
             c_data = c_data[:constant_max_c_data]
 
-        cloudburst.write(write_set, customer_key + 'C_BALANCE', c_balance)
-        cloudburst.write(write_set, customer_key + 'C_YTD_PAYMENT', c_ytd_payment)
-        cloudburst.write(write_set, customer_key + 'C_PAYMENT_CNT', c_payment_cnt)
-        cloudburst.write(write_set, customer_key + 'C_DATA', c_data)
+        writeColumns(cloudburst, write_set, customer_key, {'C_BALANCE': c_balance, 'C_YTD_PAYMENT': c_ytd_payment,
+                                                           'C_PAYMENT_CNT': c_payment_cnt, 'C_DATA': c_data})
 
     else:
-        cloudburst.write(write_set, customer_key + 'C_BALANCE', c_balance)
-        cloudburst.write(write_set, customer_key + 'C_YTD_PAYMENT', c_ytd_payment)
-        cloudburst.write(write_set, customer_key + 'C_PAYMENT_CNT', c_payment_cnt)
-        cloudburst.write(write_set, customer_key + 'C_DATA', '')
+        writeColumns(cloudburst, write_set, customer_key, {'C_BALANCE': c_balance, 'C_YTD_PAYMENT': c_ytd_payment,
+                                                           'C_PAYMENT_CNT': c_payment_cnt, 'C_DATA': ''})
 
     h_data = "%s    %s" % (warehouse[1], district[2])
 
     history_key = 'HISTORY.%s.' % str(uuid.uuid1())
 
-    cloudburst.write(write_set, history_key + 'H_C_ID', c_id)
-    cloudburst.write(write_set, history_key + 'H_C_D_ID', c_d_id)
-    cloudburst.write(write_set, history_key + 'H_C_W_ID', c_w_id)
-    cloudburst.write(write_set, history_key + 'H_D_ID', d_id)
-    cloudburst.write(write_set, history_key + 'H_W_ID', w_id)
-    cloudburst.write(write_set, history_key + 'H_DATE', h_date)
-    cloudburst.write(write_set, history_key + 'H_AMOUNT', h_amount)
-    cloudburst.write(write_set, history_key + 'H_DATA', h_data)
+    writeColumns(cloudburst, write_set, history_key, {'H_C_ID': c_id, 'H_C_D_ID': c_d_id, 'H_C_W_ID': c_w_id, 'H_D_ID': d_id,
+                                                      'H_W_ID': w_id, 'H_DATE': h_date, 'H_AMOUNT': h_amount,
+                                                      'H_DATA': h_data})
 
     return [warehouse, district, customer]
 
@@ -752,9 +812,10 @@ def getOrderID(cloudburst, write_set, params):
 
     district_key = 'DISTRICT.%s.%s.' % (w_id, d_id)
 
-    return CloudburstReference(district_key + 'D_NEXT_O_ID', True)
+    return references(district_key, ['D_NEXT_O_ID'])
 
 def getStockCount(cloudburst, write_set, params, next_o_id):
+    next_o_id = projectOne(next_o_id, 'D_NEXT_O_ID')
     w_id = params["w_id"]
     d_id = params["d_id"]
     order_lines = []
@@ -767,11 +828,12 @@ def getOrderLinesStockLevel(cloudburst, write_set, order_lines_index):
     items = []
     for order_lines in order_lines_index:
         for order_line in order_lines:
-            items.append(CloudburstReference(order_line + 'OL_I_ID', True))
+            items.extend(references(order_line, ['OL_I_ID']))
 
     return items
 
 def getStocks(cloudburst, write_set, params, items):
+    items = project(items, ['OL_I_ID'])
     w_id = params["w_id"]
     unique_items = []
     [unique_items.append(x) for x in items if x not in unique_items]
@@ -779,11 +841,12 @@ def getStocks(cloudburst, write_set, params, items):
     stocks = []
     for item in unique_items:
         stock_key = 'STOCK.%s.%s.' % (w_id, item)
-        stocks.append(CloudburstReference(stock_key + 'S_QUANTITY', True))
+        stocks.extend(references(stock_key, ['S_QUANTITY']))
 
     return stocks
 
 def doStockLevelFunction(cloudburst, write_set, params, stocks):
+    stocks = project(stocks, ['S_QUANTITY'])
     threshold = params["threshold"]
     stock_counts = {}
     stock_count = 0
@@ -807,6 +870,11 @@ lattice = serializer.dump_lattice(value_output, MultiKeyCausalLattice)
 print("Inserting key " + real_output_key)
 cloudburst.kvs_client.put(real_output_key, lattice)
 
+# Publish the layout, which the drivers check against their own
+lattice = serializer.dump_lattice({'layout': layout, 'updated_columns': UPDATED_COLUMNS}, MultiKeyCausalLattice)
+print("Inserting key " + LAYOUT_KEY)
+cloudburst.kvs_client.put(LAYOUT_KEY, lattice)
+
 # Register doNewOrder functions
 cloudburst.register(doNewOrderFunction, doNewOrderFunctionName)
 
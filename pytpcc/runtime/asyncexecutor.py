@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import sys
+import copy
+import time
+import asyncio
+import contextvars
+import traceback
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from util import *
+from runtime.executor import Executor, abortReason, finishTransaction
+from drivers.abstractdriver import ConflictError
+
+## The retry stats of the transaction that the current asyncio task ran last
+lastRetryStats = contextvars.ContextVar("lastRetryStats", default=(0, 0.0))
+
+## ==============================================
+## SyncDriverAdapter
+## ==============================================
+class SyncDriverAdapter:
+    """
+        Lets the AsyncExecutor use a regular blocking driver. The adapter runs
+        transactions on 'size' threads. Each thread gets a driver instance of
+        its own, unless the driver is thread-safe and all of them can share one.
+    """
+
+    def __init__(self, driverFactory, size):
+        assert size > 0
+        self.drivers = [ driverFactory() ]
+        if not self.drivers[0].isThreadSafe():
+            self.drivers += [ driverFactory() for i in range(size-1) ]
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=size)
+        self.idle = None
+    ## DEF
+
+    def __str__(self):
+        return "%s x%d" % (self.drivers[0], self.size)
+
+    def isAsync(self):
+        return True
+
+    def getRetryStats(self):
+        return lastRetryStats.get()
+
+    def executeStart(self):
+        for driver in self.drivers: driver.executeStart()
+
+    def executeFinish(self):
+        for driver in self.drivers: driver.executeFinish()
+        self.pool.shutdown()
+
+    async def executeTransactionAsync(self, txn, params):
+        ## The queue has to be created from inside the running event loop
+        if self.idle == None:
+            self.idle = asyncio.Queue()
+            for i in range(self.size): self.idle.put_nowait(self.drivers[i % len(self.drivers)])
+
+        driver = await self.idle.get()
+        ## The driver's stats are per thread, so they have to be picked up on the pool's thread
+        stats = [ (0, 0.0) ]
+        def run():
+            try:
+                return driver.executeTransaction(txn, params)
+            finally:
+                stats[0] = driver.getRetryStats()
+        ## DEF
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, run)
+        finally:
+            lastRetryStats.set(stats[0])
+            self.idle.put_nowait(driver)
+    ## DEF
+## CLASS
+
+## ==============================================
+## AsyncExecutor
+## ==============================================
+class AsyncExecutor(Executor):
+    """
+        Executor that multiplexes many concurrent terminals on a single asyncio
+        event loop. The driver must either be an async driver (isAsync() is True)
+        or be wrapped in a SyncDriverAdapter.
+    """
+
+    def __init__(self, driver, scaleParameters, txnprob, concurrency = 1, **kwargs):
+        Executor.__init__(self, driver, scaleParameters, txnprob, **kwargs)
+        assert driver.isAsync(), "%s does not support asyncio (wrap it in a SyncDriverAdapter)" % driver
+        assert concurrency > 0
+        self.concurrency = concurrency
+    ## DEF
+
+    def execute(self, duration, warmup = 0, cooldown = 0):
+        """Run 'concurrency' terminals that pick any warehouse for each transaction"""
+        homes = [ (None, None) ] * self.concurrency
+        return asyncio.run(self.runTerminals(homes, duration, warmup, cooldown))
+    ## DEF
+
+    def executeTerminals(self, w_ids, terminals, duration, warmup = 0, cooldown = 0):
+        """Run 'terminals' terminals with a fixed home warehouse and district for each of the given warehouses"""
+        homes = [ ]
+        for w_id in w_ids:
+            for i in range(terminals):
+                homes.append((w_id, (i % self.scaleParameters.districtsPerWarehouse) + 1))
+        ## FOR
+        if not homes: return results.Results(self.interval)
+        return asyncio.run(self.runTerminals(homes, duration, warmup, cooldown))
+    ## DEF
+
+    async def runTerminals(self, homes, duration, warmup, cooldown):
+        ## Everything runs on this one thread, so all of the terminals can
+        ## safely record into the same Results
+        r = results.Results(self.interval)
+        start = time.time()
+        measure_start = start + warmup
+        measure_stop = measure_start + duration
+        stop = measure_stop + cooldown
+        r.startBenchmark(measure_start)
+
+        logging.info("Starting %d asyncio terminals" % len(homes))
+        if warmup: logging.info("Warming up for %d seconds" % warmup)
+
+        ## In open-loop mode the client's arrival rate is split evenly between its terminals
+        terminal_rate = self.arrival_rate / float(len(homes)) if self.arrival_rate else None
+
+        tasks = [ ]
+        for w_id, d_id in homes:
+            t = copy.copy(self)
+            t.home_w_id = w_id
+            t.home_d_id = d_id
+            t.arrival_rate = terminal_rate
+            tasks.append(t.runTerminal(r, start, measure_start, measure_stop, stop))
+        ## FOR
+        self.next_interval = 0
+        if self.reportsIntervals():
+            if self.interval_stream: self.interval_stream.write(results.INTERVAL_HEADER + "\n")
+            tasks.append(self.runReporter(r, stop))
+        await asyncio.gather(*tasks)
+
+        r.stopBenchmark(min(time.time(), measure_stop))
+        if self.reportsIntervals():
+            self.reportIntervals(r, self.next_interval, None)
+        return (r)
+    ## DEF
+
+    async def runTerminal(self, r, start, measure_start, measure_stop, stop):
+        """The async counterpart of Executor.execute for a single terminal"""
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        next_arrival = start
+        think = 0
+
+        while True:
+            if think: await self.pause(think, stop)
+            txn, params = self.doOne()
+            if self.think_scale != None:
+                await self.pause(self.keyingTime(txn), stop)
+                think = self.thinkTime(txn)
+
+            intended = None
+            if self.arrival_rate:
+                intended = next_arrival
+                next_arrival += self.interArrivalTime()
+                if intended > stop or time.time() > stop: break
+                delay = intended - time.time()
+                if delay > 0: await asyncio.sleep(delay)
+            ## IF
+
+            now = time.time() if intended == None else intended
+            if now > stop: break
+            measuring = (measure_start <= now and now <= measure_stop)
+            txn_id = r.startTransaction(txn, intended) if measuring else None
+
+            if debug: logging.debug("Executing '%s' transaction" % txn)
+            retried = [ 0, 0.0 ]
+            try:
+                val = await self.executeWithRetriesAsync(txn, params, retried)
+            except (Exception, AssertionError) as ex:
+                logging.warn("Failed to execute Transaction '%s': %s" % (txn, ex))
+                if debug: traceback.print_exc(file=sys.stdout)
+                if self.stop_on_error: raise
+                if txn_id != None: finishTransaction(r, txn_id, txn, retried, measure_stop, abortReason(ex))
+                continue
+
+            if txn_id != None: finishTransaction(r, txn_id, txn, retried, measure_stop)
+        ## WHILE
+    ## DEF
+
+    async def executeWithRetriesAsync(self, txn, params, retried):
+        """The async counterpart of Executor.executeWithRetries"""
+        attempt = 0
+        while True:
+            try:
+                return await self.driver.executeTransactionAsync(txn, params)
+            except ConflictError as ex:
+                if attempt >= self.max_retries: raise
+                logging.debug("Retrying '%s' transaction after a conflict: %s" % (txn, ex))
+                delay = self.retryDelay(attempt)
+                await asyncio.sleep(delay)
+                attempt += 1
+                retried[0] += 1
+                retried[1] += delay
+            finally:
+                retries, lock_wait = self.driver.getRetryStats()
+                retried[0] += retries
+                retried[1] += lock_wait
+        ## WHILE
+    ## DEF
+
+    async def runReporter(self, r, stop):
+        """Stream and publish the time series while the terminals are running"""
+        while time.time() < stop:
+            await asyncio.sleep(min(self.interval, max(stop - time.time(), 0)))
+            now = time.time()
+            if now >= r.start: self.next_interval = self.reportIntervals(r, self.next_interval, now)
+        ## WHILE
+    ## DEF
+
+    async def pause(self, seconds, stop):
+        """Sleep for the given number of seconds, but never past 'stop'"""
+        seconds = min(seconds, stop - time.time())
+        if seconds > 0: await asyncio.sleep(seconds)
+    ## DEF
+## CLASS
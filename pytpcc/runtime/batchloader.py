@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import constants
+from util import *
+from runtime.loader import Loader
+
+HAVE_NUMPY = (numpy != None)
+
+## ==============================================
+## BatchRandom
+## ==============================================
+class BatchRandom:
+    """
+        NumPy counterpart of the functions in util.rand that generates a whole
+        column of n values per call. The values follow the same distributions.
+    """
+
+    def __init__(self, rng = None):
+        assert HAVE_NUMPY, "NumPy is not installed"
+        self.rng = rng if rng != None else numpy.random.default_rng()
+    ## DEF
+
+    def number(self, minimum, maximum, n):
+        return self.rng.integers(minimum, maximum, n, endpoint=True)
+
+    def numberExcluding(self, minimum, maximum, excluding, n):
+        """excluding may be a scalar or an array of n values"""
+        num = self.number(minimum, maximum-1, n)
+        return num + (num >= excluding)
+    ## DEF
+
+    def fixedPoint(self, decimal_places, minimum, maximum, n):
+        multiplier = 10 ** decimal_places
+        int_min = int(minimum * multiplier + 0.5)
+        int_max = int(maximum * multiplier + 0.5)
+        return self.number(int_min, int_max, n) / float(multiplier)
+    ## DEF
+
+    def selectUniqueIds(self, numUnique, minimum, maximum):
+        """Returns a boolean mask over [minimum, maximum] with numUnique entries set"""
+        mask = numpy.zeros(maximum - minimum + 1, dtype=bool)
+        mask[self.rng.choice(maximum - minimum + 1, int(round(numUnique)), replace=False)] = True
+        return mask
+    ## DEF
+
+    def astring(self, minimum_length, maximum_length, n):
+        return self.randomStrings(minimum_length, maximum_length, ord('a'), 26, n)
+
+    def nstring(self, minimum_length, maximum_length, n):
+        return self.randomStrings(minimum_length, maximum_length, ord('0'), 10, n)
+
+    def randomStrings(self, minimum_length, maximum_length, baseByte, numCharacters, n):
+        """Fill one byte buffer with the characters for all n strings and then slice it up"""
+        lengths = self.number(minimum_length, maximum_length, n)
+        ends = numpy.cumsum(lengths)
+        chars = self.rng.integers(baseByte, baseByte + numCharacters, int(ends[-1]) if n else 0, dtype=numpy.uint8)
+        buf = chars.tobytes().decode("ascii")
+        starts = (ends - lengths).tolist()
+        return [ buf[start:end] for start, end in zip(starts, ends.tolist()) ]
+    ## DEF
+
+    def fillOriginal(self, strings, mask):
+        """Put ORIGINAL_STRING at a random position in every string selected by mask"""
+        originalLength = len(constants.ORIGINAL_STRING)
+        for i in numpy.flatnonzero(mask).tolist():
+            data = strings[i]
+            position = int(self.rng.integers(0, len(data) - originalLength, endpoint=True))
+            strings[i] = data[:position] + constants.ORIGINAL_STRING + data[position + originalLength:]
+        ## FOR
+        return strings
+    ## DEF
+
+    def lastNames(self, c_ids, maxCID):
+        """The C_LAST for each of the given customers, as in Loader.generateCustomer"""
+        names = [ rand.makeLastName(i) for i in range(1000) ]
+        min_cid = min(999, maxCID - 1)
+        if rand.nurandVar is None: rand.setNURand(nurand.makeForLoad())
+        n = len(c_ids)
+        randomIdx = ((self.number(0, 255, n) | self.number(0, min_cid, n)) + rand.nurandVar.cLast) % (min_cid + 1)
+        idx = numpy.where(c_ids <= 1000, c_ids - 1, randomIdx)
+        return [ names[i] for i in idx.tolist() ]
+    ## DEF
+## CLASS
+
+## ==============================================
+## BatchLoader
+## ==============================================
+class BatchLoader(Loader):
+    """
+        Loader that generates the ITEM, STOCK and per-district tables a column
+        at a time with NumPy instead of one value at a time.
+    """
+
+    def __init__(self, handle, scaleParameters, w_ids, needLoadItems, seed = None):
+        Loader.__init__(self, handle, scaleParameters, w_ids, needLoadItems, seed)
+        self.brand = BatchRandom()
+    ## DEF
+
+    ## ==============================================
+    ## usePartition
+    ## ==============================================
+    def usePartition(self, unit):
+        self.brand = BatchRandom(numpy.random.default_rng(rand.partitionSeed(self.seed, *unit)))
+        return Loader.usePartition(self, unit)
+    ## DEF
+
+    ## ==============================================
+    ## loadItemRange
+    ## ==============================================
+    def loadItemRange(self, first, last):
+        logging.debug("LOAD - %s: %5d / %d" % (constants.TABLENAME_ITEM, last, self.scaleParameters.items))
+        columns = self.generateItemColumns(first, last)
+        self.loadColumns(constants.TABLENAME_ITEM, columns)
+    ## DEF
+
+    ## ==============================================
+    ## loadStock
+    ## ==============================================
+    def loadStock(self, w_id, first, last):
+        logging.debug("LOAD - %s [W_ID=%d]: %5d / %d" % (constants.TABLENAME_STOCK, w_id, last, self.scaleParameters.items))
+        columns = self.generateStockColumns(w_id, first, last)
+        self.loadColumns(constants.TABLENAME_STOCK, columns)
+    ## DEF
+
+    ## ==============================================
+    ## loadDistrict
+    ## ==============================================
+    def loadDistrict(self, w_id, d_id):
+        d_next_o_id = self.scaleParameters.customersPerDistrict + 1
+        d_tuples = [ self.generateDistrict(w_id, d_id, d_next_o_id) ]
+        self.handle.loadTuples(constants.TABLENAME_DISTRICT, d_tuples)
+        
+        tables = self.generateDistrictColumns(w_id, d_id)
+        for tableName in [ constants.TABLENAME_CUSTOMER, constants.TABLENAME_ORDERS, constants.TABLENAME_ORDER_LINE,
+                           constants.TABLENAME_NEW_ORDER, constants.TABLENAME_HISTORY ]:
+            self.loadColumns(tableName, tables[tableName], len(tables[tableName][0]))
+    ## DEF
+
+    ## ==============================================
+    ## loadColumns
+    ## ==============================================
+    def loadColumns(self, tableName, columns, batch_size = None):
+        """Hand the columns to the driver as they are if it can take them,
+           otherwise as rows, batch_size rows at a time"""
+        if self.handle.supportsColumns():
+            self.handle.loadColumns(tableName, columns, len(columns[0]))
+            return
+        if batch_size == None: batch_size = self.batch_size
+        rows = [ list(row) for row in zip(*columns) ]
+        for i in range(0, len(rows), batch_size):
+            self.handle.loadTuples(tableName, rows[i:i+batch_size])
+    ## DEF
+
+    ## ==============================================
+    ## generateItemColumns
+    ## ==============================================
+    def generateItemColumns(self, first, last):
+        n = last - first + 1
+        original = self.brand.selectUniqueIds(n // 10, first, last)
+        i_id = list(range(first, last+1))
+        i_im_id = self.brand.number(constants.MIN_IM, constants.MAX_IM, n).tolist()
+        i_name = self.brand.astring(constants.MIN_I_NAME, constants.MAX_I_NAME, n)
+        i_price = self.brand.fixedPoint(constants.MONEY_DECIMALS, constants.MIN_PRICE, constants.MAX_PRICE, n).tolist()
+        i_data = self.brand.fillOriginal(self.brand.astring(constants.MIN_I_DATA, constants.MAX_I_DATA, n), original)
+        return [ i_id, i_im_id, i_name, i_price, i_data ]
+    ## DEF
+
+    ## ==============================================
+    ## generateStockColumns
+    ## ==============================================
+    def generateStockColumns(self, s_w_id, first, last):
+        n = last - first + 1
+        s_i_id = list(range(first, last+1))
+        s_quantity = self.brand.number(constants.MIN_QUANTITY, constants.MAX_QUANTITY, n).tolist()
+        s_dists = [ self.brand.astring(constants.DIST, constants.DIST, n) for i in range(0, constants.DISTRICTS_PER_WAREHOUSE) ]
+        s_data = self.brand.astring(constants.MIN_I_DATA, constants.MAX_I_DATA, n)
+        ## Loader.generateStock throws away the result of fillOriginal, so
+        ## the "original" rows are not marked here either
+        return [ s_i_id, [ s_w_id ] * n, s_quantity ] + \
+               s_dists + \
+               [ [ 0 ] * n, [ 0 ] * n, [ 0 ] * n, s_data ]
+    ## DEF
+
+    ## ==============================================
+    ## generateDistrictColumns
+    ## ==============================================
+    def generateDistrictColumns(self, w_id, d_id):
+        """Returns a map from table name to the columns of all of the tuples that belong to the district"""
+        brand = self.brand
+        numCustomers = self.scaleParameters.customersPerDistrict
+        assert numCustomers <= constants.CUSTOMERS_PER_DISTRICT
+        now = self.now()
+        tables = { }
+
+        ## CUSTOMER
+        c_ids = numpy.arange(1, numCustomers+1)
+        badCredit = brand.selectUniqueIds(numCustomers / 10, 1, numCustomers)
+        tables[constants.TABLENAME_CUSTOMER] = [
+            c_ids.tolist(), [ d_id ] * numCustomers, [ w_id ] * numCustomers,
+            brand.astring(constants.MIN_FIRST, constants.MAX_FIRST, numCustomers),
+            [ constants.MIDDLE ] * numCustomers,
+            brand.lastNames(c_ids, constants.CUSTOMERS_PER_DISTRICT),
+            brand.astring(constants.MIN_STREET, constants.MAX_STREET, numCustomers),
+            brand.astring(constants.MIN_STREET, constants.MAX_STREET, numCustomers),
+            brand.astring(constants.MIN_CITY, constants.MAX_CITY, numCustomers),
+            brand.astring(constants.STATE, constants.STATE, numCustomers),
+            self.generateZips(numCustomers),
+            brand.nstring(constants.PHONE, constants.PHONE, numCustomers),
+            [ now ] * numCustomers,
+            numpy.where(badCredit, constants.BAD_CREDIT, constants.GOOD_CREDIT).tolist(),
+            [ constants.INITIAL_CREDIT_LIM ] * numCustomers,
+            brand.fixedPoint(constants.DISCOUNT_DECIMALS, constants.MIN_DISCOUNT, constants.MAX_DISCOUNT, numCustomers).tolist(),
+            [ constants.INITIAL_BALANCE ] * numCustomers,
+            [ constants.INITIAL_YTD_PAYMENT ] * numCustomers,
+            [ constants.INITIAL_PAYMENT_CNT ] * numCustomers,
+            [ constants.INITIAL_DELIVERY_CNT ] * numCustomers,
+            brand.astring(constants.MIN_C_DATA, constants.MAX_C_DATA, numCustomers),
+        ]
+
+        ## HISTORY
+        tables[constants.TABLENAME_HISTORY] = [
+            c_ids.tolist(), [ d_id ] * numCustomers, [ w_id ] * numCustomers,
+            [ d_id ] * numCustomers, [ w_id ] * numCustomers,
+            [ now ] * numCustomers, [ constants.INITIAL_AMOUNT ] * numCustomers,
+            brand.astring(constants.MIN_DATA, constants.MAX_DATA, numCustomers),
+        ]
+
+        ## ORDERS
+        ## The last newOrdersPerDistrict are new orders
+        o_ids = c_ids
+        newOrder = (numCustomers - self.scaleParameters.newOrdersPerDistrict) < o_ids
+        o_ol_cnt = brand.number(constants.MIN_OL_CNT, constants.MAX_OL_CNT, numCustomers)
+        o_carrier_id = numpy.where(newOrder, constants.NULL_CARRIER_ID,
+                                   brand.number(constants.MIN_CARRIER_ID, constants.MAX_CARRIER_ID, numCustomers))
+        tables[constants.TABLENAME_ORDERS] = [
+            o_ids.tolist(), (brand.rng.permutation(numCustomers) + 1).tolist(),
+            [ d_id ] * numCustomers, [ w_id ] * numCustomers, [ now ] * numCustomers,
+            o_carrier_id.tolist(), o_ol_cnt.tolist(), [ constants.INITIAL_ALL_LOCAL ] * numCustomers,
+        ]
+
+        ## NEW_ORDER
+        no_o_ids = o_ids[newOrder].tolist()
+        tables[constants.TABLENAME_NEW_ORDER] = [ no_o_ids, [ d_id ] * len(no_o_ids), [ w_id ] * len(no_o_ids) ]
+
+        ## ORDER_LINE
+        ## Every order gets o_ol_cnt lines, numbered from zero
+        numLines = int(o_ol_cnt.sum())
+        ol_o_id = numpy.repeat(o_ids, o_ol_cnt)
+        ol_number = numpy.arange(numLines) - numpy.repeat(numpy.cumsum(o_ol_cnt) - o_ol_cnt, o_ol_cnt)
+        ol_new = numpy.repeat(newOrder, o_ol_cnt)
+        ol_i_id = brand.number(1, self.scaleParameters.items, numLines)
+
+        ## 1% of items are from a remote warehouse
+        ol_supply_w_id = numpy.full(numLines, w_id)
+        remote = brand.number(1, 100, numLines) == 1
+        if self.scaleParameters.warehouses > 1:
+            others = brand.numberExcluding(self.scaleParameters.starting_warehouse,
+                                           self.scaleParameters.ending_warehouse,
+                                           w_id, numLines)
+            ol_supply_w_id = numpy.where(remote, others, ol_supply_w_id)
+        ## IF
+
+        ol_amount = numpy.where(ol_new,
+                                brand.fixedPoint(constants.MONEY_DECIMALS, constants.MIN_AMOUNT, constants.MAX_PRICE * constants.MAX_OL_QUANTITY, numLines),
+                                0.00)
+        ol_delivery_d = [ now ] * numLines
+        for i in numpy.flatnonzero(ol_new).tolist(): ol_delivery_d[i] = None
+        tables[constants.TABLENAME_ORDER_LINE] = [
+            ol_o_id.tolist(), [ d_id ] * numLines, [ w_id ] * numLines, ol_number.tolist(),
+            ol_i_id.tolist(), ol_supply_w_id.tolist(), ol_delivery_d,
+            [ constants.INITIAL_QUANTITY ] * numLines, ol_amount.tolist(),
+            brand.astring(constants.DIST, constants.DIST, numLines),
+        ]
+        return tables
+    ## DEF
+
+    ## ==============================================
+    ## generateZips
+    ## ==============================================
+    def generateZips(self, n):
+        length = constants.ZIP_LENGTH - len(constants.ZIP_SUFFIX)
+        return [ z + constants.ZIP_SUFFIX for z in self.brand.nstring(length, length, n) ]
+    ## DEF
+## CLASS
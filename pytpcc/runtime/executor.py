@@ -30,7 +30,9 @@
 # -----------------------------------------------------------------------
 
 import sys
+import copy
 import multiprocessing
+import threading
 import time
 import random
 import traceback
@@ -40,49 +42,287 @@ from pprint import pprint,pformat
 
 import constants
 from util import *
+from drivers.abstractdriver import ConflictError
 
+## Inter-arrival time distributions for open-loop execution
+ARRIVAL_POISSON = "poisson"
+ARRIVAL_CONSTANT = "constant"
+ARRIVAL_DISTRIBUTIONS = [ ARRIVAL_POISSON, ARRIVAL_CONSTANT ]
+
+## Upper bound of the backoff between retries of a transaction that hit a conflict
+MAX_RETRY_BACKOFF = 1.0
+
+## ==============================================
+## abortReason
+## ==============================================
+def abortReason(ex):
+    """The reason that a failed transaction gets counted under in the Results"""
+    if isinstance(ex, ConflictError): return ex.reason
+    return type(ex).__name__
+## DEF
+
+## ==============================================
+## finishTransaction
+## ==============================================
+def finishTransaction(r, txn_id, txn, retried, measure_stop, abort_reason = None):
+    """Record a measured transaction that just finished, unless it finished after the
+       measurement window closed (it is then only counted as late)"""
+    if time.time() > measure_stop:
+        r.dropTransaction(txn_id)
+        return
+    r.recordRetries(txn, retried[0], retried[1])
+    if abort_reason != None: r.abortTransaction(txn_id, abort_reason)
+    else: r.stopTransaction(txn_id)
+## DEF
 
 class Executor:
     
-    def __init__(self, driver, scaleParameters, txnprob, stop_on_error = False):
+    def __init__(self, driver, scaleParameters, txnprob, stop_on_error = False, interval = None, interval_stream = None,
+                 arrival_rate = None, arrival_dist = ARRIVAL_POISSON, think_scale = None,
+                 max_retries = 0, retry_backoff = 0.001, progress_queue = None):
         self.driver = driver
         self.scaleParameters = scaleParameters
         self.stop_on_error = stop_on_error
         self.txnprob = [ sum(txnprob[:i+1]) for i in range(len(txnprob)) ]
+        
+        ## Time-series buckets are recorded every 'interval' seconds and
+        ## written out to 'interval_stream' (if given) as soon as they close
+        self.interval = interval
+        self.interval_stream = interval_stream
+        
+        ## Closed time-series buckets are also put on 'progress_queue' (if given)
+        ## so that the parent process can show the progress while running
+        self.progress_queue = progress_queue
+        
+        ## Open-loop mode: transactions are issued on a fixed schedule of
+        ## 'arrival_rate' txn/s instead of as soon as the previous one returns
+        assert arrival_dist in ARRIVAL_DISTRIBUTIONS, "Unexpected arrival distribution '%s'" % arrival_dist
+        self.arrival_rate = arrival_rate
+        self.arrival_dist = arrival_dist
+        
+        ## Terminal emulation: wait out the TPC-C keying and think times
+        ## (multiplied by 'think_scale') around every transaction
+        self.think_scale = think_scale
+        
+        ## Transactions that fail with a ConflictError are run again up to 'max_retries'
+        ## times, after an exponential backoff that starts at 'retry_backoff' seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        
+        ## Set when this Executor is one emulated terminal out of many
+        self.home_w_id = None
+        self.home_d_id = None
     ## DEF
     
-    def execute(self, duration):
-        r = results.Results()
+    def execute(self, duration, warmup = 0, cooldown = 0):
+        """Run transactions for warmup + duration + cooldown seconds. Only the
+           transactions that start and finish inside the 'duration' window are
+           recorded in the returned Results. The ones that start inside of it but
+           finish after it are only counted as late."""
+        r = results.Results(self.interval)
         assert r
-        logging.info("Executing benchmark for %d seconds" % duration)
-        start = r.startBenchmark()
+        ## Emulated terminals run side by side, so keep their chatter out of the log
+        log = logging.debug if self.home_w_id != None else logging.info
+        if warmup: log("Warming up for %d seconds" % warmup)
+        start = time.time()
+        measure_start = start + warmup
+        measure_stop = measure_start + duration
+        stop = measure_stop + cooldown
         debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        
+        next_interval = 0
+        if self.interval_stream and self.interval:
+            self.interval_stream.write(results.INTERVAL_HEADER + "\n")
+        
+        next_arrival = start
+        max_lag = 0
+        think = 0
 
-        while (time.time() - start) <= duration:
+        while True:
+            if think: self.pause(think, stop)
             txn, params = self.doOne()
-            txn_id = r.startTransaction(txn)
+            if self.think_scale != None:
+                self.pause(self.keyingTime(txn), stop)
+                think = self.thinkTime(txn)
+            
+            ## In open-loop mode, wait for the transaction's scheduled start time.
+            ## If we are already behind then it goes out right away, but its
+            ## latency is still measured from when it should have started.
+            intended = None
+            if self.arrival_rate:
+                intended = next_arrival
+                next_arrival += self.interArrivalTime()
+                if intended > stop or time.time() > stop: break
+                delay = intended - time.time()
+                if delay > 0: time.sleep(delay)
+                else: max_lag = max(max_lag, -delay)
+            ## IF
+            
+            now = time.time() if intended == None else intended
+            if now > stop: break
+            
+            ## Open and close the measurement window
+            if r.start == None and now >= measure_start:
+                log("Executing benchmark for %d seconds" % duration)
+                r.startBenchmark(measure_start)
+            if r.stop == None and now > measure_stop:
+                r.stopBenchmark(measure_stop)
+                if cooldown: log("Cooling down for %d seconds" % cooldown)
+            measuring = (r.start != None and r.stop == None)
+            
+            if measuring and self.reportsIntervals():
+                next_interval = self.reportIntervals(r, next_interval, now)
+            
+            txn_id = r.startTransaction(txn, intended) if measuring else None
             
             if debug: logging.debug("Executing '%s' transaction" % txn)
+            retried = [ 0, 0.0 ]
             try:
-                val = self.driver.executeTransaction(txn, params)
+                val = self.executeWithRetries(txn, params, retried)
             except KeyboardInterrupt:
                 return -1
             except (Exception, AssertionError) as ex:
                 logging.warn("Failed to execute Transaction '%s': %s" % (txn, ex))
                 if debug: traceback.print_exc(file=sys.stdout)
                 if self.stop_on_error: raise
-                r.abortTransaction(txn_id)
+                if txn_id != None: finishTransaction(r, txn_id, txn, retried, measure_stop, abortReason(ex))
                 continue
 
             #if debug: logging.debug("%s\nParameters:\n%s\nResult:\n%s" % (txn, pformat(params), pformat(val)))
             
-            r.stopTransaction(txn_id)
+            if txn_id != None: finishTransaction(r, txn_id, txn, retried, measure_stop)
         ## WHILE
-            
-        r.stopBenchmark()
+        
+        if r.start == None: r.startBenchmark(measure_start)
+        if r.stop == None: r.stopBenchmark(min(time.time(), measure_stop))
+        if max_lag > 0:
+            logging.warn("Open-loop client fell up to %.03f seconds behind its %.02f txn/s schedule" % (max_lag, self.arrival_rate))
+        if self.reportsIntervals():
+            self.reportIntervals(r, next_interval, None)
         return (r)
     ## DEF
     
+    def executeWithRetries(self, txn, params, retried):
+        """Execute the transaction, and execute it again for as long as it fails with a
+           ConflictError and has retries left. The retries and the seconds spent waiting
+           (both by the driver and here) are added to 'retried'."""
+        attempt = 0
+        while True:
+            try:
+                return self.driver.executeTransaction(txn, params)
+            except ConflictError as ex:
+                if attempt >= self.max_retries: raise
+                logging.debug("Retrying '%s' transaction after a conflict: %s" % (txn, ex))
+                delay = self.retryDelay(attempt)
+                time.sleep(delay)
+                attempt += 1
+                retried[0] += 1
+                retried[1] += delay
+            finally:
+                retries, lock_wait = self.driver.getRetryStats()
+                retried[0] += retries
+                retried[1] += lock_wait
+        ## WHILE
+    ## DEF
+    
+    def retryDelay(self, attempt):
+        """Exponential backoff with jitter before the given retry"""
+        return min(self.retry_backoff * (2 ** attempt), MAX_RETRY_BACKOFF) * random.uniform(0.5, 1.0)
+    ## DEF
+    
+    def executeTerminals(self, w_ids, terminals, duration, warmup = 0, cooldown = 0):
+        """Emulate 'terminals' terminals for each of the given warehouses. Every
+           terminal runs in its own thread with a fixed home warehouse and district.
+           They all call into this Executor's driver at the same time, so it has to
+           be thread-safe (the AsyncExecutor can run terminals on any driver)."""
+        assert self.driver.isThreadSafe(), "%s is not thread-safe (run its terminals on the AsyncExecutor)" % self.driver
+        terminal_results = [ ]
+        errors = [ ]
+        
+        def runTerminal(t):
+            try:
+                terminal_results.append(t.execute(duration, warmup, cooldown))
+            except (Exception, AssertionError) as ex:
+                errors.append(ex)
+        ## DEF
+        
+        threads = [ ]
+        for w_id in w_ids:
+            for i in range(terminals):
+                t = copy.copy(self)
+                t.home_w_id = w_id
+                t.home_d_id = (i % self.scaleParameters.districtsPerWarehouse) + 1
+                ## Per-terminal time series are merged at the end rather than streamed,
+                ## but each terminal still publishes its own progress
+                t.interval_stream = None
+                threads.append(threading.Thread(target=runTerminal, args=(t,)))
+        ## FOR
+        logging.info("Starting %d emulated terminals for %d warehouses" % (len(threads), len(w_ids)))
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        if errors: raise errors[0]
+        
+        r = results.Results(self.interval)
+        for tr in terminal_results:
+            if tr == -1: return -1
+            r.append(tr)
+        ## FOR
+        ## No terminals ran if there were no warehouses to run them for
+        if terminal_results:
+            r.start = min([ tr.start for tr in terminal_results ])
+            r.stop = max([ tr.stop for tr in terminal_results ])
+        return (r)
+    ## DEF
+    
+    def pause(self, seconds, stop):
+        """Sleep for the given number of seconds, but never past 'stop'"""
+        seconds = min(seconds, stop - time.time())
+        if seconds > 0: time.sleep(seconds)
+    ## DEF
+    
+    def keyingTime(self, txn):
+        """Keying time before the given transaction (TPC-C 5.2.5.7)"""
+        return constants.KEYING_TIMES[txn] * self.think_scale
+    ## DEF
+    
+    def thinkTime(self, txn):
+        """Think time after the given transaction: negative exponential, truncated (TPC-C 5.2.5.4)"""
+        mean = constants.THINK_TIMES[txn]
+        think = min(random.expovariate(1.0 / mean), mean * constants.MAX_THINK_TIME_FACTOR)
+        return think * self.think_scale
+    ## DEF
+    
+    def interArrivalTime(self):
+        """Return the number of seconds until the next open-loop transaction should start"""
+        if self.arrival_dist == ARRIVAL_POISSON:
+            return random.expovariate(self.arrival_rate)
+        return 1.0 / self.arrival_rate
+    ## DEF
+    
+    def reportsIntervals(self):
+        return self.interval and (self.interval_stream or self.progress_queue != None)
+    ## DEF
+    
+    def reportIntervals(self, r, next_interval, now):
+        """Write out and publish every interval that has closed before 'now' (or all
+           of them if 'now' is None). Returns the number of the next interval to report."""
+        if now == None:
+            last = max(r.intervals.keys()) + 1 if r.intervals else next_interval
+        else:
+            last = int((now - r.start) / self.interval)
+        if next_interval >= last: return (next_interval)
+        while next_interval < last:
+            if self.interval_stream:
+                for line in r.formatInterval(next_interval):
+                    self.interval_stream.write(line + "\n")
+            if self.progress_queue != None:
+                self.progress_queue.put((next_interval, r.intervals.get(next_interval, { })))
+            next_interval += 1
+        ## WHILE
+        if self.interval_stream: self.interval_stream.flush()
+        return (next_interval)
+    ## DEF
+    
     def doOne(self):
         """Selects and executes a transaction at random. The number of new order transactions executed per minute is the official "tpmC" metric. See TPC-C 5.4.2 (page 71)."""
         
@@ -223,12 +463,14 @@ class Executor:
     def generateStockLevelParams(self):
         """Returns parameters for STOCK_LEVEL"""
         w_id = self.makeWarehouseId()
-        d_id = self.makeDistrictId()
+        ## An emulated terminal always checks the stock level of its own district
+        d_id = self.home_d_id if self.home_d_id != None else self.makeDistrictId()
         threshold = rand.number(constants.MIN_STOCK_LEVEL_THRESHOLD, constants.MAX_STOCK_LEVEL_THRESHOLD)
         return makeParameterDict(locals(), "w_id", "d_id", "threshold")
     ## DEF
 
     def makeWarehouseId(self):
+        if self.home_w_id != None: return self.home_w_id
         w_id = rand.number(self.scaleParameters.starting_warehouse, self.scaleParameters.ending_warehouse)
         assert(w_id >= self.scaleParameters.starting_warehouse), "Invalid W_ID: %d" % w_id
         assert(w_id <= self.scaleParameters.ending_warehouse), "Invalid W_ID: %d" % w_id
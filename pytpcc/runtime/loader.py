@@ -33,38 +33,58 @@ import os
 import sys
 
 import logging
+import random
 from datetime import datetime
-from random import shuffle
 from pprint import pprint,pformat
 
 import constants
 from util import *
 
+## Types of the independent pieces of work that the parallel loader hands out
+UNIT_ITEM = "item"
+UNIT_WAREHOUSE = "warehouse"
+UNIT_STOCK = "stock"
+UNIT_DISTRICT = "district"
+
+## Number of ITEM or STOCK tuples in a single work unit
+UNIT_ITEMS = 10000
+
+## Timestamp used for every date column when loading with a seed
+SEEDED_LOAD_DATE = datetime(2011, 1, 1)
+
 class Loader:
     
-    def __init__(self, handle, scaleParameters, w_ids, needLoadItems):
+    def __init__(self, handle, scaleParameters, w_ids, needLoadItems, seed = None):
         self.handle = handle
         self.scaleParameters = scaleParameters
         self.w_ids = w_ids
         self.needLoadItems = needLoadItems
         self.batch_size = 2500
         
+        ## With a seed every work unit draws from its own RNG stream, so the
+        ## database comes out the same no matter how the units are spread out
+        self.seed = seed
+        if self.seed != None:
+            prev = rand.setRandom(random.Random(rand.partitionSeed(self.seed, "NURAND")))
+            rand.setNURand(nurand.makeForLoad())
+            rand.setRandom(prev)
+        ## IF
+        
     ## ==============================================
     ## execute
     ## ==============================================
     def execute(self):
+        first, stock, districts = self.makeWorkUnits()
         
-        ## Item Table
+        ## Item Table and the WAREHOUSE tuples
+        for unit in first:
+            self.loadWorkUnit(unit)
         if self.needLoadItems:
-            logging.debug("Loading ITEM table")
-            self.loadItems()
             self.handle.loadFinishItem()
             
-        ## Then create the warehouse-specific tuples
-        for w_id in self.w_ids:
-            self.loadWarehouse(w_id)
-        for w_id in self.w_ids:
-            self.loadDistricts(w_id)
+        ## Then create the rest of the warehouse-specific tuples
+        for unit in stock + districts:
+            self.loadWorkUnit(unit)
         for w_id in self.w_ids:
             self.handle.loadFinishWarehouse(w_id)
         ## FOR
@@ -72,16 +92,82 @@ class Loader:
         return (None)
 
     ## ==============================================
-    ## loadItems
+    ## makeWorkUnits
     ## ==============================================
-    def loadItems(self):
+    def makeWorkUnits(self):
+        """
+            Split everything this Loader is responsible for into work units that
+            can be loaded independently. Units are returned in phases: every unit
+            of a phase has to be loaded before any unit of the next phase, so that
+            rows are never loaded before the rows that they reference.
+        """
+        items = self.scaleParameters.items
+        first = [ ]
+        if self.needLoadItems:
+            for i_id in range(1, items+1, UNIT_ITEMS):
+                first.append((UNIT_ITEM, i_id, min(i_id + UNIT_ITEMS - 1, items)))
+        ## IF
+        stock = [ ]
+        districts = [ ]
+        for w_id in self.w_ids:
+            first.append((UNIT_WAREHOUSE, w_id))
+            for i_id in range(1, items+1, UNIT_ITEMS):
+                stock.append((UNIT_STOCK, w_id, i_id, min(i_id + UNIT_ITEMS - 1, items)))
+            for d_id in range(1, self.scaleParameters.districtsPerWarehouse+1):
+                districts.append((UNIT_DISTRICT, w_id, d_id))
+        ## FOR
+        return [ first, stock, districts ]
+    ## DEF
+
+    ## ==============================================
+    ## loadWorkUnit
+    ## ==============================================
+    def loadWorkUnit(self, unit):
+        """Load a single unit returned by makeWorkUnits"""
+        prev = self.usePartition(unit) if self.seed != None else None
+        try:
+            if unit[0] == UNIT_ITEM:
+                self.loadItemRange(unit[1], unit[2])
+            elif unit[0] == UNIT_WAREHOUSE:
+                self.loadWarehouseTuple(unit[1])
+            elif unit[0] == UNIT_STOCK:
+                self.loadStock(unit[1], unit[2], unit[3])
+            elif unit[0] == UNIT_DISTRICT:
+                self.loadDistrict(unit[1], unit[2])
+                self.handle.loadFinishDistrict(unit[1], unit[2])
+            else:
+                raise Exception("Unexpected work unit %s" % str(unit))
+        finally:
+            if prev != None: rand.setRandom(prev)
+    ## DEF
+
+    ## ==============================================
+    ## usePartition
+    ## ==============================================
+    def usePartition(self, unit):
+        """Switch util.rand over to the RNG stream of the given work unit and return the previous one"""
+        return rand.setRandom(random.Random(rand.partitionSeed(self.seed, *unit)))
+    ## DEF
+
+    ## ==============================================
+    ## now
+    ## ==============================================
+    def now(self):
+        """The value for the date columns of a new tuple"""
+        return SEEDED_LOAD_DATE if self.seed != None else datetime.now()
+    ## DEF
+
+    ## ==============================================
+    ## loadItemRange
+    ## ==============================================
+    def loadItemRange(self, first, last):
         ## Select 10% of the rows to be marked "original"
-        originalRows = rand.selectUniqueIds(self.scaleParameters.items / 10, 1, self.scaleParameters.items)
+        originalRows = rand.selectUniqueIds((last - first + 1) // 10, first, last)
         
         ## Load all of the items
         tuples = [ ]
-        total_tuples = 0
-        for i in range(1, self.scaleParameters.items+1):
+        total_tuples = first - 1
+        for i in range(first, last+1):
             original = (i in originalRows)
             tuples.append(self.generateItem(i, original))
             total_tuples += 1
@@ -96,20 +182,25 @@ class Loader:
     ## DEF
 
     ## ==============================================
-    ## loadWarehouse
+    ## loadWarehouseTuple
     ## ==============================================
-    def loadWarehouse(self, w_id):
+    def loadWarehouseTuple(self, w_id):
         logging.debug("LOAD - %s: %d / %d" % (constants.TABLENAME_WAREHOUSE, w_id, len(self.w_ids)))
         
         ## WAREHOUSE
         w_tuples = [ self.generateWarehouse(w_id) ]
         self.handle.loadTuples(constants.TABLENAME_WAREHOUSE, w_tuples)
+    ## DEF
 
+    ## ==============================================
+    ## loadStock
+    ## ==============================================
+    def loadStock(self, w_id, first, last):
         ## Select 10% of the stock to be marked "original"
         s_tuples = [ ]
-        selectedRows = rand.selectUniqueIds(self.scaleParameters.items / 10, 1, self.scaleParameters.items)
-        total_tuples = 0
-        for i_id in range(1, self.scaleParameters.items+1):
+        selectedRows = rand.selectUniqueIds((last - first + 1) // 10, first, last)
+        total_tuples = first - 1
+        for i_id in range(first, last+1):
             original = (i_id in selectedRows)
             s_tuples.append(self.generateStock(w_id, i_id, original))
             if len(s_tuples) >= self.batch_size:
@@ -121,69 +212,63 @@ class Loader:
         if len(s_tuples) > 0:
             logging.debug("LOAD - %s [W_ID=%d]: %5d / %d" % (constants.TABLENAME_STOCK, w_id, total_tuples, self.scaleParameters.items))
             self.handle.loadTuples(constants.TABLENAME_STOCK, s_tuples)
+    ## DEF
 
     ## ==============================================
-    ## loadDistricts
+    ## loadDistrict
     ## ==============================================
-    def loadDistricts(self, w_id):
-        logging.debug("LOAD - %s: %d / %d" % (constants.TABLENAME_WAREHOUSE, w_id, len(self.w_ids)))
-  
-        ## DISTRICT
-        d_tuples = [ ]
-        for d_id in range(1, self.scaleParameters.districtsPerWarehouse+1):
-            d_next_o_id = self.scaleParameters.customersPerDistrict + 1
-            d_tuples = [ self.generateDistrict(w_id, d_id, d_next_o_id) ]
-            
-            c_tuples = [ ]
-            h_tuples = [ ]
-            
-            ## Select 10% of the customers to have bad credit
-            selectedRows = rand.selectUniqueIds(self.scaleParameters.customersPerDistrict / 10, 1, self.scaleParameters.customersPerDistrict)
-            
-            ## TPC-C 4.3.3.1. says that o_c_id should be a permutation of [1, 3000]. But since it
-            ## is a c_id field, it seems to make sense to have it be a permutation of the
-            ## customers. For the "real" thing this will be equivalent
-            cIdPermutation = [ ]
-
-            for c_id in range(1, self.scaleParameters.customersPerDistrict+1):
-                badCredit = (c_id in selectedRows)
-                c_tuples.append(self.generateCustomer(w_id, d_id, c_id, badCredit, True))
-                h_tuples.append(self.generateHistory(w_id, d_id, c_id))
-                cIdPermutation.append(c_id)
-            ## FOR
-            assert cIdPermutation[0] == 1
-            assert cIdPermutation[self.scaleParameters.customersPerDistrict - 1] == self.scaleParameters.customersPerDistrict
-            shuffle(cIdPermutation)
-            
-            o_tuples = [ ]
-            ol_tuples = [ ]
-            no_tuples = [ ]
+    def loadDistrict(self, w_id, d_id):
+        """Load the DISTRICT tuple and all of the CUSTOMER, HISTORY and ORDERS tuples that hang off of it"""
+        d_next_o_id = self.scaleParameters.customersPerDistrict + 1
+        d_tuples = [ self.generateDistrict(w_id, d_id, d_next_o_id) ]
+        
+        c_tuples = [ ]
+        h_tuples = [ ]
+        
+        ## Select 10% of the customers to have bad credit
+        selectedRows = rand.selectUniqueIds(self.scaleParameters.customersPerDistrict / 10, 1, self.scaleParameters.customersPerDistrict)
+        
+        ## TPC-C 4.3.3.1. says that o_c_id should be a permutation of [1, 3000]. But since it
+        ## is a c_id field, it seems to make sense to have it be a permutation of the
+        ## customers. For the "real" thing this will be equivalent
+        cIdPermutation = [ ]
+
+        for c_id in range(1, self.scaleParameters.customersPerDistrict+1):
+            badCredit = (c_id in selectedRows)
+            c_tuples.append(self.generateCustomer(w_id, d_id, c_id, badCredit, True))
+            h_tuples.append(self.generateHistory(w_id, d_id, c_id))
+            cIdPermutation.append(c_id)
+        ## FOR
+        assert cIdPermutation[0] == 1
+        assert cIdPermutation[self.scaleParameters.customersPerDistrict - 1] == self.scaleParameters.customersPerDistrict
+        rand.shuffle(cIdPermutation)
+        
+        o_tuples = [ ]
+        ol_tuples = [ ]
+        no_tuples = [ ]
+        
+        for o_id in range(1, self.scaleParameters.customersPerDistrict+1):
+            o_ol_cnt = rand.number(constants.MIN_OL_CNT, constants.MAX_OL_CNT)
             
-            for o_id in range(1, self.scaleParameters.customersPerDistrict+1):
-                o_ol_cnt = rand.number(constants.MIN_OL_CNT, constants.MAX_OL_CNT)
-                
-                ## The last newOrdersPerDistrict are new orders
-                newOrder = ((self.scaleParameters.customersPerDistrict - self.scaleParameters.newOrdersPerDistrict) < o_id)
-                o_tuples.append(self.generateOrder(w_id, d_id, o_id, cIdPermutation[o_id - 1], o_ol_cnt, newOrder))
-
-                ## Generate each OrderLine for the order
-                for ol_number in range(0, o_ol_cnt):
-                    ol_tuples.append(self.generateOrderLine(w_id, d_id, o_id, ol_number, self.scaleParameters.items, newOrder))
-                ## FOR
-
-                ## This is a new order: make one for it
-                if newOrder: no_tuples.append([o_id, d_id, w_id])
+            ## The last newOrdersPerDistrict are new orders
+            newOrder = ((self.scaleParameters.customersPerDistrict - self.scaleParameters.newOrdersPerDistrict) < o_id)
+            o_tuples.append(self.generateOrder(w_id, d_id, o_id, cIdPermutation[o_id - 1], o_ol_cnt, newOrder))
+
+            ## Generate each OrderLine for the order
+            for ol_number in range(0, o_ol_cnt):
+                ol_tuples.append(self.generateOrderLine(w_id, d_id, o_id, ol_number, self.scaleParameters.items, newOrder))
             ## FOR
-            
-            self.handle.loadTuples(constants.TABLENAME_DISTRICT, d_tuples)
-            self.handle.loadTuples(constants.TABLENAME_CUSTOMER, c_tuples)
-            self.handle.loadTuples(constants.TABLENAME_ORDERS, o_tuples)
-            self.handle.loadTuples(constants.TABLENAME_ORDER_LINE, ol_tuples)
-            self.handle.loadTuples(constants.TABLENAME_NEW_ORDER, no_tuples)
-            self.handle.loadTuples(constants.TABLENAME_HISTORY, h_tuples)
-            self.handle.loadFinishDistrict(w_id, d_id)
+
+            ## This is a new order: make one for it
+            if newOrder: no_tuples.append([o_id, d_id, w_id])
         ## FOR
         
+        self.handle.loadTuples(constants.TABLENAME_DISTRICT, d_tuples)
+        self.handle.loadTuples(constants.TABLENAME_CUSTOMER, c_tuples)
+        self.handle.loadTuples(constants.TABLENAME_ORDERS, o_tuples)
+        self.handle.loadTuples(constants.TABLENAME_ORDER_LINE, ol_tuples)
+        self.handle.loadTuples(constants.TABLENAME_NEW_ORDER, no_tuples)
+        self.handle.loadTuples(constants.TABLENAME_HISTORY, h_tuples)
     ## DEF
 
     ## ==============================================
@@ -234,7 +319,7 @@ class Loader:
             c_last = rand.makeRandomLastName(constants.CUSTOMERS_PER_DISTRICT)
 
         c_phone = rand.nstring(constants.PHONE, constants.PHONE)
-        c_since = datetime.now()
+        c_since = self.now()
         c_credit = constants.BAD_CREDIT if badCredit else constants.GOOD_CREDIT
         c_credit_lim = constants.INITIAL_CREDIT_LIM
         c_discount = rand.fixedPoint(constants.DISCOUNT_DECIMALS, constants.MIN_DISCOUNT, constants.MAX_DISCOUNT)
@@ -261,7 +346,7 @@ class Loader:
     ## ==============================================
     def generateOrder(self, o_w_id, o_d_id, o_id, o_c_id, o_ol_cnt, newOrder):
         """Returns the generated o_ol_cnt value."""
-        o_entry_d = datetime.now()
+        o_entry_d = self.now()
         o_carrier_id = constants.NULL_CARRIER_ID if newOrder else rand.number(constants.MIN_CARRIER_ID, constants.MAX_CARRIER_ID)
         o_all_local = constants.INITIAL_ALL_LOCAL
         return [ o_id, o_c_id, o_d_id, o_w_id, o_entry_d, o_carrier_id, o_ol_cnt, o_all_local ]
@@ -273,7 +358,7 @@ class Loader:
     def generateOrderLine(self, ol_w_id, ol_d_id, ol_o_id, ol_number, max_items, newOrder):
         ol_i_id = rand.number(1, max_items)
         ol_supply_w_id = ol_w_id
-        ol_delivery_d = datetime.now()
+        ol_delivery_d = self.now()
         ol_quantity = constants.INITIAL_QUANTITY
 
         ## 1% of items are from a remote warehouse
@@ -320,7 +405,7 @@ class Loader:
     def generateHistory(self, h_c_w_id, h_c_d_id, h_c_id):
         h_w_id = h_c_w_id
         h_d_id = h_c_d_id
-        h_date = datetime.now()
+        h_date = self.now()
         h_amount = constants.INITIAL_AMOUNT
         h_data = rand.astring(constants.MIN_DATA, constants.MAX_DATA)
         return [ h_c_id, h_c_d_id, h_c_w_id, h_d_id, h_w_id, h_date, h_amount, h_data ]
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+
+import queue
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from util.histogram import Histogram
+
+## Percentiles of the latest interval that are exported as Prometheus quantiles
+QUANTILES = [ 50, 95, 99 ]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+## ==============================================
+## Progress
+## ==============================================
+class Progress:
+    """
+        Collects the time-series snapshots that the executors publish while the
+        benchmark is running (see Executor.reportIntervals) and aggregates them
+        across clients and terminals. Each snapshot is the tuple
+        (interval #, { txn_name: [ committed, aborted, Histogram ] }).
+    """
+    
+    def __init__(self, interval, ticker = None):
+        self.interval = interval
+        self.ticker = ticker
+        self.lock = threading.Lock()
+        
+        ## txn_name -> [ committed, aborted ] since the start of the run
+        self.totals = { }
+        ## interval # -> txn_name -> [ committed, aborted, Histogram ]
+        self.intervals = { }
+        self.last = None
+    ## DEF
+    
+    def add(self, idx, buckets):
+        with self.lock:
+            if not idx in self.intervals: self.intervals[idx] = { }
+            for txn_name, (committed, aborted, h) in buckets.items():
+                if not txn_name in self.totals: self.totals[txn_name] = [ 0, 0 ]
+                self.totals[txn_name][0] += committed
+                self.totals[txn_name][1] += aborted
+                if not txn_name in self.intervals[idx]:
+                    self.intervals[idx][txn_name] = [ 0, 0, Histogram() ]
+                bucket = self.intervals[idx][txn_name]
+                bucket[0] += committed
+                bucket[1] += aborted
+                bucket[2].merge(h)
+            ## FOR
+            if self.last == None or idx > self.last: self.last = idx
+    ## DEF
+    
+    def run(self, snapshots):
+        """Consume snapshots from the given queue until it hands out None. If there
+           is a ticker stream, a line is written to it after every interval."""
+        last_tick = None
+        while True:
+            try:
+                snapshot = snapshots.get(timeout=self.interval)
+            except queue.Empty:
+                snapshot = False
+            if snapshot == None: break
+            if snapshot: self.add(*snapshot)
+            
+            ## Clients publish an interval only after it closed for them, so the newest
+            ## one may still be missing some of them. Stick to the one before it.
+            idx = self.settled()
+            if self.ticker != None and idx != None and idx != last_tick:
+                self.ticker.write(self.formatTicker(idx) + "\n")
+                self.ticker.flush()
+                last_tick = idx
+        ## WHILE
+    ## DEF
+    
+    def settled(self):
+        """The number of the newest interval that every client has reported (most likely)"""
+        if self.last == None or self.last == 0: return None
+        return self.last - 1
+    ## DEF
+    
+    def summarize(self, idx):
+        """Return the committed, aborted and latency histogram of all transactions in the given interval"""
+        committed, aborted, h = 0, 0, Histogram()
+        for c, a, th in self.intervals.get(idx, { }).values():
+            committed += c
+            aborted += a
+            h.merge(th)
+        ## FOR
+        return (committed, aborted, h)
+    ## DEF
+    
+    def formatTicker(self, idx):
+        """Return a one-line summary of the given interval"""
+        with self.lock:
+            committed, aborted, h = self.summarize(idx)
+            new_order = self.intervals.get(idx, { }).get("NEW_ORDER", [ 0, 0, None ])[0]
+            total = sum([ c for c, a in self.totals.values() ])
+        abort_rate = 100.0 * aborted / (committed + aborted) if committed + aborted else 0.0
+        return "[%6.0fs] tpmC %.1f | %.1f txn/s | p50 %d µs | p95 %d µs | aborts %.2f%% | %d committed" % \
+               ((idx + 1) * self.interval, new_order * 60.0 / self.interval, committed / self.interval,
+                h.percentile(50), h.percentile(95), abort_rate, total)
+    ## DEF
+    
+    def formatPrometheus(self):
+        """Return the current metrics in the Prometheus text exposition format"""
+        with self.lock:
+            idx = self.settled()
+            buckets = self.intervals.get(idx, { }) if idx != None else { }
+            lines = [ ]
+            
+            lines.append("# HELP tpcc_transactions_total Transactions committed since the start of the measured run")
+            lines.append("# TYPE tpcc_transactions_total counter")
+            for txn_name in sorted(self.totals.keys()):
+                lines.append('tpcc_transactions_total{txn="%s"} %d' % (txn_name, self.totals[txn_name][0]))
+            lines.append("# HELP tpcc_aborts_total Transactions aborted since the start of the measured run")
+            lines.append("# TYPE tpcc_aborts_total counter")
+            for txn_name in sorted(self.totals.keys()):
+                lines.append('tpcc_aborts_total{txn="%s"} %d' % (txn_name, self.totals[txn_name][1]))
+            
+            lines.append("# HELP tpcc_elapsed_seconds End of the latest complete interval")
+            lines.append("# TYPE tpcc_elapsed_seconds gauge")
+            lines.append("tpcc_elapsed_seconds %.1f" % ((idx + 1) * self.interval if idx != None else 0.0))
+            lines.append("# HELP tpcc_tpmc NEW_ORDER transactions per minute in the latest complete interval")
+            lines.append("# TYPE tpcc_tpmc gauge")
+            lines.append("tpcc_tpmc %.2f" % (buckets.get("NEW_ORDER", [ 0 ])[0] * 60.0 / self.interval))
+            lines.append("# HELP tpcc_throughput Transactions committed per second in the latest complete interval")
+            lines.append("# TYPE tpcc_throughput gauge")
+            for txn_name in sorted(buckets.keys()):
+                lines.append('tpcc_throughput{txn="%s"} %.2f' % (txn_name, buckets[txn_name][0] / self.interval))
+            lines.append("# HELP tpcc_latency_microseconds Latency percentiles in the latest complete interval")
+            lines.append("# TYPE tpcc_latency_microseconds gauge")
+            for txn_name in sorted(buckets.keys()):
+                for p in QUANTILES:
+                    lines.append('tpcc_latency_microseconds{txn="%s",quantile="%s"} %d' % \
+                                 (txn_name, p / 100.0, buckets[txn_name][2].percentile(p)))
+            ## FOR
+        return ("\n".join(lines) + "\n")
+    ## DEF
+## CLASS
+
+## ==============================================
+## startProgress
+## ==============================================
+def startProgress(snapshots, interval, ticker = None, port = None, host = "127.0.0.1"):
+    """Start a thread that aggregates the snapshots from the given queue and, if a
+       port is given, an HTTP server that exposes them on /metrics. Returns the
+       Progress, the consumer thread and the server (or None)."""
+    progress = Progress(interval, ticker)
+    consumer = threading.Thread(target=progress.run, args=(snapshots,), daemon=True)
+    consumer.start()
+    
+    server = None
+    if port != None:
+        server = ThreadingHTTPServer((host, port), makeHandler(progress))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info("Serving live metrics on http://%s:%d/metrics" % (host, server.server_port))
+    return (progress, consumer, server)
+## DEF
+
+## ==============================================
+## stopProgress
+## ==============================================
+def stopProgress(snapshots, consumer, server):
+    """Let the consumer thread drain the queue and shut the HTTP server down"""
+    snapshots.put(None)
+    consumer.join()
+    if server != None:
+        server.shutdown()
+        server.server_close()
+## DEF
+
+## ==============================================
+## makeHandler
+## ==============================================
+def makeHandler(progress):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in [ "/", "/metrics" ]:
+                self.send_error(404)
+                return
+            body = progress.formatPrometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        ## DEF
+        
+        def log_message(self, format, *args):
+            logging.debug("Metrics request: " + format % args)
+        ## DEF
+    ## CLASS
+    return (MetricsHandler)
+## DEF
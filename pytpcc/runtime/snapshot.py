@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+
+import os
+import mmap
+import json
+import struct
+import logging
+from array import array
+from datetime import datetime, timedelta
+
+import constants
+from drivers.abstractdriver import AbstractDriver
+from runtime import loader
+from runtime.loader import Loader
+
+## ==============================================
+## File Format
+## ==============================================
+## Every (table, work unit) pair gets its own file:
+##
+##   header      MAGIC, number of tuples, number of columns
+##   directory   one entry per column: type, offset + length of the
+##               values, offset + length of the string data
+##   data        the column values, each section 8-byte aligned
+##
+## Numbers and dates are fixed-width little-endian arrays. Strings are an
+## array of count+1 offsets into a blob of UTF-8 data.
+
+MAGIC = b"TPCCCOL1"
+HEADER = struct.Struct("<8sQQ")
+COLUMN = struct.Struct("<c7xQQQQ")
+
+TYPE_INT = b"q"
+TYPE_FLOAT = b"d"
+TYPE_STRING = b"s"
+TYPE_DATE = b"t"
+TYPE_NULL = b"n"
+
+## Dates are stored as microseconds since EPOCH, with NULL_DATE for None
+EPOCH = datetime(1970, 1, 1)
+NULL_DATE = -(1 << 63)
+
+METADATA_FILE = "snapshot.json"
+
+## The tables that a single district work unit is made of, in load order
+DISTRICT_TABLES = [ constants.TABLENAME_DISTRICT, constants.TABLENAME_CUSTOMER, constants.TABLENAME_ORDERS,
+                    constants.TABLENAME_ORDER_LINE, constants.TABLENAME_NEW_ORDER, constants.TABLENAME_HISTORY ]
+
+## ==============================================
+## snapshotPath
+## ==============================================
+def snapshotPath(directory, tableName, unit):
+    return os.path.join(directory, "%s.%s.col" % (tableName, "-".join(map(str, unit))))
+## DEF
+
+## ==============================================
+## writeMetadata
+## ==============================================
+def writeMetadata(directory, scaleParameters, seed):
+    """Record what the snapshot was generated for, so that replaying can check that it matches"""
+    metadata = {
+        "items": scaleParameters.items,
+        "starting_warehouse": scaleParameters.starting_warehouse,
+        "ending_warehouse": scaleParameters.ending_warehouse,
+        "districtsPerWarehouse": scaleParameters.districtsPerWarehouse,
+        "customersPerDistrict": scaleParameters.customersPerDistrict,
+        "newOrdersPerDistrict": scaleParameters.newOrdersPerDistrict,
+        "unit_items": loader.UNIT_ITEMS,
+        "seed": seed,
+    }
+    with open(os.path.join(directory, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+## DEF
+
+## ==============================================
+## checkMetadata
+## ==============================================
+def checkMetadata(directory, scaleParameters):
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    for key in [ "items", "districtsPerWarehouse", "customersPerDistrict", "newOrdersPerDistrict" ]:
+        if metadata[key] != getattr(scaleParameters, key):
+            raise Exception("Snapshot in '%s' was generated with %s=%d, not %d" % (directory, key, metadata[key], getattr(scaleParameters, key)))
+    ## FOR
+    if metadata["unit_items"] != loader.UNIT_ITEMS:
+        raise Exception("Snapshot in '%s' was generated with a different work unit size" % directory)
+    if scaleParameters.starting_warehouse < metadata["starting_warehouse"] or scaleParameters.ending_warehouse > metadata["ending_warehouse"]:
+        raise Exception("Snapshot in '%s' only has warehouses %d-%d" % (directory, metadata["starting_warehouse"], metadata["ending_warehouse"]))
+    return metadata
+## DEF
+
+## ==============================================
+## writeColumns
+## ==============================================
+def writeColumns(path, columns, count):
+    """Write the given columns out to a new snapshot file"""
+    sections = [ ]
+    offset = HEADER.size + COLUMN.size * len(columns)
+    offset += -offset % 8
+    directory = [ ]
+    for values in columns:
+        assert len(values) == count
+        columnType, data, extra = encodeColumn(values)
+        entry = [ columnType ]
+        for section in (data, extra):
+            entry += [ offset, len(section) ]
+            sections.append((offset, section))
+            offset += len(section)
+            offset += -offset % 8
+        ## FOR
+        directory.append(COLUMN.pack(*entry))
+    ## FOR
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, len(columns)))
+        f.write(b"".join(directory))
+        for section_offset, section in sections:
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(section)
+        ## FOR
+    ## WITH
+    os.rename(tmp, path)
+## DEF
+
+## ==============================================
+## encodeColumn
+## ==============================================
+def encodeColumn(values):
+    """Returns the type of the column, its fixed-width values and its string data"""
+    sample = next((v for v in values if v != None), None)
+    if sample == None:
+        return (TYPE_NULL, b"", b"")
+    elif isinstance(sample, datetime):
+        encoded = array("q", [ NULL_DATE if v == None else (v - EPOCH) // timedelta(microseconds=1) for v in values ])
+        return (TYPE_DATE, encoded.tobytes(), b"")
+    elif isinstance(sample, str):
+        encoded = [ v.encode("utf-8") for v in values ]
+        offsets = array("Q", [ 0 ])
+        end = 0
+        for v in encoded:
+            end += len(v)
+            offsets.append(end)
+        ## FOR
+        return (TYPE_STRING, offsets.tobytes(), b"".join(encoded))
+    elif isinstance(sample, float):
+        return (TYPE_FLOAT, array("d", values).tobytes(), b"")
+    elif isinstance(sample, int):
+        return (TYPE_INT, array("q", values).tobytes(), b"")
+    raise Exception("Unsupported column type %s" % type(sample))
+## DEF
+
+## ==============================================
+## SnapshotFile
+## ==============================================
+class SnapshotFile:
+    """Memory-mapped snapshot file that decodes ranges of tuples on demand"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        magic, self.count, numColumns = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC: raise Exception("'%s' is not a snapshot file" % path)
+        self.columns = [ COLUMN.unpack_from(self.mm, HEADER.size + i * COLUMN.size) for i in range(numColumns) ]
+    ## DEF
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+    ## DEF
+
+    def readColumns(self, first, last):
+        """Return the values of the tuples in [first, last) as a list of columns"""
+        return [ self.readColumn(c, first, last) for c in self.columns ]
+
+    def readColumn(self, column, first, last):
+        columnType, offset, length, extra_offset, extra_length = column
+        if columnType == TYPE_NULL:
+            return [ None ] * (last - first)
+        elif columnType == TYPE_INT:
+            return self.view[offset + first*8:offset + last*8].cast("q").tolist()
+        elif columnType == TYPE_FLOAT:
+            return self.view[offset + first*8:offset + last*8].cast("d").tolist()
+        elif columnType == TYPE_DATE:
+            return [ None if v == NULL_DATE else EPOCH + timedelta(microseconds=v)
+                     for v in self.view[offset + first*8:offset + last*8].cast("q").tolist() ]
+        elif columnType == TYPE_STRING:
+            offsets = self.view[offset + first*8:offset + (last+1)*8].cast("Q").tolist()
+            blob = self.mm[extra_offset + offsets[0]:extra_offset + offsets[-1]].decode("utf-8")
+            base = offsets[0]
+            if len(blob) == offsets[-1] - base:
+                return [ blob[offsets[i]-base:offsets[i+1]-base] for i in range(last - first) ]
+            return [ self.mm[extra_offset + offsets[i]:extra_offset + offsets[i+1]].decode("utf-8") for i in range(last - first) ]
+        raise Exception("Unexpected column type %s" % columnType)
+    ## DEF
+## CLASS
+
+## ==============================================
+## SnapshotWriter
+## ==============================================
+class SnapshotWriter(AbstractDriver):
+    """
+        Stands in for the driver while a Loader generates a single work unit
+        and writes every table that it produced out to its own file.
+    """
+
+    def __init__(self, directory, unit):
+        super(SnapshotWriter, self).__init__("snapshot", None)
+        self.directory = directory
+        self.unit = unit
+        self.tables = { }
+        self.counts = { }
+    ## DEF
+
+    def supportsColumns(self):
+        return True
+
+    def loadTuples(self, tableName, tuples):
+        self.loadColumns(tableName, [ list(column) for column in zip(*tuples) ], len(tuples))
+
+    def loadColumns(self, tableName, columns, count):
+        ## Empty tables still get a file, so that replaying can tell them apart from missing ones
+        if not tableName in self.tables:
+            self.tables[tableName] = [ ]
+            self.counts[tableName] = 0
+        if count == 0: return
+        if not self.tables[tableName]:
+            self.tables[tableName] = [ [ ] for column in columns ]
+        for buffered, values in zip(self.tables[tableName], columns):
+            buffered.extend(values)
+        self.counts[tableName] += count
+    ## DEF
+
+    def close(self):
+        for tableName, columns in self.tables.items():
+            writeColumns(snapshotPath(self.directory, tableName, self.unit), columns, self.counts[tableName])
+        self.tables = { }
+        self.counts = { }
+    ## DEF
+## CLASS
+
+## ==============================================
+## SnapshotLoader
+## ==============================================
+class SnapshotLoader(Loader):
+    """Loader that replays a snapshot written by 'tpcc.py generate' instead of generating the tuples again"""
+
+    def __init__(self, handle, scaleParameters, w_ids, needLoadItems, directory):
+        Loader.__init__(self, handle, scaleParameters, w_ids, needLoadItems)
+        self.directory = directory
+        checkMetadata(directory, scaleParameters)
+    ## DEF
+
+    def loadItemRange(self, first, last):
+        self.replay(constants.TABLENAME_ITEM, (loader.UNIT_ITEM, first, last), self.batch_size)
+
+    def loadWarehouseTuple(self, w_id):
+        self.replay(constants.TABLENAME_WAREHOUSE, (loader.UNIT_WAREHOUSE, w_id))
+
+    def loadStock(self, w_id, first, last):
+        self.replay(constants.TABLENAME_STOCK, (loader.UNIT_STOCK, w_id, first, last), self.batch_size)
+
+    def loadDistrict(self, w_id, d_id):
+        ## Like Loader.loadDistrict, every table goes to the driver in one call
+        for tableName in DISTRICT_TABLES:
+            self.replay(tableName, (loader.UNIT_DISTRICT, w_id, d_id))
+    ## DEF
+
+    def replay(self, tableName, unit, batch_size = None):
+        path = snapshotPath(self.directory, tableName, unit)
+        if not os.path.exists(path):
+            raise Exception("Snapshot in '%s' is missing %s" % (self.directory, os.path.basename(path)))
+        f = SnapshotFile(path)
+        try:
+            count = len(f)
+            if batch_size == None: batch_size = max(count, 1)
+            logging.debug("LOAD - %s %s: %d tuples from snapshot" % (tableName, str(unit), count))
+            for first in range(0, count, batch_size):
+                last = min(first + batch_size, count)
+                columns = f.readColumns(first, last)
+                if self.handle.supportsColumns():
+                    self.handle.loadColumns(tableName, columns, last - first)
+                else:
+                    self.handle.loadTuples(tableName, [ list(row) for row in zip(*columns) ])
+            ## FOR
+        finally:
+            f.close()
+    ## DEF
+## CLASS
@@ -35,14 +35,23 @@ import argparse
 import glob
 import time 
 import multiprocessing
+import functools
 import traceback
+import hashlib
+import platform
+import queue
 from configparser import SafeConfigParser
 from pprint import pprint,pformat
 
+import constants
 from util import *
+from util.results import writeJson, writeCsv
 from runtime import *
 import drivers
 
+## Pseudo-system that writes out a snapshot of the generated data
+GENERATE = "generate"
+
 logging.basicConfig(level = logging.INFO,
                     format="%(asctime)s [%(funcName)s:%(lineno)03d] %(levelname)-5s: %(message)s",
                     datefmt="%m-%d-%Y %H:%M:%S",
@@ -72,68 +81,203 @@ def getDrivers():
 ## startLoading
 ## ==============================================
 def startLoading(driverClass, scaleParameters, args, config):
-    logging.debug("Creating client pool with %d processes" % args['clients'])
-    pool = multiprocessing.Pool(args['clients'])
-    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    workers = getLoaders(args)
+    logging.debug("Starting %d loader processes" % workers)
     
-    # Split the warehouses into chunks
-    w_ids = map(lambda x: [ ], range(args['clients']))
-    for w_id in range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1):
-        idx = w_id % args['clients']
-        w_ids[idx].append(w_id)
+    ## Split the database into (warehouse, district) sized pieces. Every worker
+    ## pulls the next unit off of a shared queue, so the faster workers just
+    ## end up loading more of them.
+    w_ids = range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1)
+    phases = loader.Loader(None, scaleParameters, w_ids, scaleParameters.starting_warehouse == 1).makeWorkUnits()
+    
+    ## Number of units left for the ITEM table and for each warehouse, so that
+    ## the worker that loads the last one can invoke the loadFinish* callback
+    remaining = multiprocessing.Array('i', len(w_ids) + 1)
+    for phase in phases:
+        for unit in phase:
+            remaining[workUnitSlot(scaleParameters, unit)] += 1
     ## FOR
+    failed = multiprocessing.Value('i', 0)
+    pending = multiprocessing.Value('i', 0)
     
-    loader_results = [ ]
-    for i in range(args['clients']):
-        r = pool.apply_async(loaderFunc, (driverClass, scaleParameters, args, config, w_ids[i], scaleParameters.starting_warehouse == 1))
-        loader_results.append(r)
+    queue = multiprocessing.Queue()
+    procs = [ ]
+    for i in range(workers):
+        p = multiprocessing.Process(target=loaderFunc, args=(driverClass, scaleParameters, args, config, queue, remaining, failed, pending))
+        p.start()
+        procs.append(p)
     ## FOR
     
-    pool.close()
-    logging.debug("Waiting for %d loaders to finish" % args['clients'])
-    pool.join()
+    ## Wait for each phase to drain before handing out the next one
+    for phase in phases:
+        pending.value = len(phase)
+        for unit in phase: queue.put(unit)
+        if not waitForPhase(procs, pending, failed): break
+    ## FOR
+    for p in procs: queue.put(None)
+    logging.debug("Waiting for %d loaders to finish" % workers)
+    for p in procs: p.join()
+    
+    if failed.value or [ p for p in procs if p.exitcode != 0 ]:
+        raise Exception("Failed to load data")
+## DEF
+
+## ==============================================
+## waitForPhase
+## ==============================================
+def waitForPhase(procs, pending, failed):
+    """
+        Wait until the loaders have gone through every unit of the current phase.
+        Returns False as soon as one of them fails or dies (e.g., it got killed),
+        since the units that it had taken would never be finished.
+    """
+    while pending.value > 0:
+        if failed.value: return False
+        dead = [ p for p in procs if p.exitcode != None ]
+        if dead:
+            logging.warn("Loader process %d exited with code %s in the middle of loading" % (dead[0].pid, dead[0].exitcode))
+            failed.value = 1
+            return False
+        time.sleep(0.1)
+    ## WHILE
+    return not failed.value
 ## DEF
 
 ## ==============================================
 ## loaderFunc
 ## ==============================================
-def loaderFunc(driverClass, scaleParameters, args, config, w_ids, debug):
-    driver = driverClass(args['ddl'])
-    assert driver != None
-    logging.debug("Starting client execution: %s [warehouses=%d]" % (driver, len(w_ids)))
-    
-    config['load'] = True
-    config['execute'] = False
-    config['reset'] = False
-    driver.loadConfig(config)
-   
+def loaderFunc(driverClass, scaleParameters, args, config, queue, remaining, failed, pending):
     try:
-        loadItems = (1 in w_ids)
-        l = loader.Loader(driver, scaleParameters, w_ids, loadItems)
+        driver = driverClass(args['ddl'])
+        assert driver != None
+        logging.debug("Starting loader: %s" % driver)
+        
+        config['load'] = True
+        config['execute'] = False
+        config['reset'] = False
+        driver.loadConfig(config)
+       
+        w_ids = range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1)
+        l = makeLoader(driver, scaleParameters, args, w_ids, False)
         driver.loadStart()
-        l.execute()
-        driver.loadFinish()   
-    except KeyboardInterrupt:
-            return -1
     except (Exception, AssertionError) as ex:
-        logging.warn("Failed to load data: %s" % (ex))
-        #if debug:
+        logging.warn("Failed to start loader: %s" % ex)
         traceback.print_exc(file=sys.stdout)
-        raise
-        
+        failed.value = 1
+        return
+    
+    while True:
+        unit = queue.get()
+        if unit == None: break
+        try:
+            ## Once anybody has failed, just drain the queue
+            if not failed.value:
+                l.loadWorkUnit(unit)
+                finishWorkUnit(driver, scaleParameters, unit, remaining)
+        except KeyboardInterrupt:
+            failed.value = 1
+        except (Exception, AssertionError) as ex:
+            logging.warn("Failed to load %s: %s" % (str(unit), ex))
+            traceback.print_exc(file=sys.stdout)
+            failed.value = 1
+        finally:
+            with pending.get_lock(): pending.value -= 1
+    ## WHILE
+    if not failed.value: driver.loadFinish()
+## DEF
+
+## ==============================================
+## makeLoader
+## ==============================================
+def makeLoader(driver, scaleParameters, args, w_ids, needLoadItems):
+    """Use the vectorized loader unless NumPy is missing or it was turned off"""
+    if args['snapshot_dir'] and args['system'] != GENERATE:
+        return snapshot.SnapshotLoader(driver, scaleParameters, w_ids, needLoadItems, args['snapshot_dir'])
+    if args['vectorize'] and batchloader.HAVE_NUMPY:
+        return batchloader.BatchLoader(driver, scaleParameters, w_ids, needLoadItems, args['seed'])
+    return loader.Loader(driver, scaleParameters, w_ids, needLoadItems, args['seed'])
+## DEF
+
+## ==============================================
+## finishWorkUnit
+## ==============================================
+def finishWorkUnit(driver, scaleParameters, unit, remaining):
+    """Invoke the driver's loadFinish* callback if this was the last unit of the ITEM table or of a warehouse"""
+    slot = workUnitSlot(scaleParameters, unit)
+    with remaining.get_lock():
+        remaining[slot] -= 1
+        done = (remaining[slot] == 0)
+    if not done: return
+    
+    if unit[0] == loader.UNIT_ITEM:
+        driver.loadFinishItem()
+    else:
+        driver.loadFinishWarehouse(unit[1])
+## DEF
+
+## ==============================================
+## workUnitSlot
+## ==============================================
+def workUnitSlot(scaleParameters, unit):
+    if unit[0] == loader.UNIT_ITEM: return 0
+    return unit[1] - scaleParameters.starting_warehouse + 1
+## DEF
+
+## ==============================================
+## getLoaders
+## ==============================================
+def getLoaders(args):
+    return args['loaders'] if args['loaders'] else args['clients']
+## DEF
+
+## ==============================================
+## generateSnapshot
+## ==============================================
+def generateSnapshot(scaleParameters, args):
+    directory = args['snapshot_dir']
+    if not os.path.exists(directory): os.makedirs(directory)
+    w_ids = range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1)
+    units = [ ]
+    for phase in loader.Loader(None, scaleParameters, w_ids, scaleParameters.starting_warehouse == 1).makeWorkUnits():
+        units += phase
+    
+    workers = getLoaders(args)
+    logging.info("Generating %d work units into '%s' with %d processes" % (len(units), directory, workers))
+    start = time.time()
+    if workers == 1:
+        for unit in units: generateFunc(scaleParameters, args, unit)
+    else:
+        pool = multiprocessing.Pool(workers)
+        for r in pool.imap_unordered(functools.partial(generateFunc, scaleParameters, args), units): pass
+        pool.close()
+        pool.join()
+    ## IF
+    snapshot.writeMetadata(directory, scaleParameters, args['seed'])
+    logging.info("Generated snapshot in %.1f seconds" % (time.time() - start))
+## DEF
+
+## ==============================================
+## generateFunc
+## ==============================================
+def generateFunc(scaleParameters, args, unit):
+    w_ids = range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1)
+    writer = snapshot.SnapshotWriter(args['snapshot_dir'], unit)
+    l = makeLoader(writer, scaleParameters, args, w_ids, scaleParameters.starting_warehouse == 1)
+    l.loadWorkUnit(unit)
+    writer.close()
 ## DEF
 
 ## ==============================================
 ## startExecution
 ## ==============================================
-def startExecution(driverClass, scaleParameters, args, config):
+def startExecution(driverClass, scaleParameters, args, config, progress_queue = None):
     logging.debug("Creating client pool with %d processes" % args['clients'])
     pool = multiprocessing.Pool(args['clients'])
     debug = logging.getLogger().isEnabledFor(logging.DEBUG)
     
     worker_results = [ ]
     for i in range(args['clients']):
-        r = pool.apply_async(executorFunc, (driverClass, scaleParameters, args, config, debug,))
+        r = pool.apply_async(executorFunc, (driverClass, scaleParameters, args, config, debug, i, progress_queue,))
         worker_results.append(r)
     ## FOR
     pool.close()
@@ -154,21 +298,163 @@ def startExecution(driverClass, scaleParameters, args, config):
 ## ==============================================
 ## executorFunc
 ## ==============================================
-def executorFunc(driverClass, scaleParameters, args, config, debug):
-    driver = driverClass(args['ddl'])
+def executorFunc(driverClass, scaleParameters, args, config, debug, client_id, progress_queue = None):
+    ## Terminals only run for the client's own warehouses, and with more
+    ## clients than warehouses some clients do not have any
+    if getTerminals(args) and not getClientWarehouses(scaleParameters, args, client_id):
+        logging.warn("Client #%d has no warehouses to run terminals for" % client_id)
+        return results.Results(args['interval'])
+    
+    driver = makeExecuteDriver(driverClass, args, config)
     assert driver != None
     logging.debug("Starting client execution: %s" % driver)
+
+    ## Each client gets its own time-series file
+    interval_stream = openIntervalStream(args, client_id)
+    e = makeExecutor(driverClass, driver, config, scaleParameters, args, interval_stream, progress_queue, client_id)
+    e.driver.executeStart()
+    r = runExecutor(e, scaleParameters, args, client_id)
+    e.driver.executeFinish()
+    closeIntervalStream(interval_stream)
     
+    return r
+## DEF
+
+## ==============================================
+## makeExecutor
+## ==============================================
+def makeExecutor(driverClass, driver, config, scaleParameters, args, interval_stream, progress_queue = None, client_id = None):
+    mix = [ int(i) for i in args['mix'].split(',') ]
+    think_scale = args['think_scale'] if args['emulate'] else None
+    kwargs = dict(stop_on_error=args['stop_on_error'],
+                  interval=args['interval'], interval_stream=interval_stream,
+                  arrival_rate=args['rate'], arrival_dist=args['arrival'],
+                  think_scale=think_scale,
+                  max_retries=args['max_retries'], retry_backoff=args['retry_backoff'] / 1000.0,
+                  progress_queue=progress_queue)
+    terminals = getTerminals(args)
+    if not args['async'] and not (terminals and not driver.isThreadSafe()):
+        return executor.Executor(driver, scaleParameters, mix, **kwargs)
+
+    ## Blocking drivers get a pool of their own connections that the
+    ## event loop hands transactions to
+    if not driver.isAsync():
+        size = args['async_threads']
+        if not args['async']:
+            ## Terminal threads cannot share a driver that is not thread-safe,
+            ## so the terminals run on the event loop with a connection each
+            size = terminals * len(getClientWarehouses(scaleParameters, args, client_id))
+            logging.debug("%s is not thread-safe, running the terminals on %d connections" % (driver, size))
+        driver = asyncexecutor.SyncDriverAdapter(lambda: makeExecuteDriver(driverClass, args, config), size)
+    concurrency = args['concurrency'] if args['concurrency'] else args['async_threads']
+    return asyncexecutor.AsyncExecutor(driver, scaleParameters, mix, concurrency=concurrency, **kwargs)
+## DEF
+
+## ==============================================
+## makeExecuteDriver
+## ==============================================
+def makeExecuteDriver(driverClass, args, config):
+    driver = driverClass(args['ddl'])
+    config = dict(config)
     config['execute'] = True
     config['reset'] = False
     driver.loadConfig(config)
+    return driver
+## DEF
 
-    e = executor.Executor(driver, scaleParameters, stop_on_error=args['stop_on_error'])
-    driver.executeStart()
-    results = e.execute(args['duration'])
-    driver.executeFinish()
-    
-    return results
+## ==============================================
+## runExecutor
+## ==============================================
+def runExecutor(e, scaleParameters, args, client_id = None):
+    """Run the workload, either as one closed/open-loop client or as a set of
+       emulated terminals for the warehouses that belong to this client"""
+    terminals = getTerminals(args)
+    if not terminals:
+        return e.execute(args['duration'], args['warmup'], args['cooldown'])
+    w_ids = getClientWarehouses(scaleParameters, args, client_id)
+    return e.executeTerminals(w_ids, terminals, args['duration'], args['warmup'], args['cooldown'])
+## DEF
+
+## ==============================================
+## getTerminals
+## ==============================================
+def getTerminals(args):
+    """The number of emulated terminals per warehouse (None to not emulate terminals)"""
+    terminals = args['terminals']
+    if terminals == None and args['emulate']: terminals = constants.TERMINALS_PER_WAREHOUSE
+    return terminals
+## DEF
+
+## ==============================================
+## getClientWarehouses
+## ==============================================
+def getClientWarehouses(scaleParameters, args, client_id):
+    """The warehouses that the given client runs terminals for (all of them if None).
+       Warehouses are split between clients the same way as for loading."""
+    w_ids = [ ]
+    for w_id in range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1):
+        if client_id == None or w_id % args['clients'] == client_id:
+            w_ids.append(w_id)
+    ## FOR
+    return w_ids
+## DEF
+
+## ==============================================
+## openIntervalStream
+## ==============================================
+def openIntervalStream(args, client_id = None):
+    """Return the stream that per-interval statistics are written to while running"""
+    path = args['interval_output']
+    if not path or not args['interval']: return None
+    if path == "-": return sys.stdout
+    if client_id != None: path = "%s.%d" % (path, client_id)
+    return open(path, "w")
+## DEF
+
+## ==============================================
+## closeIntervalStream
+## ==============================================
+def closeIntervalStream(stream):
+    if stream != None and stream != sys.stdout: stream.close()
+## DEF
+
+## ==============================================
+## makeProgressQueue
+## ==============================================
+def makeProgressQueue(args):
+    """Return the queue that the executors publish their progress on, or None if
+       nobody is watching. Forked clients need a queue that can be pickled."""
+    if not args['progress'] and args['metrics_port'] == None: return None
+    if not args['interval']:
+        logging.warn("Live progress needs the per-interval statistics (--interval)")
+        return None
+    if args['clients'] == 1: return queue.Queue()
+    return multiprocessing.Manager().Queue()
+## DEF
+
+## ==============================================
+## makeMetadata
+## ==============================================
+def makeMetadata(driver, args, config):
+    """Describe the run, so that exported results can be told apart later on"""
+    ## The hash only covers the driver's own options, not the flags this script sets
+    options = dict([ (k, str(v)) for k, v in config.items() if not k in [ "reset", "load", "execute" ] ])
+    config_hash = hashlib.sha1(repr(sorted(options.items())).encode("utf-8")).hexdigest()
+    return {
+        "driver": driver.driver_name,
+        "config": str(driver),
+        "mode": driver.getMode(),
+        "config_hash": config_hash,
+        "warehouses": args['warehouses'],
+        "scalefactor": args['scalefactor'],
+        "clients": args['clients'],
+        "async": args['async'],
+        "mix": args['mix'],
+        "seed": args['seed'],
+        "duration": args['duration'],
+        "host": platform.node(),
+        "started": datetime.datetime.now().isoformat(),
+    }
 ## DEF
 
 ## ==============================================
@@ -176,8 +462,8 @@ def executorFunc(driverClass, scaleParameters, args, config, debug):
 ## ==============================================
 if __name__ == '__main__':
     aparser = argparse.ArgumentParser(description='Python implementation of the TPC-C Benchmark')
-    aparser.add_argument('system', choices=getDrivers(),
-                         help='Target system driver')
+    aparser.add_argument('system', choices=getDrivers() + [ GENERATE ],
+                         help='Target system driver (\'%s\' writes the generated data to --snapshot-dir instead)' % GENERATE)
     aparser.add_argument('--config',
                          help='Path to driver configuration file')
     aparser.add_argument('--reset', action='store_true',
@@ -192,10 +478,54 @@ if __name__ == '__main__':
                          help='Number of Warehouses')
     aparser.add_argument('--duration', default=60, type=int, metavar='D',
                          help='How long to run the benchmark in seconds')
+    aparser.add_argument('--warmup', default=0, type=int, metavar='WU',
+                         help='Run transactions for WU seconds before the measured run starts')
+    aparser.add_argument('--cooldown', default=0, type=int, metavar='CD',
+                         help='Keep running transactions for CD seconds after the measured run ends')
+    aparser.add_argument('--rate', type=float, metavar='R',
+                         help='Run open-loop: each client starts R transactions per second regardless of response times')
+    aparser.add_argument('--arrival', default=executor.ARRIVAL_POISSON, choices=executor.ARRIVAL_DISTRIBUTIONS,
+                         help='Inter-arrival time distribution for open-loop (--rate) runs')
+    aparser.add_argument('--emulate', action='store_true',
+                         help='Emulate TPC-C terminals by waiting out the keying and think times around each transaction')
+    aparser.add_argument('--think-scale', default=1.0, type=float, metavar='S',
+                         help='Multiply the emulated keying and think times by S')
+    aparser.add_argument('--terminals', type=int, metavar='T',
+                         help='Number of terminal threads per warehouse in each client (default %d with --emulate)' % constants.TERMINALS_PER_WAREHOUSE)
+    aparser.add_argument('--interval', default=1.0, type=float, metavar='I',
+                         help='Record throughput and latency for every I seconds of the run (0 to disable)')
+    aparser.add_argument('--interval-output', metavar='PATH',
+                         help='Stream the per-interval statistics to this file while running (\'-\' for stdout)')
+    aparser.add_argument('--async', action='store_true',
+                         help='Multiplex the terminals of each client on an asyncio event loop')
+    aparser.add_argument('--async-threads', default=8, type=int, metavar='N',
+                         help='Number of driver connections used by a blocking driver in --async mode')
+    aparser.add_argument('--concurrency', type=int, metavar='C',
+                         help='Number of concurrent terminals per client in --async mode without --terminals (default N)')
     aparser.add_argument('--ddl', default=os.path.realpath(os.path.join(os.path.dirname(__file__), "tpcc.sql")),
                          help='Path to the TPC-C DDL SQL file')
     aparser.add_argument('--clients', default=1, type=int, metavar='N',
                          help='The number of blocking clients to fork')
+    aparser.add_argument('--loaders', type=int, metavar='L',
+                         help='The number of loader processes to fork (default N). Work is split by district, so this can exceed the number of warehouses')
+    aparser.add_argument('--seed', type=int, metavar='S',
+                         help='Generate the same database for the same seed, no matter how many loaders are used (the NumPy and the pure Python generators give different data)')
+    aparser.add_argument('--snapshot-dir', metavar='DIR',
+                         help='Load the data from the snapshot in DIR written by the \'%s\' command instead of generating it' % GENERATE)
+    aparser.add_argument('--no-vectorize', dest='vectorize', action='store_false',
+                         help='Generate the initial tuples one at a time even if NumPy is available')
+    aparser.add_argument('--max-retries', default=3, type=int, metavar='N',
+                         help='Retry a transaction up to N times when the driver reports a conflict with a concurrent one')
+    aparser.add_argument('--retry-backoff', default=1.0, type=float, metavar='MS',
+                         help='Wait MS milliseconds before the first retry of a conflicting transaction, and twice as long before every further one')
+    aparser.add_argument('--progress', action='store_true',
+                         help='Print a line with the throughput, latency and abort rate of the whole run after every interval')
+    aparser.add_argument('--metrics-port', type=int, metavar='PORT',
+                         help='Serve the live metrics in the Prometheus text format on http://localhost:PORT/metrics while running')
+    aparser.add_argument('--results-json', metavar='PATH',
+                         help='Also write the results and the run\'s metadata to this file as JSON (\'-\' for stdout)')
+    aparser.add_argument('--results-csv', metavar='PATH',
+                         help='Also write the results and the run\'s metadata to this file as CSV, one value per row (\'-\' for stdout)')
     aparser.add_argument('--stop-on-error', action='store_true',
                          help='Stop the transaction execution when the driver throws an exception.')
     aparser.add_argument('--no-load', action='store_true',
@@ -209,6 +539,18 @@ if __name__ == '__main__':
     args = vars(aparser.parse_args())
 
     if args['debug']: logging.getLogger().setLevel(logging.DEBUG)
+    
+    ## Pick the NURand constants before any worker processes get forked, so
+    ## that they all generate data with the same ones
+    rand.setNURand(nurand.makeForLoad())
+    
+    ## Write the generated data out to a snapshot instead of loading it into a database
+    if args['system'] == GENERATE:
+        assert args['snapshot_dir'], "The %s command requires --snapshot-dir" % GENERATE
+        scaleParameters = scaleparameters.makeWithScaleFactor(args['warehouses'], args['scalefactor'])
+        scaleParameters.starting_warehouse = int(args['skip_warehouses'])+1
+        generateSnapshot(scaleParameters, args)
+        sys.exit(0)
         
     ## Create a handle to the target client driver
     driverClass = createDriverClass(args['system'])
@@ -224,7 +566,7 @@ if __name__ == '__main__':
     if args['config']:
         logging.debug("Loading configuration file '%s'" % args['config'])
         cparser = SafeConfigParser()
-        cparser.read(os.path.realpath(args['config'].name))
+        cparser.read(os.path.realpath(args['config']))
         config = dict(cparser.items(args['system']))
     else:
         logging.debug("Using default configuration for %s" % args['system'])
@@ -239,19 +581,19 @@ if __name__ == '__main__':
 
     ## Create ScaleParameters
     scaleParameters = scaleparameters.makeWithScaleFactor(args['warehouses'], args['scalefactor'])
-    nurand = rand.setNURand(nurand.makeForLoad())
     if args['debug']: logging.debug("Scale Parameters:\n%s" % scaleParameters)
     scaleParameters.starting_warehouse = int(args['skip_warehouses'])+1
 
     mix = [ int(i) for i in args['mix'].split(',') ]
+    metadata = makeMetadata(driver, args, config)
     
     ## DATA LOADER!!!
     load_time = None
     if not args['no_load']:
         logging.info("Loading TPC-C benchmark data using %s" % (driver))
         load_start = time.time()
-        if args['clients'] == 1:
-            l = loader.Loader(driver, scaleParameters, range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1), scaleParameters.starting_warehouse == 1)
+        if getLoaders(args) == 1:
+            l = makeLoader(driver, scaleParameters, args, range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1), scaleParameters.starting_warehouse == 1)
             driver.loadStart()
             l.execute()
             driver.loadFinish()
@@ -262,15 +604,27 @@ if __name__ == '__main__':
     
     ## WORKLOAD DRIVER!!!
     if not args['no_execute']:
+        progress_queue = makeProgressQueue(args)
+        if progress_queue != None:
+            p, consumer, server = progress.startProgress(progress_queue, args['interval'],
+                                                         sys.stdout if args['progress'] else None, args['metrics_port'])
         if args['clients'] == 1:
-            e = executor.Executor(driver, scaleParameters, mix, stop_on_error=args['stop_on_error'])
-            driver.executeStart()
-            results = e.execute(args['duration'])
-            driver.executeFinish()
+            interval_stream = openIntervalStream(args)
+            e = makeExecutor(driverClass, driver, config, scaleParameters, args, interval_stream, progress_queue)
+            e.driver.executeStart()
+            results = runExecutor(e, scaleParameters, args)
+            e.driver.executeFinish()
+            closeIntervalStream(interval_stream)
         else:
-            results = startExecution(driverClass, scaleParameters, args, config)
+            results = startExecution(driverClass, scaleParameters, args, config, progress_queue)
+        if progress_queue != None: progress.stopProgress(progress_queue, consumer, server)
         assert results
         print(results.show(load_time))
+        
+        if args['results_json'] or args['results_csv']:
+            data = results.toDict(load_time, metadata)
+            if args['results_json']: writeJson(args['results_json'], data)
+            if args['results_csv']: writeCsv(args['results_csv'], data)
     ## IF
     
 ## MAIN
\ No newline at end of file
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import math
+
+## Each power-of-two range is split into this many linear sub-buckets, so
+## any recorded value is off by less than 1/SUB_BUCKET_HALF (~0.8%)
+SUB_BUCKET_BITS = 8
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+## Largest trackable value (in microseconds this is a bit over an hour).
+## Anything bigger is clamped into the last bucket.
+MAX_VALUE_BITS = 32
+MAX_VALUE = (1 << MAX_VALUE_BITS) - 1
+
+## ==============================================
+## Histogram
+## ==============================================
+class Histogram:
+    """
+        Log-bucketed (HDR-style) histogram of non-negative integer values.
+        Memory is bounded by the number of buckets, regardless of how many
+        values get recorded. Only buckets that have been hit are stored.
+    """
+
+    def __init__(self):
+        self.counts = { }
+        self.total_count = 0
+        self.total_sum = 0
+        self.min_value = None
+        self.max_value = None
+    ## DEF
+
+    def record(self, value, count = 1):
+        """Record the given value (e.g., a latency in microseconds)"""
+        value = min(max(int(value), 0), MAX_VALUE)
+        idx = bucketIndex(value)
+        self.counts[idx] = self.counts.get(idx, 0) + count
+        self.total_count += count
+        self.total_sum += value * count
+        if self.min_value == None or value < self.min_value: self.min_value = value
+        if self.max_value == None or value > self.max_value: self.max_value = value
+    ## DEF
+
+    def merge(self, other):
+        """Add all of the values recorded in another Histogram into this one"""
+        for idx, cnt in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + cnt
+        self.total_count += other.total_count
+        self.total_sum += other.total_sum
+        if other.min_value != None:
+            if self.min_value == None or other.min_value < self.min_value: self.min_value = other.min_value
+        if other.max_value != None:
+            if self.max_value == None or other.max_value > self.max_value: self.max_value = other.max_value
+    ## DEF
+
+    def mean(self):
+        if self.total_count == 0: return 0.0
+        return self.total_sum / float(self.total_count)
+    ## DEF
+
+    def percentile(self, pct):
+        """Return the value at the given percentile (0-100)"""
+        if self.total_count == 0: return 0
+        assert 0 <= pct and pct <= 100
+        target = max(1, int(math.ceil(self.total_count * pct / 100.0)))
+        seen = 0
+        for idx in sorted(self.counts.keys()):
+            seen += self.counts[idx]
+            if seen >= target:
+                ## Never report something outside of what was actually recorded
+                return min(max(bucketHighValue(idx), self.min_value), self.max_value)
+        ## FOR
+        return self.max_value
+    ## DEF
+
+    def __len__(self):
+        return self.total_count
+## CLASS
+
+## ==============================================
+## bucketIndex
+## ==============================================
+def bucketIndex(value):
+    """Map a value to its bucket. Values below SUB_BUCKET_COUNT are exact."""
+    if value < SUB_BUCKET_COUNT: return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + ((value >> shift) - SUB_BUCKET_HALF)
+## DEF
+
+## ==============================================
+## bucketLowValue
+## ==============================================
+def bucketLowValue(idx):
+    """The smallest value that maps to the given bucket"""
+    if idx < SUB_BUCKET_COUNT: return idx
+    shift = (idx - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+    sub = (idx - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return sub << shift
+## DEF
+
+## ==============================================
+## bucketHighValue
+## ==============================================
+def bucketHighValue(idx):
+    """The largest value that maps to the given bucket"""
+    return bucketLowValue(idx + 1) - 1
+## DEF
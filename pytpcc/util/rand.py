@@ -30,11 +30,29 @@
 # -----------------------------------------------------------------------
 
 import random
+import hashlib
 import util.nurand
 import math
 
 SYLLABLES = [ "BAR", "OUGHT", "ABLE", "PRI", "PRES", "ESE", "ANTI", "CALLY", "ATION", "EING" ]
 
+## Where all of the random values in this module come from. Swapped out
+## for a seeded random.Random to make the generated values reproducible.
+rng = random
+def setRandom(r):
+    """Use the given random.Random from now on and return the previous one"""
+    global rng
+    prev = rng
+    rng = r
+    return prev
+## DEF
+
+def partitionSeed(seed, *key):
+    """Derive an independent seed for the partition identified by key (e.g., table, w_id, d_id)"""
+    data = ":".join(map(str, (seed,) + key)).encode("utf-8")
+    return int(hashlib.sha256(data).hexdigest()[:16], 16)
+## DEF
+
 nurandVar = None # NURand
 def setNURand(nu):
     global nurandVar
@@ -61,7 +79,7 @@ def NURand(a, x, y):
 ## DEF
 
 def number(minimum, maximum):
-    value = random.randint(minimum, maximum)
+    value = rng.randint(minimum, maximum)
     assert minimum <= value and value <= maximum
     return value
 ## DEF
@@ -107,6 +125,10 @@ def selectUniqueIds(numUnique, minimum, maximum):
     return rows
 ## DEF
 
+def shuffle(values):
+    rng.shuffle(values)
+## DEF
+
 def astring(minimum_length, maximum_length):
     """A random alphabetic string with length in range [minimum_length, maximum_length]."""
     return randomString(minimum_length, maximum_length, 'a', 26)
@@ -24,45 +24,92 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 # -----------------------------------------------------------------------
 
+import contextlib
+import csv
+import json
 import logging
+import sys
 import time
 
+from util.histogram import Histogram
+
+## Percentiles reported by show()
+PERCENTILES = [ 50, 95, 99, 99.9 ]
+
+## Percentiles reported for each time-series interval
+INTERVAL_PERCENTILES = [ 50, 95, 99 ]
+INTERVAL_HEADER = "elapsed,txn,committed,aborted,rate," + ",".join([ "p%s" % p for p in INTERVAL_PERCENTILES ])
+INTERVAL_COLUMNS = INTERVAL_HEADER.split(",")
+
+## Columns of the machine-readable CSV export. Every value is on a row of its own,
+## so the metadata, the per-transaction summary and the time series all fit.
+CSV_HEADER = [ "section", "txn", "elapsed", "metric", "value" ]
+
+## The name that the totals over all transaction types are exported under
+TOTAL = "TOTAL"
+
 class Results:
     
-    def __init__(self):
+    def __init__(self, interval = None):
         self.start = None
         self.stop = None
         self.txn_id = 0
         
         self.txn_counters = { }
         self.txn_times = { }
+        self.txn_histograms = { }
         self.running = { }
         
-    def startBenchmark(self):
+        ## txn_name -> reason -> number of aborted transactions
+        self.txn_aborts = { }
+        ## txn_name -> [ retries, seconds spent waiting on locks and backoffs ]
+        self.txn_retries = { }
+        ## txn_name -> number of transactions that started inside of the measurement
+        ## window but finished after it closed, and so were not recorded
+        self.txn_late = { }
+        
+        ## Time series: interval # -> txn_name -> [ committed, aborted, Histogram ]
+        self.interval = interval
+        self.intervals = { }
+        
+    def startBenchmark(self, timestamp = None):
         """Mark the benchmark as having been started"""
         assert self.start == None
         logging.debug("Starting benchmark statistics collection")
-        self.start = time.time()
+        self.start = timestamp if timestamp != None else time.time()
         return self.start
         
-    def stopBenchmark(self):
+    def stopBenchmark(self, timestamp = None):
         """Mark the benchmark as having been stopped"""
         assert self.start != None
         assert self.stop == None
         logging.debug("Stopping benchmark statistics collection")
-        self.stop = time.time()
+        self.stop = timestamp if timestamp != None else time.time()
         
-    def startTransaction(self, txn):
+    def startTransaction(self, txn, timestamp = None):
+        """Mark a transaction as started. An explicit start timestamp can be given
+           so that latencies are measured from when it was supposed to start."""
         self.txn_id += 1
         id = self.txn_id
-        self.running[id] = (txn, time.time())
+        self.running[id] = (txn, timestamp if timestamp != None else time.time())
         return id
         
-    def abortTransaction(self, id):
-        """Abort a transaction and discard its times"""
+    def abortTransaction(self, id, reason = "error"):
+        """Abort a transaction and discard its times. Only the reason is counted."""
+        assert id in self.running
+        txn_name, txn_start = self.running[id]
+        del self.running[id]
+        self.recordAborts(txn_name, reason)
+        
+        bucket = self.getIntervalBucket(txn_name, time.time())
+        if bucket != None: bucket[1] += 1
+        
+    def dropTransaction(self, id):
+        """Forget a transaction that finished after the measurement window closed. It is only counted as late."""
         assert id in self.running
         txn_name, txn_start = self.running[id]
         del self.running[id]
+        self.txn_late[txn_name] = self.txn_late.get(txn_name, 0) + 1
         
     def stopTransaction(self, id):
         """Record that the benchmark completed an invocation of the given transaction"""
@@ -70,13 +117,69 @@ class Results:
         txn_name, txn_start = self.running[id]
         del self.running[id]
         
-        duration = time.time() - txn_start
+        now = time.time()
+        duration = now - txn_start
         total_time = self.txn_times.get(txn_name, 0)
         self.txn_times[txn_name] = total_time + duration
         
         total_cnt = self.txn_counters.get(txn_name, 0)
         self.txn_counters[txn_name] = total_cnt + 1
         
+        ## Latencies are kept in microseconds
+        if not txn_name in self.txn_histograms:
+            self.txn_histograms[txn_name] = Histogram()
+        self.txn_histograms[txn_name].record(duration * 1000000)
+        
+        bucket = self.getIntervalBucket(txn_name, now)
+        if bucket != None:
+            bucket[0] += 1
+            bucket[2].record(duration * 1000000)
+        
+    def recordAborts(self, txn_name, reason, count = 1):
+        if not txn_name in self.txn_aborts:
+            self.txn_aborts[txn_name] = { }
+        self.txn_aborts[txn_name][reason] = self.txn_aborts[txn_name].get(reason, 0) + count
+        
+    def recordRetries(self, txn_name, retries, lock_wait):
+        """Record how often a transaction had to be retried because of conflicts or
+           lock contention, and how long it waited for locks and backoffs"""
+        if not retries and not lock_wait: return
+        if not txn_name in self.txn_retries:
+            self.txn_retries[txn_name] = [ 0, 0.0 ]
+        self.txn_retries[txn_name][0] += retries
+        self.txn_retries[txn_name][1] += lock_wait
+        
+    def getIntervalBucket(self, txn_name, timestamp):
+        """Return the time-series bucket for the given transaction at the given time"""
+        if not self.interval or self.start == None: return None
+        idx = int((timestamp - self.start) / self.interval)
+        if not idx in self.intervals: self.intervals[idx] = { }
+        if not txn_name in self.intervals[idx]:
+            self.intervals[idx][txn_name] = [ 0, 0, Histogram() ]
+        return self.intervals[idx][txn_name]
+        
+    def formatInterval(self, idx):
+        """Return one CSV line (see INTERVAL_HEADER) per transaction for the given interval"""
+        lines = [ ]
+        for row in self.intervalRows(idx):
+            row[0] = "%.1f" % row[0]
+            row[4] = "%.02f" % row[4]
+            lines.append(",".join(map(str, row)))
+        ## FOR
+        return (lines)
+        
+    def intervalRows(self, idx):
+        """Return the values of INTERVAL_COLUMNS for each transaction in the given interval"""
+        rows = [ ]
+        buckets = self.intervals.get(idx, { })
+        for txn_name in sorted(buckets.keys()):
+            committed, aborted, h = buckets[txn_name]
+            row = [ (idx + 1) * self.interval, txn_name, committed, aborted, committed / self.interval ]
+            row += [ h.percentile(p) for p in INTERVAL_PERCENTILES ]
+            rows.append(row)
+        ## FOR
+        return (rows)
+        
     def append(self, r):
         for txn_name in r.txn_counters.keys():
             orig_cnt = self.txn_counters.get(txn_name, 0)
@@ -84,10 +187,41 @@ class Results:
 
             self.txn_counters[txn_name] = orig_cnt + r.txn_counters[txn_name]
             self.txn_times[txn_name] = orig_time + r.txn_times[txn_name]
+            
+            if txn_name in r.txn_histograms:
+                if not txn_name in self.txn_histograms:
+                    self.txn_histograms[txn_name] = Histogram()
+                self.txn_histograms[txn_name].merge(r.txn_histograms[txn_name])
+        ## FOR
+        for txn_name, reasons in r.txn_aborts.items():
+            for reason, cnt in reasons.items():
+                self.recordAborts(txn_name, reason, cnt)
+        ## FOR
+        for txn_name, (retries, lock_wait) in r.txn_retries.items():
+            self.recordRetries(txn_name, retries, lock_wait)
+        ## FOR
+        for txn_name, cnt in r.txn_late.items():
+            self.txn_late[txn_name] = self.txn_late.get(txn_name, 0) + cnt
+        ## FOR
+        
+        ## Line the time series up by interval number. Every client
+        ## starts at roughly the same time, so this is close enough.
+        if self.interval == None: self.interval = r.interval
+        for idx, buckets in r.intervals.items():
+            if not idx in self.intervals: self.intervals[idx] = { }
+            for txn_name, (committed, aborted, h) in buckets.items():
+                if not txn_name in self.intervals[idx]:
+                    self.intervals[idx][txn_name] = [ 0, 0, Histogram() ]
+                bucket = self.intervals[idx][txn_name]
+                bucket[0] += committed
+                bucket[1] += aborted
+                bucket[2].merge(h)
+        ## FOR
             #logging.debug("%s [cnt=%d, time=%d]" % (txn_name, self.txn_counters[txn_name], self.txn_times[txn_name]))
-        ## HACK
-        self.start = r.start
-        self.stop = r.stop
+        ## HACK (clients that did not run anything have no start or stop)
+        if r.start != None:
+            self.start = r.start
+            self.stop = r.stop
             
     def __str__(self):
         return self.show()
@@ -125,6 +259,202 @@ class Results:
         ret += "\n" + ("-"*total_width)
         total_rate = "     %.02f txn/s" % ((total_cnt / duration))
         ret += f % ("TOTAL", str(total_cnt), str(total_time / total_cnt * 1000000), total_rate)
+        if self.txn_late:
+            ret += "\n  %d transactions finished after the measurement window and were not recorded" % sum(self.txn_late.values())
+        ret += "\n\n" + self.showPercentiles(col_width)
+        if self.txn_aborts or self.txn_retries:
+            ret += "\n\n" + self.showAborts(col_width)
 
         return (ret.encode('utf-8'))
-## CLASS
\ No newline at end of file
+        
+    def showPercentiles(self, col_width = 16):
+        """Return a table with the latency percentiles of each transaction type"""
+        num_cols = len(PERCENTILES) + 2
+        total_width = (col_width*num_cols)+2
+        f = "\n  " + (("%-" + str(col_width) + "s")*num_cols)
+        line = "-"*total_width
+        
+        ret = u"Latency Percentiles (µs)\n%s" % line
+        ret += f % tuple([ "" ] + [ "p%s" % p for p in PERCENTILES ] + [ "Max" ])
+        
+        total_h = Histogram()
+        for txn in sorted(self.txn_histograms.keys()):
+            h = self.txn_histograms[txn]
+            ret += f % tuple([ txn ] + [ str(h.percentile(p)) for p in PERCENTILES ] + [ str(h.max_value) ])
+            total_h.merge(h)
+        ## FOR
+        ret += "\n" + line
+        ret += f % tuple([ "TOTAL" ] + [ str(total_h.percentile(p)) for p in PERCENTILES ] + [ str(total_h.max_value) ])
+        return (ret)
+        
+    def showAborts(self, col_width = 16):
+        """Return a table with the commits, aborts and retries of each transaction
+           type, followed by the reasons that transactions were aborted for"""
+        num_cols = 6
+        total_width = (col_width*num_cols)+2
+        f = "\n  " + (("%-" + str(col_width) + "s")*num_cols)
+        line = "-"*total_width
+        
+        ret = u"Aborts and Retries\n%s" % line
+        ret += f % ("", "Committed", "Aborted", "Abort Rate", "Retries", "Wait (ms)")
+        totals = [ 0, 0, 0, 0.0 ]
+        reasons = [ ]
+        for txn in sorted(set(self.txn_counters.keys()) | set(self.txn_aborts.keys()) | set(self.txn_retries.keys())):
+            committed = self.txn_counters.get(txn, 0)
+            aborted = sum(self.txn_aborts.get(txn, { }).values())
+            retries, wait = self.txn_retries.get(txn, [ 0, 0.0 ])
+            ret += f % (txn, str(committed), str(aborted), abortRate(committed, aborted), str(retries), "%.01f" % (wait * 1000))
+            for i, value in enumerate([ committed, aborted, retries, wait ]): totals[i] += value
+            
+            for reason in sorted(self.txn_aborts.get(txn, { }).keys()):
+                reasons.append("%s %s: %d" % (txn, reason, self.txn_aborts[txn][reason]))
+        ## FOR
+        ret += "\n" + line
+        ret += f % ("TOTAL", str(totals[0]), str(totals[1]), abortRate(totals[0], totals[1]), str(totals[2]), "%.01f" % (totals[3] * 1000))
+        if reasons:
+            ret += "\n\nAbort Reasons\n" + "\n".join([ "  " + r for r in reasons ])
+        return (ret)
+        
+    def toDict(self, load_time = None, metadata = None):
+        """Return the results as plain dicts and lists that can be written out as JSON.
+           Throughputs are per second of the measured run and latencies are in µs."""
+        assert self.start != None
+        duration = (self.stop if self.stop != None else time.time()) - self.start
+        
+        txns = { }
+        total_h = Histogram()
+        for txn in sorted(set(self.txn_counters.keys()) | set(self.txn_aborts.keys()) | set(self.txn_retries.keys()) | set(self.txn_late.keys())):
+            h = self.txn_histograms.get(txn, Histogram())
+            txns[txn] = self.summarize(self.txn_counters.get(txn, 0), self.txn_aborts.get(txn, { }),
+                                       self.txn_retries.get(txn, [ 0, 0.0 ]), self.txn_late.get(txn, 0), h, duration)
+            total_h.merge(h)
+        ## FOR
+        
+        aborts = { }
+        retries = [ 0, 0.0 ]
+        for txn in txns.keys():
+            for reason, cnt in self.txn_aborts.get(txn, { }).items():
+                aborts[reason] = aborts.get(reason, 0) + cnt
+            for i, value in enumerate(self.txn_retries.get(txn, [ 0, 0.0 ])): retries[i] += value
+        ## FOR
+        txns[TOTAL] = self.summarize(sum(self.txn_counters.values()), aborts, retries, sum(self.txn_late.values()), total_h, duration)
+        
+        intervals = [ ]
+        for idx in sorted(self.intervals.keys()):
+            for row in self.intervalRows(idx):
+                intervals.append(dict(zip(INTERVAL_COLUMNS, row)))
+        ## FOR
+        
+        return {
+            "metadata": metadata if metadata != None else { },
+            "duration": duration,
+            "load_time": load_time,
+            "tpmC": self.txn_counters.get("NEW_ORDER", 0) * 60.0 / duration if duration > 0 else 0.0,
+            "txns": txns,
+            "intervals": intervals,
+        }
+        
+    def summarize(self, committed, aborts, retries, late, h, duration):
+        """Return the exported values of a single transaction type"""
+        return {
+            "committed": committed,
+            "aborted": sum(aborts.values()),
+            "aborts": dict(aborts),
+            "retries": retries[0],
+            "wait": retries[1],
+            "late": late,
+            "rate": committed / duration if duration > 0 else 0.0,
+            "mean": h.mean(),
+            "percentiles": dict([ ("p%s" % p, h.percentile(p)) for p in PERCENTILES ]),
+            "max": h.max_value if h.max_value != None else 0,
+        }
+## CLASS
+
+## ==============================================
+## writeJson
+## ==============================================
+def writeJson(path, data):
+    """Write the output of Results.toDict to the given path ('-' for stdout)"""
+    with openOutput(path) as fd:
+        json.dump(data, fd, indent=2, sort_keys=True)
+        fd.write("\n")
+## DEF
+
+## ==============================================
+## writeCsv
+## ==============================================
+def writeCsv(path, data):
+    """Write the output of Results.toDict to the given path ('-' for stdout) with
+       one value per row (see CSV_HEADER)"""
+    with openOutput(path) as fd:
+        writer = csv.writer(fd)
+        writer.writerow(CSV_HEADER)
+        for key in sorted(data["metadata"].keys()):
+            writer.writerow([ "metadata", "", "", key, data["metadata"][key] ])
+        for key in [ "duration", "load_time", "tpmC" ]:
+            if data[key] != None: writer.writerow([ "run", "", "", key, data[key] ])
+        for txn in sorted(data["txns"].keys()):
+            for metric, value in sorted(flatten(data["txns"][txn]).items()):
+                writer.writerow([ "txn", txn, "", metric, value ])
+        ## FOR
+        for row in data["intervals"]:
+            for metric in INTERVAL_COLUMNS[2:]:
+                writer.writerow([ "interval", row["txn"], row["elapsed"], metric, row[metric] ])
+        ## FOR
+## DEF
+
+## ==============================================
+## readResults
+## ==============================================
+def readResults(path):
+    """Read a file written by writeJson or writeCsv back in. The time series is
+       left out when reading a CSV file."""
+    with open(path, "r") as fd:
+        if not path.endswith(".csv"): return json.load(fd)
+        
+        data = { "metadata": { }, "duration": None, "load_time": None, "tpmC": None, "txns": { }, "intervals": [ ] }
+        for row in csv.DictReader(fd):
+            if row["section"] == "metadata":
+                data["metadata"][row["metric"]] = row["value"]
+            elif row["section"] == "run":
+                data[row["metric"]] = float(row["value"])
+            elif row["section"] == "txn":
+                txn = data["txns"].setdefault(row["txn"], { })
+                ## Only the first dot nests (percentile names like 'p99.9' have dots of their own)
+                keys = row["metric"].split(".", 1)
+                if len(keys) > 1: txn = txn.setdefault(keys[0], { })
+                txn[keys[-1]] = float(row["value"])
+        ## FOR
+        return (data)
+## DEF
+
+## ==============================================
+## flatten
+## ==============================================
+def flatten(values, prefix = ""):
+    """Turn nested dicts into a single dict with dotted keys"""
+    ret = { }
+    for key, value in values.items():
+        if isinstance(value, dict):
+            ret.update(flatten(value, prefix + key + "."))
+        else:
+            ret[prefix + key] = value
+    ## FOR
+    return (ret)
+## DEF
+
+## ==============================================
+## openOutput
+## ==============================================
+def openOutput(path):
+    if path == "-": return contextlib.nullcontext(sys.stdout)
+    return open(path, "w", newline="")
+## DEF
+
+## ==============================================
+## abortRate
+## ==============================================
+def abortRate(committed, aborted):
+    if committed + aborted == 0: return "-"
+    return "%.02f%%" % (100.0 * aborted / (committed + aborted))
+## DEF
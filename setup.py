@@ -21,6 +21,15 @@ setup(name='py-tpcc',
       install_requires=[
           # -*- Extra requirements: -*-
       ],
+      # Optional dependencies of the loaders and drivers that need them.
+      # The Cloudburst and Hydrocache drivers also need the cloudburst and
+      # anna (KVS) clients from the Hydro project, which are not on PyPI.
+      extras_require={
+          'numpy': ['numpy'],
+          'postgres': ['psycopg2'],
+          'redis': ['redis'],
+          'membase': ['python-memcached'],
+      },
       entry_points="""
       # -*- Entry points: -*-
       """,